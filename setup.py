@@ -25,7 +25,7 @@ setup(
     name="cos-ruleengine",
     version=version,
     description="",
-    packages=find_packages(where="src"),
+    packages=find_packages(where="src", exclude=["benchmarks", "benchmarks.*"]),
     package_dir={"": "src"},
     install_requires=requires(),
     extras_require={"dev": requires("requirements-dev.txt")},
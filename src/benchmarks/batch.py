@@ -0,0 +1,114 @@
+# Copyright 2024 coScene
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Compares `Engine.consume_next` per item with `Engine.consume_batch` on chunks
+of a synthetic bag. Run from src with `python -m benchmarks.batch`.
+"""
+
+import argparse
+import random
+import time
+from collections import namedtuple
+
+from ruleengine.dsl.base_actions import noop
+from ruleengine.dsl.validation.config_validator import validate_config
+from ruleengine.engine import DiagnosisItem, Engine
+
+RosMockMessage = namedtuple("RosMockMessage", "msg level")
+Odometry = namedtuple("Odometry", "speed x y")
+
+TOPICS = [f"/sensor_{i}" for i in range(20)]
+
+
+def make_config(rule_count):
+    return {
+        "version": "v1",
+        "rules": [
+            {
+                "when": [
+                    f'topic == "{TOPICS[i % len(TOPICS)]}" and msg.speed > {9.0 + i % 3}'
+                ],
+                "actions": ["upload()"],
+            }
+            for i in range(rule_count)
+        ]
+        + [
+            {"when": ['"error" in log'], "actions": ["upload()"]},
+            {"when": ["log_level == LogLevel.FATAL"], "actions": ["upload()"]},
+            {
+                "when": ['sustained(topic == "/sensor_0", msg.speed > 5, 1)'],
+                "actions": ["upload()"],
+            },
+        ],
+    }
+
+
+def make_items(rng, count):
+    items = []
+    for i in range(count):
+        if rng.random() < 0.2:
+            text = rng.choice(["all good", "error: motor", "warn: battery"])
+            msg = RosMockMessage(text, rng.choice([1, 2, 4, 16]))
+            items.append(DiagnosisItem("/rosout", msg, i * 0.01, "rosgraph_msgs/Log"))
+        else:
+            msg = Odometry(rng.uniform(0, 10), 0, 0)
+            items.append(
+                DiagnosisItem(rng.choice(TOPICS), msg, i * 0.01, "nav_msgs/Odometry")
+            )
+    return items
+
+
+def run(config, items, chunk_size, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        hits = []
+        _, rules = validate_config(config, noop, compiled=True)
+        engine = Engine(rules, trigger_cb=lambda *args: hits.append(args[-1].ts))
+
+        start = time.perf_counter()
+        if chunk_size is None:
+            for item in items:
+                engine.consume_next(item)
+        else:
+            for i in range(0, len(items), chunk_size):
+                end = i + chunk_size
+                engine.consume_batch(items[i:end])
+        best = min(best, time.perf_counter() - start)
+    return len(items) / best, hits
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--items", type=int, default=20000)
+    parser.add_argument("--rules", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=11)
+    args = parser.parse_args()
+
+    config = make_config(args.rules)
+    items = make_items(random.Random(args.seed), args.items)
+
+    baseline, expected = run(config, items, None, args.repeat)
+    print(f"{'mode':>18} {'items/s':>9} {'speedup':>8}")
+    print(f"{'consume_next':>18} {baseline:>9.0f} {1:>7.2f}x")
+    for chunk_size in (1000, 10000):
+        throughput, hits = run(config, items, chunk_size, args.repeat)
+        assert hits == expected, "consume_batch diverged from consume_next"
+        name = f"consume_batch({chunk_size})"
+        print(f"{name:>18} {throughput:>9.0f} {throughput / baseline:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+# Copyright 2024 coScene
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Measures the per evaluation overhead of the v2 Condition around its CEL
+program: the log level set around each call and the truth test, before and
+within Engine.fast_evaluation.
+
+Run from src with `python -m benchmarks.evaluation`.
+"""
+
+import argparse
+import logging
+import time
+from collections import ChainMap
+
+import celpy
+
+from rule_engine.adapter import lazy_json_to_cel
+from rule_engine.condition import Condition
+from rule_engine.engine import Engine
+from rule_engine.utils import ENV, log_level_decorator
+
+CONDITIONS = [
+    "true",
+    "msg.temperature > 90.0",
+    "msg.temperature > scope.limit && msg.level >= 8",
+    "msg.missing > 1",
+]
+
+
+@log_level_decorator(logging.WARN)
+def legacy_evaluate(condition, activation):
+    """Condition.evaluate as it was, with a string formatted per evaluation"""
+    try:
+        return condition.program.evaluate(activation).__repr__() == "BoolType(True)"
+    except Exception:
+        return False
+
+
+def per_call_us(func, activation, count, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(count):
+            func(activation)
+        best = min(best, time.perf_counter() - start)
+    return best / count * 1e6
+
+
+def bench(raw, activation, count, repeat, interpreted):
+    condition, err = Condition.compile_and_validate(raw)
+    assert err is None, err
+    if interpreted:
+        condition.program = ENV.program(ENV.compile(raw))
+
+    def program(activation):
+        try:
+            condition.program.evaluate(activation)
+        except Exception:
+            pass
+
+    results = {
+        "program": per_call_us(program, activation, count, repeat),
+        "legacy": per_call_us(
+            lambda a: legacy_evaluate(condition, a), activation, count, repeat
+        ),
+        "evaluate": per_call_us(condition.evaluate, activation, count, repeat),
+    }
+    with Engine([]).fast_evaluation():
+        results["fast"] = per_call_us(
+            condition.evaluate_quietly, activation, count, repeat
+        )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--count", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--interpreted",
+        action="store_true",
+        help="Evaluate with the celpy interpreter instead of compiled closures",
+    )
+    args = parser.parse_args()
+    if args.interpreted:
+        args.count = max(1, args.count // 100)
+
+    activation = ChainMap(
+        {"scope": celpy.adapter.json_to_cel({"limit": 90.0})},
+        {
+            "msg": lazy_json_to_cel({"temperature": 93.5, "level": 8}),
+            "topic": celpy.celtypes.StringType("/rosout"),
+            "ts": celpy.celtypes.DoubleType(1.0),
+        },
+    )
+    print(
+        f"{'condition':<48} {'program':>9} {'legacy':>9} {'evaluate':>9}"
+        f" {'fast':>9} {'overhead before/after':>22}"
+    )
+    for raw in CONDITIONS:
+        r = bench(raw, activation, args.count, args.repeat, args.interpreted)
+        before = r["legacy"] - r["program"]
+        after = r["fast"] - r["program"]
+        print(
+            f"{raw:<48} {r['program']:>7.2f}us {r['legacy']:>7.2f}us"
+            f" {r['evaluate']:>7.2f}us {r['fast']:>7.2f}us"
+            f" {before:>9.2f}us {after:>9.2f}us"
+        )
+
+
+if __name__ == "__main__":
+    main()
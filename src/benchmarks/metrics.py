@@ -0,0 +1,71 @@
+# Copyright 2024 coScene
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Measures the overhead of `Engine(instrument=True)` on the synthetic bag of
+the batch benchmark. Run from src with `python -m benchmarks.metrics`.
+"""
+
+import argparse
+import random
+import time
+
+from ruleengine.dsl.base_actions import noop
+from ruleengine.dsl.validation.config_validator import validate_config
+from ruleengine.engine import Engine
+
+from .batch import make_config, make_items
+
+
+def run(config, items, instrument, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        _, rules = validate_config(config, noop, compiled=True)
+        engine = Engine(rules, instrument=instrument)
+
+        start = time.perf_counter()
+        for item in items:
+            engine.consume_next(item)
+        best = min(best, time.perf_counter() - start)
+    return len(items) / best, engine
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--items", type=int, default=20000)
+    parser.add_argument("--rules", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=11)
+    args = parser.parse_args()
+
+    config = make_config(args.rules)
+    items = make_items(random.Random(args.seed), args.items)
+
+    baseline, _ = run(config, items, False, args.repeat)
+    throughput, engine = run(config, items, True, args.repeat)
+    print(f"{'mode':>14} {'items/s':>9} {'relative':>9}")
+    print(f"{'disabled':>14} {baseline:>9.0f} {1:>8.2f}x")
+    print(f"{'instrumented':>14} {throughput:>9.0f} {throughput / baseline:>8.2f}x")
+
+    slowest = sorted(engine.metrics.snapshot()["rules"], key=lambda r: -r["seconds"])
+    print("slowest rules:")
+    for stats in slowest[:3]:
+        print(
+            f"  rule {stats['rule']}: {stats['evaluations']} evaluations, "
+            f"{stats['seconds'] * 1e3:.2f} ms, max {stats['max_seconds'] * 1e6:.1f} us"
+        )
+
+
+if __name__ == "__main__":
+    main()
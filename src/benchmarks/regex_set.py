@@ -0,0 +1,142 @@
+# Copyright 2024 coScene
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Compares one `re.search` per pattern with a RegexSet, on synthetic log lines.
+
+Run from src with `python -m benchmarks.regex_set`.
+"""
+
+import argparse
+import random
+import re
+import string
+import time
+from collections import namedtuple
+
+from ruleengine.dsl.action import Action
+from ruleengine.dsl.regex_set import RegexSet
+from ruleengine.dsl.validation.validator import validate_condition
+from ruleengine.engine import DiagnosisItem, Engine, Rule
+
+RosMockMessage = namedtuple("RosMockMessage", "msg level")
+
+
+class CountAction(Action):
+    def __init__(self):
+        self.count = 0
+
+    def run(self, item, scope):
+        self.count += 1
+
+
+def make_patterns(rng, words, count):
+    """Patterns in the style of log rules, most with a literal part"""
+    patterns = []
+    for i in range(count):
+        a, b = rng.sample(words, 2)
+        kind = i % 4
+        if kind == 0:
+            patterns.append(rf"{a} (\d+)")
+        elif kind == 1:
+            patterns.append(rf"[{a[0].upper()}{a[0]}]{a[1:]} \w+ {b}")
+        elif kind == 2:
+            patterns.append(rf"{a}\s*=\s*(-?\d+(?:\.\d+)?)")
+        else:
+            patterns.append(rf"{a}.*{b}")
+    return list(dict.fromkeys(patterns))
+
+
+def make_texts(rng, words, count):
+    return [
+        " ".join(rng.choice(words) for _ in range(15)) + " 42" for _ in range(count)
+    ]
+
+
+def per_item_us(func, texts, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(texts)
+        best = min(best, time.perf_counter() - start)
+    return best / len(texts) * 1e6
+
+
+def bench_matching(patterns, texts, repeat):
+    compiled = [re.compile(p) for p in patterns]
+    regex_set = RegexSet(patterns)
+
+    def one_by_one(texts):
+        for text in texts:
+            for c in compiled:
+                c.search(text)
+
+    def combined(texts):
+        for text in texts:
+            regex_set.search(text)
+
+    return per_item_us(one_by_one, texts, repeat), per_item_us(combined, texts, repeat)
+
+
+def bench_engine(patterns, texts, repeat):
+    items = [
+        DiagnosisItem("/rosout", RosMockMessage(text, 2), i, "rosgraph_msgs/Log")
+        for i, text in enumerate(texts)
+    ]
+    conditions = [validate_condition(f"regex(msg.msg, {p!r})").entity for p in patterns]
+
+    def run(optimize):
+        rules = [Rule([cond], [CountAction()], {}) for cond in conditions]
+        engine = Engine(rules, optimize=optimize)
+
+        def consume(items):
+            for item in items:
+                engine.consume_next(item)
+
+        return consume
+
+    return (
+        per_item_us(run(optimize=False), items, repeat),
+        per_item_us(run(optimize=True), items, repeat),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 200, 1000])
+    parser.add_argument("--texts", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    words = [
+        "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 9)))
+        for _ in range(3000)
+    ]
+    texts = make_texts(rng, words, args.texts)
+
+    print(f"{'patterns':>8} {'':>10} {'re.search':>12} {'RegexSet':>12} {'speedup':>8}")
+    for size in args.sizes:
+        patterns = make_patterns(rng, words, size)
+        for name, bench in (("matching", bench_matching), ("engine", bench_engine)):
+            baseline, optimized = bench(patterns, texts, args.repeat)
+            print(
+                f"{size:>8} {name:>10} {baseline:>10.1f}us {optimized:>10.1f}us"
+                f" {baseline / optimized:>7.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
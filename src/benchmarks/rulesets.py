@@ -0,0 +1,192 @@
+# Copyright 2024 coScene
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Builders of v1 and v2 rule sets matching the streams of `workloads`.
+
+Rules cycle through the usual kinds: literals and regular expressions over
+logs, log levels, and thresholds on telemetry. The v1 builder can also mix in
+stateful rules (sustained, sequential, repeated, debounce).
+"""
+
+from benchmarks.workloads import BATTERY, NODES, ODOMETRY_TOPICS, ROSOUT
+
+
+def _v1_stateless(i):
+    """(when, templated when, each arg for the j-th fan-out) of the i-th rule"""
+    code = 100 + i % 100
+    topic = ODOMETRY_TOPICS[i % len(ODOMETRY_TOPICS)]
+    kinds = [
+        (
+            f'"error code {code}" in log',
+            'get_value("needle") in log',
+            lambda j: {"needle": f"error code {100 + (i + j) % 100}"},
+        ),
+        (
+            f'log_level == LogLevel.ERROR and "motor {i % 8}" in log',
+            'log_level == LogLevel.ERROR and get_value("needle") in log',
+            lambda j: {"needle": f"motor {(i + j) % 8}"},
+        ),
+        (
+            rf'regex(log, r"motor {i % 8} overheated at (\d+)C").group(1) > 100',
+            r'regex(log, r"overheated at (\d+)C").group(1) > get_value("limit")',
+            lambda j: {"limit": 60 + (i + j) % 60},
+        ),
+        (
+            f'topic == "{topic}" and msg.speed > {3 + i % 5}',
+            'topic == get_value("topic") and msg.speed > get_value("limit")',
+            lambda j: {
+                "topic": ODOMETRY_TOPICS[(i + j) % len(ODOMETRY_TOPICS)],
+                "limit": 3 + (i + j) % 5,
+            },
+        ),
+        (
+            f'topic == "{BATTERY}" and msg.percentage < {90 - i % 50}',
+            f'topic == "{BATTERY}" and msg.percentage < get_value("limit")',
+            lambda j: {"limit": 90 - (i + j) % 50},
+        ),
+    ]
+    return kinds[i % len(kinds)]
+
+
+def _v1_stateful(i):
+    code = 100 + i % 100
+    topic = ODOMETRY_TOPICS[i % len(ODOMETRY_TOPICS)]
+    kinds = [
+        f'sustained(topic == "{topic}", msg.speed > {1 + i % 3}, 0.5)',
+        f'sequential(log_level == LogLevel.WARN, "error code {code}" in log, duration=5)',
+        f'repeated("error code {code}" in log, 3, 10)',
+        f'debounce(topic == "{topic}" and msg.speed > {2 + i % 3}, 1)',
+    ]
+    return kinds[i % len(kinds)]
+
+
+def v1_config(rules=100, each=1, stateful=0.0):
+    """
+    A v1 config of the given number of rules. With each > 1, the stateless
+    rules are templated and expand to `each` rules. A `stateful` fraction of
+    the rules are stateful, spread evenly.
+    """
+    stateful_every = round(1 / stateful) if stateful else None
+    result = []
+    for i in range(rules):
+        actions = ["upload()"] if i % 2 else [f'create_moment("rule {i}")']
+        if stateful_every and i % stateful_every == 0:
+            result.append(
+                {"when": [_v1_stateful(i // stateful_every)], "actions": actions}
+            )
+            continue
+
+        when, templated_when, arg = _v1_stateless(i)
+        if each > 1:
+            result.append(
+                {
+                    "when": [templated_when],
+                    "actions": actions,
+                    "each": [arg(j) for j in range(each)],
+                }
+            )
+        else:
+            result.append({"when": [when], "actions": actions})
+    return {"version": "v1", "rules": result}
+
+
+def _v2_rule(i, scopes):
+    code = 100 + i % 100
+    kinds = [
+        (
+            f'topic == "{ROSOUT}" && msg.msg.contains(scope.needle)',
+            lambda j: {"needle": f"error code {code + j}"},
+        ),
+        (
+            f'topic == "{ROSOUT}" && msg.level >= 8 && msg.msg.contains(scope.needle)',
+            lambda j: {"needle": f"motor {(i + j) % 8}"},
+        ),
+        (
+            f'topic == "{ROSOUT}" && msg.msg.matches(scope.pattern)',
+            lambda j: {"pattern": f"motor {(i + j) % 8} overheated at 1[0-9][0-9]C"},
+        ),
+        (
+            "topic == scope.topic && msg.speed > double(scope.limit)",
+            lambda j: {
+                "topic": ODOMETRY_TOPICS[(i + j) % len(ODOMETRY_TOPICS)],
+                "limit": 3 + (i + j) % 5,
+            },
+        ),
+        (
+            f'topic == "{BATTERY}" && msg.percentage < double(scope.limit)',
+            lambda j: {"limit": 90 - (i + j) % 50},
+        ),
+    ]
+    condition, scope = kinds[i % len(kinds)]
+    # Rules with a literal topic subscribe to it, like real configs do
+    topics = []
+    for topic in (ROSOUT, BATTERY):
+        if f'topic == "{topic}"' in condition:
+            topics = [topic]
+    return {
+        "conditions": [condition],
+        "actions": [
+            {"name": "upload", "kwargs": {"title": f"rule {i}: " + "{topic} at {ts}"}}
+        ],
+        "scopes": [scope(j) for j in range(scopes)],
+        "topics": topics,
+    }
+
+
+def v2_config(rules=100, scopes=1):
+    """A v2 config of the given number of rules, each with `scopes` scopes"""
+    return {"version": "v2", "rules": [_v2_rule(i, scopes) for i in range(rules)]}
+
+
+def v2_fleet_config(rules=10, scopes=200):
+    """
+    A v2 config of rules expanded over a scope per node of the rosout logs,
+    like fleet configs with a scope per robot. Most nodes never log.
+    """
+    nodes = [f"/{NODES[j]}" if j < len(NODES) else f"/node_{j}" for j in range(scopes)]
+    result = []
+    for i in range(rules):
+        condition = [
+            "msg.name == scope.node && msg.level >= scope.level",
+            "msg['name'] == scope['node'] && msg.msg.contains(scope.needle)",
+        ][i % 2]
+        result.append(
+            {
+                "conditions": [condition],
+                "actions": [
+                    {
+                        "name": "upload",
+                        "kwargs": {"title": f"rule {i}: " + "{scope.node}"},
+                    }
+                ],
+                "scopes": [
+                    {
+                        "node": node,
+                        "level": 4 << (i + j) % 3,
+                        "needle": f"motor {(i + j) % 8}",
+                    }
+                    for j, node in enumerate(nodes)
+                ],
+                "topics": [ROSOUT],
+            }
+        )
+    return {"version": "v2", "rules": result}
+
+
+__all__ = [
+    "v1_config",
+    "v2_config",
+    "v2_fleet_config",
+]
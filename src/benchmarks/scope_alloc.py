@@ -0,0 +1,114 @@
+# Copyright 2024 coScene
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Measures the memory allocated for scopes on log heavy inputs, with the
+conditions evaluated on a plain dict scope (copied on every update) and on a
+Scope (extended in place).
+
+Each evaluation result is kept alive while measuring, so that tracemalloc sees
+every scope allocated during the run. Run from src with
+`python -m benchmarks.scope_alloc`.
+"""
+
+import argparse
+import random
+import time
+import tracemalloc
+from collections import namedtuple
+
+from ruleengine.dsl.optimizer import optimize_conditions
+from ruleengine.dsl.scope import Scope
+from ruleengine.dsl.validation.validator import validate_condition
+from ruleengine.engine import DiagnosisItem
+
+RosMockMessage = namedtuple("RosMockMessage", "msg level")
+
+EXPRESSIONS = [
+    '"error" in log',
+    '"timeout" in log and set_value("kind", "timeout")',
+    'regex(log, r"battery at (\\d+)%") and get_value("cos/regex").group(1)',
+    'log_level == LogLevel.WARN and "motor" in log',
+    'sustained(always, "error" in log, 1)',
+    'repeated("overheat" in log, 2, 10)',
+]
+
+WORDS = ["motor", "error", "timeout", "battery", "overheat", "joint", "ok", "at"]
+
+
+def make_items(rng, count):
+    items = []
+    for i in range(count):
+        text = " ".join(rng.choice(WORDS) for _ in range(8))
+        if rng.random() < 0.3:
+            text += f" battery at {rng.randint(0, 100)}%"
+        level = rng.choice([1, 2, 4, 16])
+        items.append(
+            DiagnosisItem(
+                "/rosout", RosMockMessage(text, level), i, "rosgraph_msgs/Log"
+            )
+        )
+    return items
+
+
+def make_conditions(count):
+    conditions = [
+        [validate_condition(expr).entity] for _ in range(count) for expr in EXPRESSIONS
+    ]
+    return optimize_conditions(conditions)
+
+
+def run(items, conditions, initial_scope, keep):
+    for item in items:
+        for rule_conditions in conditions:
+            for cond in rule_conditions:
+                keep.append(cond.evaluate_condition_at(item, initial_scope))
+
+
+def measure(items, rule_copies, initial_scope):
+    # Fresh conditions each time, since some of them are stateful
+    conditions = make_conditions(rule_copies)
+    keep = []
+    tracemalloc.start()
+    run(items, conditions, initial_scope, keep)
+    allocated, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    evaluations = len(keep)
+    del keep
+
+    conditions = make_conditions(rule_copies)
+    start = time.perf_counter()
+    run(items, conditions, initial_scope, [])
+    elapsed = time.perf_counter() - start
+    return allocated / evaluations, len(items) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--items", type=int, default=2000)
+    parser.add_argument("--rule-copies", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=5)
+    args = parser.parse_args()
+
+    items = make_items(random.Random(args.seed), args.items)
+    print(f"{'initial keys':>12} {'scope':>6} {'bytes/eval':>11} {'items/s':>9}")
+    for keys in (0, 4, 16):
+        initial = {f"each_arg_{i}": i for i in range(keys)}
+        for name, scope in (("dict", initial), ("Scope", Scope(initial))):
+            per_eval, throughput = measure(items, args.rule_copies, scope)
+            print(f"{keys:>12} {name:>6} {per_eval:>11.0f} {throughput:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
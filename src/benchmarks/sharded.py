@@ -0,0 +1,101 @@
+# Copyright 2024 coScene
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Measures how ShardedEngine scales with the number of workers, on a config with
+many templated rules. Run from src with `python -m benchmarks.sharded`.
+"""
+
+import argparse
+import multiprocessing
+import random
+import time
+
+from benchmarks.batch import TOPICS, make_items
+from ruleengine.dsl.base_actions import noop
+from ruleengine.dsl.validation.config_validator import validate_config
+from ruleengine.engine import Engine
+from ruleengine.sharded_engine import ShardedEngine
+
+
+def make_config(templated_rules):
+    return {
+        "version": "v1",
+        "rules": [
+            {
+                "when": [
+                    'topic == get_value("topic") and msg.speed > get_value("limit")'
+                ],
+                "actions": ["upload()"],
+                "each": [
+                    {"topic": TOPICS[i % len(TOPICS)], "limit": 9.0 + (i % 100) / 100}
+                    for i in range(templated_rules)
+                ],
+            },
+            {"when": ['"error" in log'], "actions": ["upload()"]},
+            {
+                "when": ['sustained(topic == "/sensor_0", msg.speed > 5, 1)'],
+                "actions": ["upload()"],
+            },
+        ],
+    }
+
+
+def consume(engine, items, batch_size):
+    for i in range(0, len(items), batch_size):
+        end = i + batch_size
+        engine.consume_batch(items[i:end])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--items", type=int, default=5000)
+    parser.add_argument("--rules", type=int, default=1200)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--seed", type=int, default=11)
+    args = parser.parse_args()
+
+    config = make_config(args.rules)
+    items = make_items(random.Random(args.seed), args.items)
+
+    hits = []
+    _, rules = validate_config(config, noop, compiled=True)
+    engine = Engine(rules, trigger_cb=lambda *a: hits.append(a[-1].ts))
+    start = time.perf_counter()
+    consume(engine, items, args.batch_size)
+    baseline = len(items) / (time.perf_counter() - start)
+
+    print(f"{multiprocessing.cpu_count()} CPUs")
+    print(f"{'engine':>16} {'items/s':>9} {'speedup':>8}")
+    print(f"{'Engine':>16} {baseline:>9.0f} {1:>7.2f}x")
+    for workers in args.workers:
+        sharded_hits = []
+        with ShardedEngine(
+            config,
+            noop,
+            workers,
+            trigger_cb=lambda *a: sharded_hits.append(a[-1].ts),
+            compiled=True,
+        ) as sharded:
+            start = time.perf_counter()
+            consume(sharded, items, args.batch_size)
+            throughput = len(items) / (time.perf_counter() - start)
+        assert sharded_hits == hits, "ShardedEngine diverged from Engine"
+        name = f"Sharded({workers})"
+        print(f"{name:>16} {throughput:>9.0f} {throughput / baseline:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
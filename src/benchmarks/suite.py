@@ -0,0 +1,226 @@
+# Copyright 2024 coScene
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Runs the v1 and v2 engines over synthetic workloads, and reports the results
+as JSON: throughput, per item latency percentiles and peak RSS. Each scenario
+runs in a fresh process, so that the peak RSS is its own.
+
+Run from src with `python -m benchmarks.suite`, see `--help` for options.
+Keep the JSON of each release around to spot regressions.
+"""
+
+import argparse
+import json
+import multiprocessing
+import platform
+import random
+import sys
+import time
+from collections import namedtuple
+
+from benchmarks.rulesets import v1_config, v2_config, v2_fleet_config
+from benchmarks.workloads import (
+    bursts,
+    foxglove_logs,
+    mixed,
+    rosout_logs,
+    telemetry,
+    to_dict,
+)
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+Scenario = namedtuple("Scenario", "name engine workload items config")
+
+SCENARIOS = [
+    Scenario("v1_rosout_literals", "v1", rosout_logs, 5000, lambda: v1_config(200)),
+    Scenario("v1_foxglove_logs", "v1", foxglove_logs, 5000, lambda: v1_config(200)),
+    Scenario(
+        "v1_telemetry_each", "v1", telemetry, 2000, lambda: v1_config(20, each=20)
+    ),
+    Scenario(
+        "v1_stateful_mix", "v1", mixed, 5000, lambda: v1_config(200, stateful=0.5)
+    ),
+    Scenario("v1_bursts", "v1", bursts, 5000, lambda: v1_config(200, stateful=0.25)),
+    # The v2 engine evaluates CEL with an interpreter, hence the fewer items
+    Scenario("v2_rosout", "v2", rosout_logs, 300, lambda: v2_config(20)),
+    Scenario(
+        "v2_telemetry_scopes", "v2", telemetry, 100, lambda: v2_config(10, scopes=10)
+    ),
+    Scenario("v2_mixed", "v2", mixed, 200, lambda: v2_config(50)),
+    # 500 rules expanded from 10 with 50 scopes each
+    Scenario("v2_scopes_500", "v2", rosout_logs, 20, lambda: v2_config(10, scopes=50)),
+    # 2000 rules joined on the node of the logs
+    Scenario("v2_fleet_join", "v2", rosout_logs, 300, lambda: v2_fleet_config()),
+]
+SCENARIOS_BY_NAME = {scenario.name: scenario for scenario in SCENARIOS}
+
+
+def run_scenario(scenario, scale=1.0, seed=0, compiled=False):
+    """Run a scenario in this process and return its result dict"""
+    count = max(1, round(scenario.items * scale))
+    items = list(scenario.workload(random.Random(seed), count))
+    config = scenario.config()
+    hits = [0]
+
+    def count_hit(*args, **kwargs):
+        hits[0] += 1
+
+    if scenario.engine == "v1":
+        from ruleengine.dsl.base_actions import noop
+        from ruleengine.dsl.validation.config_validator import validate_config
+        from ruleengine.engine import Engine
+
+        result, rules = validate_config(config, noop, compiled=compiled)
+        assert result["success"], result
+        engine = Engine(rules, trigger_cb=count_hit)
+        inputs = items
+        consume = engine.consume_next
+    else:
+        from rule_engine.engine import Engine
+        from rule_engine.rule import validate_rules_spec
+
+        rules, result = validate_rules_spec(config, {"upload": count_hit})
+        assert result.success, result
+        engine = Engine(rules)
+        inputs = [(to_dict(item.msg), item.topic, item.ts) for item in items]
+
+        def consume(args):
+            engine.example_consume_next(*args)
+
+    latencies, seconds = _measure(consume, inputs)
+    return {
+        "name": scenario.name,
+        "engine": scenario.engine,
+        "items": len(inputs),
+        "rules": len(rules),
+        "hits": hits[0],
+        "seconds": seconds,
+        "items_per_second": len(inputs) / seconds,
+        "latency_p50_us": _percentile(latencies, 50) * 1e6,
+        "latency_p99_us": _percentile(latencies, 99) * 1e6,
+        "peak_rss_bytes": peak_rss(),
+    }
+
+
+def _measure(consume, inputs):
+    clock = time.perf_counter
+    latencies = []
+    append = latencies.append
+    start = clock()
+    for x in inputs:
+        t = clock()
+        consume(x)
+        append(clock() - t)
+    return latencies, clock() - start
+
+
+def _percentile(values, percent):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, len(ordered) * percent // 100)]
+
+
+def peak_rss():
+    """Peak resident set size of this process in bytes, None if unknown"""
+    if resource is None:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+def _child_main(conn, name, scale, seed, compiled):
+    try:
+        conn.send(("ok", run_scenario(SCENARIOS_BY_NAME[name], scale, seed, compiled)))
+    except Exception as e:
+        conn.send(("error", repr(e)))
+    finally:
+        conn.close()
+
+
+def run_isolated(scenario, scale=1.0, seed=0, compiled=False):
+    """Run a scenario in a fresh process and return its result dict"""
+    context = multiprocessing.get_context("spawn")
+    parent_conn, child_conn = context.Pipe(duplex=False)
+    process = context.Process(
+        target=_child_main, args=(child_conn, scenario.name, scale, seed, compiled)
+    )
+    process.start()
+    child_conn.close()
+    try:
+        status, value = parent_conn.recv()
+    except EOFError:
+        status, value = "error", "the benchmark process exited"
+    process.join()
+    if status == "error":
+        raise RuntimeError(f"scenario {scenario.name} failed: {value}")
+    return value
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--scenario",
+        action="append",
+        choices=list(SCENARIOS_BY_NAME),
+        help="Scenario to run, can be repeated. Defaults to all of them.",
+    )
+    parser.add_argument(
+        "--scale", type=float, default=1.0, help="Multiplier of the item counts"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--compiled", action="store_true", help="Compile the v1 conditions"
+    )
+    parser.add_argument(
+        "--in-process",
+        action="store_true",
+        help="Run the scenarios in this process, peak RSS is then cumulative",
+    )
+    parser.add_argument("--output", help="File to write the JSON to, else stdout")
+    args = parser.parse_args()
+
+    run = run_scenario if args.in_process else run_isolated
+    results = []
+    for name in args.scenario or list(SCENARIOS_BY_NAME):
+        result = run(SCENARIOS_BY_NAME[name], args.scale, args.seed, args.compiled)
+        print(
+            f"{name:>22} {result['items_per_second']:>10.0f} items/s "
+            f"p50 {result['latency_p50_us']:>8.1f}us "
+            f"p99 {result['latency_p99_us']:>8.1f}us",
+            file=sys.stderr,
+        )
+        results.append(result)
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.time(),
+        "options": {"scale": args.scale, "seed": args.seed, "compiled": args.compiled},
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+# Copyright 2024 coScene
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Generators of synthetic DiagnosisItem streams.
+
+Messages are namedtuples with the fields of the ROS and foxglove messages the
+rules look at, so they work with the v1 engine as they are, and `to_dict`
+turns them into the plain dicts the v2 engine takes. All generators are
+deterministic for a given random.Random.
+"""
+
+import heapq
+from collections import namedtuple
+
+from ruleengine.engine import DiagnosisItem
+
+# rosgraph_msgs/Log, without the header
+RosLog = namedtuple("RosLog", "level name msg file function line topics")
+# foxglove_msgs/Log, without the timestamp
+FoxgloveLog = namedtuple("FoxgloveLog", "level message name file line")
+# The parts of nav_msgs/Odometry and sensor_msgs/BatteryState rules look at
+Odometry = namedtuple("Odometry", "speed x y yaw")
+BatteryState = namedtuple("BatteryState", "voltage current percentage")
+
+ROSOUT = "/rosout"
+FOXGLOVE_LOG = "/foxglove/log"
+ODOMETRY_TOPICS = [f"/robot_{i}/odom" for i in range(8)]
+BATTERY = "/battery"
+
+# ROS levels are DEBUG=1, INFO=2, WARN=4, ERROR=8, FATAL=16, foxglove levels
+# are 1 to 5 in the same order
+ROS_LEVELS = [1, 2, 4, 8, 16]
+FOXGLOVE_LEVELS = [1, 2, 3, 4, 5]
+LEVEL_WEIGHTS = [30, 50, 12, 7, 1]
+
+NODES = ["planner", "controller", "localization", "perception", "driver"]
+LOG_TEMPLATES = [
+    "heartbeat ok",
+    "planning took {ms} ms",
+    "battery level {percent}%",
+    "motor {motor} temperature {temp}C",
+    "error code {code}: {reason}",
+    "motor {motor} overheated at {temp}C",
+    "lost localization, covariance {cov}",
+    "no path found to goal {goal}",
+    "camera {motor} dropped {ms} frames",
+]
+REASONS = ["timeout", "checksum mismatch", "device busy", "out of range"]
+
+
+def log_text(rng):
+    """A log line, with the numbers most rules look for"""
+    template = rng.choice(LOG_TEMPLATES)
+    return template.format(
+        ms=rng.randint(1, 500),
+        percent=rng.randint(0, 100),
+        motor=rng.randint(0, 7),
+        temp=rng.randint(20, 120),
+        code=rng.randint(100, 199),
+        reason=rng.choice(REASONS),
+        cov=round(rng.uniform(0, 5), 3),
+        goal=rng.randint(0, 50),
+    )
+
+
+def rosout_logs(rng, count, start=0.0, rate=100.0):
+    """Logs on /rosout, at rate messages per second"""
+    for i in range(count):
+        node = rng.choice(NODES)
+        msg = RosLog(
+            level=rng.choices(ROS_LEVELS, LEVEL_WEIGHTS)[0],
+            name=f"/{node}",
+            msg=log_text(rng),
+            file=f"{node}.cpp",
+            function="spin",
+            line=rng.randint(1, 900),
+            topics=[],
+        )
+        yield DiagnosisItem(ROSOUT, msg, start + i / rate, "rosgraph_msgs/Log")
+
+
+def foxglove_logs(rng, count, start=0.0, rate=100.0):
+    """Logs on a foxglove log topic, at rate messages per second"""
+    for i in range(count):
+        node = rng.choice(NODES)
+        msg = FoxgloveLog(
+            level=rng.choices(FOXGLOVE_LEVELS, LEVEL_WEIGHTS)[0],
+            message=log_text(rng),
+            name=node,
+            file=f"{node}.py",
+            line=rng.randint(1, 900),
+        )
+        yield DiagnosisItem(FOXGLOVE_LOG, msg, start + i / rate, "foxglove_msgs/Log")
+
+
+def telemetry(rng, count, start=0.0, rate=500.0, topics=ODOMETRY_TOPICS):
+    """
+    Odometry on several topics, round-robin, plus a battery state every tenth
+    message. Values follow random walks, with occasional spikes.
+    """
+    speeds = {topic: rng.uniform(0, 2) for topic in topics}
+    percentage = 100.0
+    for i in range(count):
+        ts = start + i / rate
+        if i % 10 == 9:
+            percentage = max(0.0, percentage - rng.uniform(0, 0.05))
+            msg = BatteryState(
+                rng.gauss(24, 0.3), rng.gauss(-5, 1), round(percentage, 2)
+            )
+            yield DiagnosisItem(BATTERY, msg, ts, "sensor_msgs/BatteryState")
+            continue
+
+        topic = topics[i % len(topics)]
+        speed = speeds[topic] = min(max(speeds[topic] + rng.gauss(0, 0.1), 0), 3)
+        if rng.random() < 0.01:
+            speed = rng.uniform(3, 10)
+        msg = Odometry(round(speed, 3), rng.uniform(-50, 50), rng.uniform(-50, 50), 0)
+        yield DiagnosisItem(topic, msg, ts, "nav_msgs/Odometry")
+
+
+def bursts(rng, count, start=0.0, rate=200.0, burst_size=200, burst_every=2000):
+    """
+    Telemetry, interrupted every burst_every items by burst_size error logs
+    coming in all at once, e.g. a driver failing in a loop.
+    """
+    background = telemetry(rng, count, start, rate)
+    ts = start
+    for i in range(count):
+        if i % burst_every < burst_size:
+            code = 100 + (i // burst_every) % 100
+            msg = RosLog(8, "/driver", f"error code {code}: device busy", "", "", 0, [])
+            yield DiagnosisItem(ROSOUT, msg, ts, "rosgraph_msgs/Log")
+            ts += 1e-4
+        else:
+            item = next(background)
+            ts = max(ts, item.ts)
+            yield DiagnosisItem(item.topic, item.msg, ts, item.msgtype)
+
+
+def mixed(rng, count, start=0.0):
+    """Telemetry, rosout and foxglove logs, merged in timestamp order"""
+    streams = [
+        telemetry(rng, count * 7 // 10, start),
+        rosout_logs(rng, count * 2 // 10, start, rate=140.0),
+        foxglove_logs(rng, count - count * 7 // 10 - count * 2 // 10, start, 70.0),
+    ]
+    return heapq.merge(*streams, key=lambda item: item.ts)
+
+
+def to_dict(msg):
+    """The message as the plain data the v2 engine takes"""
+    return msg._asdict()
+
+
+__all__ = [
+    "BatteryState",
+    "FoxgloveLog",
+    "Odometry",
+    "RosLog",
+    "bursts",
+    "foxglove_logs",
+    "mixed",
+    "rosout_logs",
+    "telemetry",
+    "to_dict",
+]
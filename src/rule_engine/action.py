@@ -13,12 +13,12 @@
 # limitations under the License.
 import logging
 import re
-from functools import partial
 from typing import Callable
 
 import celpy
 
-from rule_engine.utils import ENV, log_level_decorator
+from rule_engine.compiler import cel_program
+from rule_engine.utils import log_level_decorator
 
 
 class Action:
@@ -55,6 +55,13 @@ class Action:
         """
         Run the action with the activation dictionary
         """
+        self.run_quietly(activation)
+
+    def run_quietly(self, activation: celpy.Context):
+        """
+        Run the action with the activation dictionary, leaving the log level
+        alone
+        """
         self._impl(**{k: v(activation) for k, v in self._kwargs.items()})
 
     def __repr__(self):
@@ -69,16 +76,16 @@ def compile_value(value: any) -> Callable[[celpy.Context], any]:
     if isinstance(value, str):
         return compile_embedded_expr(value)
     elif isinstance(value, dict):
-        compiled_value = {}
+        compiled_items = []
         for k, v in value.items():
             if isinstance(v, dict):
                 raise ValueError("Nested dict is not supported")
-            compiled_value[k] = compile_value(v)
+            compiled_items.append((k, compile_value(v)))
 
-        def evaluate_dict(activation: celpy.Context, _value: dict):
-            return {_k: _v(activation) for _k, _v in _value.items()}
+        def evaluate_dict(activation: celpy.Context) -> dict:
+            return {k: v(activation) for k, v in compiled_items}
 
-        return partial(evaluate_dict, _value=compiled_value)
+        return evaluate_dict
 
     else:
 
@@ -88,6 +95,10 @@ def compile_value(value: any) -> Callable[[celpy.Context], any]:
         return wrap(value)
 
 
+# The capturing group makes split return the expressions between the literals
+_EMBEDDED_EXPR_PATTERN = re.compile(r"\{\s*(.*?)\s*}")
+
+
 def compile_embedded_expr(expr: str) -> Callable[[celpy.Context], str]:
     """
     Compile a string with optional embedded CEL expression, for example:
@@ -98,26 +109,29 @@ def compile_embedded_expr(expr: str) -> Callable[[celpy.Context], str]:
     The evaluation process is done by evaluating all the CEL expression enclosed in {{ and }} and
     replacing the expression with the evaluated value. (Trim pre- and post- spaces in between {{ and }})
 
+    The string is split once here into its literal segments and the programs
+    in between, so that the evaluation only has to join the pieces.
+
     Returns a function that takes an activation dictionary and returns the evaluated string
     """
-    pattern = re.compile(r"\{\s*(.*?)\s*}")
-    matches = pattern.findall(expr)
-    compiled_programs = [ENV.program(ENV.compile(match)) for match in matches]
-
-    def evaluate(
-        activation: celpy.Context, expression: str, programs: list[celpy.Runner]
-    ) -> str:
-        # Replace the matches in the expression with the evaluated value
-        idx = -1
-
-        def replace(_match):
-            nonlocal idx
-            idx += 1
+    segments = _EMBEDDED_EXPR_PATTERN.split(expr)
+    if len(segments) == 1:
+        return lambda _: expr
+
+    first = segments[0]
+    # Pairs of the program of an expression and the literal following it
+    slots = [
+        (cel_program(segments[i]), segments[i + 1]) for i in range(1, len(segments), 2)
+    ]
+
+    def evaluate(activation: celpy.Context) -> str:
+        pieces = [first]
+        for program, literal in slots:
             try:
-                return str(programs[idx].evaluate(activation))
+                pieces.append(str(program.evaluate(activation)))
             except Exception:
-                return "{ ERROR }"
-
-        return re.sub(pattern, replace, expression)
+                pieces.append("{ ERROR }")
+            pieces.append(literal)
+        return "".join(pieces)
 
-    return partial(evaluate, expression=expr, programs=compiled_programs)
+    return evaluate
@@ -0,0 +1,90 @@
+# Copyright 2024 coScene
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from collections.abc import ItemsView, KeysView, ValuesView
+from typing import Any
+
+import celpy
+from celpy.celtypes import MapType
+
+
+class LazyMapType(MapType):
+    """
+    A CEL map over a JSON-like dict, which converts values to CEL on first
+    access and caches them, instead of converting the whole document upfront
+    like json_to_cel. Nested dicts become LazyMapTypes too.
+
+    Missing keys raise KeyError as with MapType, so has(), `in` and size()
+    behave the same, and so does equality with other maps.
+    """
+
+    def __init__(self, document: dict):
+        # The dict storage of MapType holds the converted values
+        super().__init__()
+        self._document = document
+
+    def __getitem__(self, key):
+        if not MapType.valid_key_type(key):
+            raise TypeError(f"unsupported key type: {type(key)}")
+        try:
+            return dict.__getitem__(self, key)
+        except KeyError:
+            value = lazy_json_to_cel(self._document[key])
+            dict.__setitem__(self, key, value)
+            return value
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        return key in self._document
+
+    def __len__(self):
+        return len(self._document)
+
+    def __iter__(self):
+        return (celpy.adapter.json_to_cel(key) for key in self._document)
+
+    def keys(self):
+        return KeysView(self)
+
+    def values(self):
+        return ValuesView(self)
+
+    def items(self):
+        return ItemsView(self)
+
+    def __str__(self):
+        # What string() of the map json_to_cel would have built returns
+        return str(celpy.adapter.json_to_cel(self._document))
+
+    def __repr__(self):
+        # celpy formats its log messages eagerly, converting here would defeat
+        # the purpose
+        return f"{self.__class__.__name__}({self._document!r})"
+
+
+def lazy_json_to_cel(document: Any) -> celpy.celtypes.Value:
+    """
+    Convert a JSON-like Python value to CEL like json_to_cel, with dicts
+    wrapped in LazyMapType. Lists are converted when reached, their dict
+    elements lazily.
+    """
+    if isinstance(document, dict):
+        return LazyMapType(document)
+    if isinstance(document, (list, tuple)):
+        return celpy.celtypes.ListType([lazy_json_to_cel(item) for item in document])
+    return celpy.adapter.json_to_cel(document)
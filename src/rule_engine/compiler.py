@@ -0,0 +1,621 @@
+# Copyright 2024 coScene
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Compiles CEL ASTs into Python closures.
+
+The celpy interpreter walks the lark tree on every evaluation, and builds an
+activation and log messages (which format the whole context) along the way.
+Here each node is turned once into a closure taking the context, which calls
+the same celpy functions with the same error handling as the interpreter:
+errors are CELEvalError values, absorbed by && and || like in celpy.
+
+Only the subset used by rules is compiled: the declared variables, field and
+index access, operators, has(), dyn() and the celpy functions and methods.
+Macros (all, exists, map...), protobuf messages and unknown names fall back to
+the interpreter.
+
+Variables known at compile time, such as the scope of a rule, can be bound as
+constants. Subtrees whose operands are all constants are evaluated once at
+compile time, and && and || with a constant operand are simplified as CEL
+defines them: `x && true` is x, `x && false` is false.
+"""
+import operator
+import weakref
+from collections import ChainMap
+from functools import cached_property, lru_cache
+from typing import Callable, Optional
+
+import celpy
+from celpy.celtypes import BoolType, ListType, MapType, MessageType, StringType
+from celpy.evaluation import CELEvalError, Evaluator, NameContainer, base_functions
+from lark import Tree
+
+from rule_engine.utils import ENV
+
+_RELATIONS = {
+    "relation_lt": "_<_",
+    "relation_le": "_<=_",
+    "relation_ge": "_>=_",
+    "relation_gt": "_>_",
+    "relation_eq": "_==_",
+    "relation_ne": "_!=_",
+    "relation_in": "_in_",
+}
+_ARITHMETIC = {
+    "addition_add": "_+_",
+    "addition_sub": "_-_",
+    "multiplication_mul": "_*_",
+    "multiplication_div": "_/_",
+    "multiplication_mod": "_%_",
+    "unary_not": "!_",
+    "unary_neg": "-_",
+}
+# The nodes that only wrap their child when they have a single one
+_WRAPPERS = {
+    "expr",
+    "conditionalor",
+    "conditionaland",
+    "relation",
+    "addition",
+    "multiplication",
+    "unary",
+    "member",
+    "primary",
+    "paren_expr",
+}
+_MACROS = {"map", "filter", "all", "exists", "exists_one", "reduce", "min"}
+
+# The exceptions of an operation that become errors, as in the interpreter
+_OVERLOAD = ((TypeError, "no such overload"),)
+_OVERFLOW = (
+    (ValueError, "return error for overflow"),
+    (OverflowError, "return error for overflow"),
+)
+_ERRORS = {
+    "relation": _OVERLOAD,
+    "addition": _OVERLOAD + _OVERFLOW,
+    "multiplication": _OVERLOAD
+    + ((ZeroDivisionError, "modulus or divide by zero"),)
+    + _OVERFLOW,
+    "unary": _OVERLOAD + _OVERFLOW[:1],
+    "call": _OVERFLOW[:1] + _OVERLOAD + ((AttributeError, "no such overload"),),
+    "index": _OVERLOAD + ((KeyError, "no such key"), (IndexError, "invalid_argument")),
+}
+
+
+class Unsupported(Exception):
+    """The expression uses a construct the compiler leaves to the interpreter"""
+
+
+class ClosureRunner(celpy.Runner):
+    """
+    Evaluates a CEL AST compiled into Python closures, with the results of
+    the InterpretedRunner. The variables in constants are folded into the
+    closures, the activation is not read for them.
+    """
+
+    def __init__(self, environment, ast, functions=None, constants=None):
+        super().__init__(environment, ast, functions)
+        self.__evaluate = _Compiler(environment, functions, constants).compile(ast)
+        # The specializations of the program, by the values they fold in.
+        # Scopes often share them, e.g. a limit, while differing elsewhere.
+        self.__specialized = weakref.WeakValueDictionary()
+
+    @cached_property
+    def variables(self) -> dict[str, Optional[frozenset[str]]]:
+        """
+        The names of the variables the expression reads, with the fields read
+        of each when it is only read as `name.field`, None otherwise
+        """
+        variables = {}
+        _find_variables(self.ast, variables)
+        return {
+            name: None if fields is None else frozenset(fields)
+            for name, fields in variables.items()
+        }
+
+    @property
+    def is_constant(self) -> bool:
+        """Whether the value is known without an activation, e.g. `1 < 2`"""
+        return isinstance(self.__evaluate, _Constant)
+
+    def specialize(self, constants: dict) -> "ClosureRunner":
+        """
+        The program with the variables in constants folded in, itself if it
+        reads none of them
+        """
+        key = []
+        for name, fields in self.variables.items():
+            if name not in constants:
+                continue
+            value = constants[name]
+            if fields is None or not isinstance(value, MapType):
+                key.append((name, repr(value)))
+            else:
+                key.extend(
+                    (name, field, repr(value[field]) if field in value else None)
+                    for field in fields
+                )
+        if not key:
+            return self
+        key = tuple(key)
+        program = self.__specialized.get(key)
+        if program is None:
+            program = ClosureRunner(
+                self.environment, self.ast, self.functions, constants
+            )
+            self.__specialized[key] = program
+        return program
+
+    def evaluate(self, activation: celpy.Context) -> celpy.celtypes.Value:
+        value = self.__evaluate(activation)
+        if isinstance(value, CELEvalError):
+            raise value
+        return value
+
+
+def compile_program(
+    environment: celpy.Environment, ast, functions=None
+) -> celpy.Runner:
+    """A ClosureRunner for the AST, or the environment's runner if it cannot be compiled"""
+    try:
+        return ClosureRunner(environment, ast, functions)
+    except Unsupported:
+        return environment.program(ast, functions)
+
+
+@lru_cache(maxsize=4096)
+def cel_program(expression: str) -> celpy.Runner:
+    """
+    The program of an expression in ENV. Programs hold no state, so rules with
+    the same expression, often hundreds in generated rulesets, share one.
+    Hits and misses are in cel_program.cache_info().
+    """
+    return compile_program(ENV, ENV.compile(expression))
+
+
+class _Constant:
+    """The closure of a subtree whose value is known at compile time"""
+
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __call__(self, activation):
+        return self.value
+
+
+@lru_cache(maxsize=4096)
+def field_equalities(
+    expression: str, left: str, right: str
+) -> tuple[tuple[tuple[str, ...], tuple[str, ...]], ...]:
+    """
+    The pairs of field paths of the variables left and right that must be
+    equal for the expression to be true: those compared with == at the top
+    level of the expression or of its &&. For example, with left "msg" and
+    right "scope", `msg.robot_id == scope['robot'].id && msg.level > 2`
+    gives ((("robot_id",), ("robot", "id")),).
+    """
+    equalities = []
+    for tree in _conjuncts(cel_program(expression).ast):
+        if (
+            tree.data != "relation"
+            or len(tree.children) != 2
+            or tree.children[0].data != "relation_eq"
+        ):
+            continue
+        paths = {}
+        for side in (tree.children[0].children[0], tree.children[1]):
+            path = _field_path(side)
+            if path is not None and len(path) > 1:
+                paths[path[0]] = path[1:]
+        if left in paths and right in paths and left != right:
+            equalities.append((paths[left], paths[right]))
+    return tuple(equalities)
+
+
+def _unwrap(tree):
+    while tree.data in _WRAPPERS and len(tree.children) == 1:
+        tree = tree.children[0]
+    return tree
+
+
+def _conjuncts(tree) -> list:
+    tree = _unwrap(tree)
+    if tree.data == "conditionaland":
+        return [c for child in tree.children for c in _conjuncts(child)]
+    return [tree]
+
+
+def _field_path(tree) -> Optional[tuple[str, ...]]:
+    """The variable and fields of `name.a['b']`, None for other trees"""
+    tree = _unwrap(tree)
+    if tree.data == "ident":
+        return (tree.children[0].value,)
+    if tree.data == "member_dot":
+        member, field = tree.children
+        path = _field_path(member)
+        return None if path is None else path + (field.value,)
+    if tree.data == "member_index":
+        member, index = tree.children
+        path = _field_path(member)
+        index = _unwrap(index)
+        if path is None or index.data != "literal":
+            return None
+        field = _literal_value(index)
+        return path + (str(field),) if isinstance(field, StringType) else None
+    return None
+
+
+def _ident_name(tree) -> Optional[str]:
+    """The name of the variable if tree is just one"""
+    tree = _unwrap(tree)
+    return tree.children[0].value if tree.data == "ident" else None
+
+
+def _find_variables(tree, variables):
+    """Add the variables read in tree to variables, see ClosureRunner.variables"""
+    if tree.data == "member_dot":
+        name = _ident_name(tree.children[0])
+        if name is not None:
+            fields = variables.setdefault(name, set())
+            if fields is not None:
+                fields.add(tree.children[1].value)
+            return
+    if tree.data == "ident":
+        variables[tree.children[0].value] = None
+        return
+    for child in tree.children:
+        if isinstance(child, Tree):
+            _find_variables(child, variables)
+
+
+@lru_cache(maxsize=4096)
+def _literal_value(tree):
+    """
+    The value of a literal, which the interpreter parses on every evaluation.
+    Cached since specializing a program compiles its literals again.
+    """
+    return Evaluator(tree, ENV.activation()).visit(tree)
+
+
+def _error(ex, errors, tree=None, token=None):
+    for cls, message in errors:
+        if isinstance(ex, cls):
+            break
+    value = CELEvalError(message, ex.__class__, ex.args, tree=tree, token=token)
+    value.__cause__ = ex
+    return value
+
+
+def _apply(func, args, errors, tree=None, token=None):
+    """Call func on the values of the closures args, turning errors into values"""
+    exceptions = tuple(cls for cls, _ in errors)
+    if len(args) == 1:
+        (arg,) = args
+
+        def evaluate(activation):
+            try:
+                return func(arg(activation))
+            except exceptions as ex:
+                return _error(ex, errors, tree, token)
+
+    elif len(args) == 2:
+        left, right = args
+
+        def evaluate(activation):
+            x = left(activation)
+            y = right(activation)
+            try:
+                return func(x, y)
+            except exceptions as ex:
+                return _error(ex, errors, tree, token)
+
+    else:
+
+        def evaluate(activation):
+            values = [arg(activation) for arg in args]
+            try:
+                return func(*values)
+            except exceptions as ex:
+                return _error(ex, errors, tree, token)
+
+    return evaluate
+
+
+def _exprlist(args):
+    """The exprlist of the interpreter: the first error, or the list of values"""
+
+    def evaluate(activation):
+        values = [arg(activation) for arg in args]
+        for value in values:
+            if isinstance(value, CELEvalError):
+                return value
+        return ListType(values)
+
+    return evaluate
+
+
+class _Compiler:
+    def __init__(self, environment, functions=None, constants=None):
+        self.environment = environment
+        if functions:
+            self.functions = ChainMap(functions, base_functions)
+        else:
+            self.functions = base_functions
+        self.constants = constants or {}
+
+    def compile(self, tree) -> Callable:
+        method = getattr(self, f"_{tree.data}", None)
+        if method is None:
+            raise Unsupported(tree.data)
+        return method(tree)
+
+    @staticmethod
+    def __fold(closure, operands):
+        """The value of closure as a constant if its operands are constants"""
+        if not all(isinstance(operand, _Constant) for operand in operands):
+            return closure
+        try:
+            # The operands ignore the activation
+            return _Constant(closure(None))
+        except Exception:
+            # Left to fail at evaluation, like the interpreter
+            return closure
+
+    def __single(self, tree):
+        if len(tree.children) != 1:
+            raise Unsupported(tree.data)
+        return self.compile(tree.children[0])
+
+    def __function(self, name):
+        if name not in self.functions:
+            raise Unsupported(name)
+        return self.functions[name]
+
+    def __operator(self, tree, names, errors):
+        """Binary (or unary) operator nodes, whose first child holds the operator"""
+        if len(tree.children) == 1:
+            return self.compile(tree.children[0])
+        op_tree, right_tree = tree.children
+        func = self.__function(names[op_tree.data])
+        right = self.compile(right_tree)
+        if not op_tree.children:
+            operands = [right]
+        else:
+            operands = [self.compile(op_tree.children[0]), right]
+        return self.__fold(_apply(func, operands, errors, tree), operands)
+
+    def _expr(self, tree):
+        if len(tree.children) == 1:
+            return self.compile(tree.children[0])
+        cond, left, right = (self.compile(child) for child in tree.children)
+        if isinstance(cond, _Constant) and isinstance(cond.value, BoolType):
+            return left if cond.value else right
+
+        def evaluate(activation):
+            value = cond(activation)
+            if not isinstance(value, BoolType):
+                return _error(
+                    TypeError(f"Unexpected {type(value)} ? _ : _"), _OVERLOAD, tree
+                )
+            # Errors of the other branch are ignored anyway
+            return left(activation) if value else right(activation)
+
+        return self.__fold(evaluate, [cond])
+
+    def _conditionalor(self, tree):
+        return self.__logical(tree, celpy.celtypes.logical_or, True)
+
+    def _conditionaland(self, tree):
+        return self.__logical(tree, celpy.celtypes.logical_and, False)
+
+    def __logical(self, tree, func, absorbing):
+        if len(tree.children) == 1:
+            return self.compile(tree.children[0])
+        left, right = (self.compile(child) for child in tree.children)
+        # A constant boolean operand either decides the result, or leaves it
+        # to the other operand. The latter folds only if that operand is known
+        # to be a boolean, otherwise func still checks it at runtime
+        for this, other in ((left, right), (right, left)):
+            if isinstance(this, _Constant) and isinstance(this.value, BoolType):
+                if bool(this.value) == absorbing:
+                    return this
+                if isinstance(other, _Constant) and isinstance(other.value, BoolType):
+                    return other
+
+        def evaluate(activation):
+            x = left(activation)
+            # Whatever the other operand, even an error, the result is x
+            if isinstance(x, BoolType) and bool(x) == absorbing:
+                return x
+            try:
+                return func(x, right(activation))
+            except TypeError as ex:
+                return _error(ex, _OVERLOAD, tree)
+
+        return self.__fold(evaluate, [left, right])
+
+    def _relation(self, tree):
+        return self.__operator(tree, _RELATIONS, _ERRORS["relation"])
+
+    def _addition(self, tree):
+        return self.__operator(tree, _ARITHMETIC, _ERRORS["addition"])
+
+    def _multiplication(self, tree):
+        return self.__operator(tree, _ARITHMETIC, _ERRORS["multiplication"])
+
+    def _unary(self, tree):
+        return self.__operator(tree, _ARITHMETIC, _ERRORS["unary"])
+
+    def _member(self, tree):
+        return self.__single(tree)
+
+    def _member_dot(self, tree):
+        member_tree, name_token = tree.children
+        member = self.compile(member_tree)
+        name = name_token.value
+
+        def evaluate(activation):
+            value = member(activation)
+            if isinstance(value, MessageType):
+                return value.get(name)
+            if isinstance(value, MapType):
+                try:
+                    return value[name]
+                except KeyError:
+                    return CELEvalError(
+                        f"no such member in mapping: {name!r}",
+                        KeyError,
+                        None,
+                        tree=tree,
+                    )
+            if isinstance(value, CELEvalError):
+                return value
+            if isinstance(value, NameContainer):
+                if name in value:
+                    return value[name].value
+                return CELEvalError(
+                    f"No {name!r} in bindings {sorted(value.keys())}",
+                    KeyError,
+                    None,
+                    tree=tree,
+                )
+            return CELEvalError(
+                f"{value!r} with type: '{type(value)}' does not support field selection",
+                TypeError,
+                None,
+                tree=tree,
+            )
+
+        return self.__fold(evaluate, [member])
+
+    def _member_dot_arg(self, tree):
+        member_tree, name_token = tree.children[:2]
+        if name_token.value in _MACROS:
+            raise Unsupported(name_token.value)
+        func = self.__function(name_token.value)
+        member = self.compile(member_tree)
+        arg_closures = (
+            [self.compile(child) for child in tree.children[2].children]
+            if len(tree.children) > 2
+            else []
+        )
+        args = _exprlist(arg_closures) if arg_closures else None
+        errors = _ERRORS["call"]
+        exceptions = tuple(cls for cls, _ in errors)
+
+        def evaluate(activation):
+            value = member(activation)
+            values = args(activation) if args is not None else ()
+            if isinstance(value, CELEvalError):
+                return value
+            if isinstance(values, CELEvalError):
+                return values
+            try:
+                return func(value, *values)
+            except exceptions as ex:
+                return _error(ex, errors, token=name_token)
+
+        return self.__fold(evaluate, [member] + arg_closures)
+
+    def _member_index(self, tree):
+        operands = [self.compile(child) for child in tree.children]
+        return self.__fold(
+            _apply(operator.getitem, operands, _ERRORS["index"], tree), operands
+        )
+
+    def _primary(self, tree):
+        return self.__single(tree)
+
+    def _paren_expr(self, tree):
+        return self.__single(tree)
+
+    def _literal(self, tree):
+        return _Constant(_literal_value(tree))
+
+    def _list_lit(self, tree):
+        if not tree.children:
+            return lambda activation: ListType()
+        items = [self.compile(child) for child in tree.children[0].children]
+        return self.__fold(_exprlist(items), items)
+
+    def _map_lit(self, tree):
+        if not tree.children:
+            return lambda activation: MapType()
+        items = [self.compile(child) for child in tree.children[0].children]
+
+        def evaluate(activation):
+            values = [item(activation) for item in items]
+            result = MapType()
+            try:
+                for i in range(0, len(values), 2):
+                    key = values[i]
+                    if key in result:
+                        raise ValueError(f"Duplicate key {key!r}")
+                    result[key] = values[i + 1]
+            except (ValueError, TypeError) as ex:
+                return CELEvalError(ex.args[0], ex.__class__, ex.args, tree=tree)
+            return result
+
+        return evaluate
+
+    def _ident_arg(self, tree):
+        name_token = tree.children[0]
+        args = (
+            [self.compile(child) for child in tree.children[1].children]
+            if len(tree.children) > 1
+            else []
+        )
+        if name_token.value in ("has", "dyn") and len(args) != 1:
+            raise Unsupported(name_token.value)
+        if name_token.value == "has":
+            (arg,) = args
+
+            def evaluate(activation):
+                return BoolType(not isinstance(arg(activation), CELEvalError))
+
+            return self.__fold(evaluate, args)
+        if name_token.value == "dyn":
+            return args[0]
+        func = self.__function(name_token.value)
+        return self.__fold(_apply(func, args, _ERRORS["call"], token=name_token), args)
+
+    def _ident(self, tree):
+        name = tree.children[0].value
+        if name in self.constants:
+            return _Constant(self.constants[name])
+        annotations = self.environment.annotations
+        if name not in annotations:
+            raise Unsupported(name)
+        # Declared but not bound, the interpreter returns the declared type
+        default: Optional[type] = annotations[name]
+
+        def evaluate(activation):
+            try:
+                return activation[name]
+            except KeyError:
+                return default
+
+        return evaluate
+
+
+__all__ = [
+    "ClosureRunner",
+    "Unsupported",
+    "cel_program",
+    "compile_program",
+    "field_equalities",
+]
@@ -12,10 +12,13 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 import logging
+from typing import Optional
 
 import celpy
+from celpy.celtypes import BoolType
 
-from rule_engine.utils import ENV, log_level_decorator
+from rule_engine.compiler import ClosureRunner, cel_program
+from rule_engine.utils import log_level_decorator
 
 
 class Condition:
@@ -30,7 +33,7 @@ class Condition:
         Validate the condition
         """
         try:
-            program = ENV.program(ENV.compile(raw_condition))
+            program = cel_program(raw_condition)
             return Condition(raw_condition, program), None
         except Exception as e:
             return None, e
@@ -38,15 +41,48 @@ class Condition:
     def __init__(self, raw: str, program: celpy.Runner):
         self.raw = raw
         self.program = program
+        # The number of evaluations that failed, e.g. on a missing field
+        self.error_count = 0
 
     @log_level_decorator(logging.WARN)
     def evaluate(self, activation: celpy.Context):
         """
         Evaluate the condition as boolean
         """
+        return self.evaluate_quietly(activation)
+
+    def evaluate_quietly(self, activation: celpy.Context) -> bool:
+        """
+        Evaluate the condition as boolean, leaving the log level alone. For
+        callers that set it once around many evaluations, see
+        Engine.fast_evaluation
+        """
+        try:
+            result = self.program.evaluate(activation)
+        except Exception:
+            self.error_count += 1
+            return False
+        return _is_true(result)
+
+    def specialize(self, constants: dict) -> "Condition":
+        """
+        The condition with the variables in constants, e.g. the scope of a
+        rule, folded into its program. Itself if there is nothing to fold.
+        """
+        program = self.program
+        if isinstance(program, ClosureRunner):
+            program = program.specialize(constants)
+        if program is self.program:
+            return self
+        return Condition(self.raw, program)
+
+    @property
+    def constant(self) -> Optional[bool]:
+        """The result of every evaluation if it is known upfront, else None"""
+        if not getattr(self.program, "is_constant", False):
+            return None
         try:
-            # Restrict the return to be true when the condition evaluates exactly to boolean true
-            return self.program.evaluate(activation).__repr__() == "BoolType(True)"
+            return _is_true(self.program.evaluate({}))
         except Exception:
             return False
 
@@ -55,3 +91,8 @@ class Condition:
 
     def __str__(self):
         return f"Condition({self.raw})"
+
+
+def _is_true(result) -> bool:
+    # Restrict the return to be true when the condition evaluates exactly to boolean true
+    return isinstance(result, BoolType) and bool(result)
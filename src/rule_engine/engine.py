@@ -11,20 +11,130 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import logging
+from collections import ChainMap
+from contextlib import contextmanager
+from itertools import chain
+from typing import Any, Optional
 
 import celpy
 
+from rule_engine.adapter import lazy_json_to_cel
+from rule_engine.compiler import field_equalities
 from rule_engine.rule import Rule
+from rule_engine.utils import log_level
 
 
 class Engine:
     """
     The rule engine represents a collection of rules
+
+    Rules are indexed by their topics, and a message is only evaluated against
+    the rules subscribed to its topic. Rules without topics match every topic.
+    Rules that cannot be satisfied, e.g. `scope.enabled` with a scope where it
+    is false, are left out.
+
+    Rules with a condition like `msg.robot_id == scope.robot_id` are joined on
+    the message field: they are indexed by the value of their scope, and a
+    message is only evaluated against those with its value of the field. A
+    rule expanded over hundreds of scopes then costs one lookup per message.
     """
 
     def __init__(self, rules: list[Rule]):
         self.rules = rules
         self.cur_activation = None
+        self.cur_topic = None
+        self.cur_rule_indices = []
+        self._last_activation = (None, None)
+        self._catch_all = []
+        self._by_topic = {}
+        # The message field path and value of the joined rules
+        self._joins = {}
+        for rule_idx, rule in enumerate(rules):
+            if not rule.satisfiable:
+                continue
+            if not rule.topics:
+                self._catch_all.append(rule_idx)
+            for topic in dict.fromkeys(rule.topics or []):
+                self._by_topic.setdefault(topic, []).append(rule_idx)
+            join = _join(rule)
+            if join is not None:
+                self._joins[rule_idx] = join
+        self._indices_by_topic = {}
+        self._plans_by_topic = {}
+        self._quiet = False
+
+    @property
+    def required_topics(self) -> Optional[set[str]]:
+        """
+        The union of the topics of the rules, i.e. the topics to subscribe to
+        or read. None if some rule has no topics, since it needs every topic.
+        Rules whose condition can never hold for their scope are left out.
+        """
+        if self._catch_all:
+            return None
+        return set(self._by_topic)
+
+    def rule_indices_for_topic(self, topic: str) -> list[int]:
+        """
+        The indices of the rules subscribed to a topic, in order. Rules whose
+        condition can never hold for their scope are left out.
+        """
+        indices = self._indices_by_topic.get(topic)
+        if indices is None:
+            indices = sorted(self._catch_all + self._by_topic.get(topic, []))
+            self._indices_by_topic[topic] = indices
+        return indices
+
+    def _plan_for_topic(self, topic: str) -> tuple[list[int], dict]:
+        """
+        The rules subscribed to a topic that are not joined, and those that
+        are, by message field path and then value
+        """
+        plan = self._plans_by_topic.get(topic)
+        if plan is None:
+            plain, joined = [], {}
+            for rule_idx in self.rule_indices_for_topic(topic):
+                join = self._joins.get(rule_idx)
+                if join is None:
+                    plain.append(rule_idx)
+                else:
+                    path, value = join
+                    joined.setdefault(path, {}).setdefault(value, []).append(rule_idx)
+            plan = plain, joined
+            self._plans_by_topic[topic] = plan
+        return plan
+
+    @contextmanager
+    def fast_evaluation(self, level=logging.WARN):
+        """
+        Evaluate conditions and run actions within the block with the log
+        level set once for all of them, instead of around each one. Use it
+        around the loop over the messages, e.g.
+
+            with engine.fast_evaluation():
+                for msg, topic, ts in messages:
+                    engine.example_consume_next(msg, topic, ts)
+        """
+        quiet = self._quiet
+        with log_level(level):
+            self._quiet = True
+            try:
+                yield self
+            finally:
+                self._quiet = quiet
+
+    @property
+    def condition_errors(self) -> dict[str, int]:
+        """
+        The number of failed evaluations, e.g. on a missing field, of each
+        condition that failed at least once. Such evaluations are false.
+        """
+        errors = {}
+        for cond in {id(c): c for rule in self.rules for c in rule.conditions}.values():
+            if cond.error_count:
+                errors[cond.raw] = errors.get(cond.raw, 0) + cond.error_count
+        return errors
 
     def example_consume_next(self, msg: dict[str, any], topic: str, ts: float):
         """
@@ -33,33 +143,95 @@ class Engine:
         before action running, or after action running. Use this as a reference.
         """
         self.load_message(msg, topic, ts)
-        for rule_idx, _ in enumerate(self.rules):
+        for rule_idx in self.cur_rule_indices:
             if self.evaluate_rule_condition(rule_idx):
                 self.run_rule_actions(rule_idx)
 
     def load_message(self, msg: dict[str, any], topic: str, ts: float):
-        """Load the message into the engine and prepared for rule evaluation"""
+        """
+        Load the message into the engine and prepared for rule evaluation.
+        cur_rule_indices is set to the rules subscribed to the topic, less the
+        joined rules with another value of their field. The activation is
+        built either way, so that rule_activation and run_rule_actions work
+        for any rule, but the message fields are only converted when read.
+        """
+        self.cur_topic = topic
+        self._last_activation = (None, None)
         self.cur_activation = {
-            "msg": celpy.adapter.json_to_cel(msg),
+            # Only the fields the rules read are converted to CEL
+            "msg": lazy_json_to_cel(msg),
             "topic": celpy.celtypes.StringType(topic),
             "ts": celpy.celtypes.DoubleType(ts),
         }
+        plain, joined = self._plan_for_topic(topic)
+        matched = []
+        for path, rules_by_value in joined.items():
+            try:
+                rule_indices = rules_by_value.get(_get_path(msg, path))
+            except (KeyError, TypeError):
+                # Missing or unhashable, it equals none of the values
+                continue
+            if rule_indices:
+                matched.append(rule_indices)
+        self.cur_rule_indices = sorted(chain(plain, *matched)) if matched else plain
+
+    def rule_activation(self, rule_idx) -> ChainMap:
+        """
+        The activation of a rule for the current message: the bindings of the
+        rule (its scope) layered over the message bindings shared by all rules.
+        The last one is reused, e.g. by the actions after the condition.
+        """
+        if self._last_activation[0] == rule_idx:
+            return self._last_activation[1]
+        activation = ChainMap(self.rules[rule_idx].scope_bindings, self.cur_activation)
+        self._last_activation = (rule_idx, activation)
+        return activation
 
     def evaluate_rule_condition(self, rule_idx):
-        """Evaluate the condition of a rule against the current activation"""
+        """
+        Evaluate the condition of a rule against the current activation,
+        False if the rule is not subscribed to the current topic
+        """
         rule = self.rules[rule_idx]
-        activation = {
-            **self.cur_activation,
-            "scope": celpy.adapter.json_to_cel(rule.scope),
-        }
+        if not rule.satisfiable:
+            return False
+        if rule.topics and self.cur_topic not in rule.topics:
+            return False
+        activation = self.rule_activation(rule_idx)
+        if self._quiet:
+            return all(cond.evaluate_quietly(activation) for cond in rule.conditions)
         return all(cond.evaluate(activation) for cond in rule.conditions)
 
     def run_rule_actions(self, rule_idx):
         """Run the actions of a rule against the current activation"""
-        rule = self.rules[rule_idx]
-        activation = {
-            **self.cur_activation,
-            "scope": celpy.adapter.json_to_cel(rule.scope),
-        }
-        for action in rule.actions:
-            action.run(activation)
+        activation = self.rule_activation(rule_idx)
+        for action in self.rules[rule_idx].actions:
+            if self._quiet:
+                action.run_quietly(activation)
+            else:
+                action.run(activation)
+
+
+def _join(rule: Rule) -> Optional[tuple[tuple[str, ...], Any]]:
+    """
+    The path of a message field and the value it must have for the rule to
+    match, from a condition like `msg.robot_id == scope.robot_id`. None if
+    there is none, or if the value is missing or cannot be hashed.
+    """
+    for cond in rule.conditions:
+        for msg_path, scope_path in field_equalities(cond.raw, "msg", "scope"):
+            try:
+                value = _get_path(rule.scope, scope_path)
+                hash(value)
+            except (KeyError, TypeError):
+                continue
+            return msg_path, value
+    return None
+
+
+def _get_path(document: Any, path: tuple[str, ...]) -> Any:
+    for key in path:
+        if not isinstance(document, dict):
+            raise KeyError(key)
+        document = document[key]
+    return document
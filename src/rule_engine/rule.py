@@ -87,9 +87,17 @@ class Rule:
         metadata: dict[str, any] = None,  # user-defined metadata
     ):
         self.raw = raw
-        self.conditions = conditions
         self.actions = actions
         self.scope = scope
+        # The scope never changes, so it is converted to CEL once, and bound
+        # in a layer put over the message bindings of the engine
+        self.scope_bindings = {"scope": celpy.adapter.json_to_cel(scope)}
+        # It is also folded into the conditions. Those that become true
+        # whatever the message are dropped, and one that becomes false makes
+        # the rule unsatisfiable, so the engine leaves it out
+        conditions = [cond.specialize(self.scope_bindings) for cond in conditions]
+        self.conditions = [cond for cond in conditions if cond.constant is not True]
+        self.satisfiable = all(cond.constant is None for cond in self.conditions)
         self.topics = topics
         self.debounce_time = debounce_time
         self._prev_activation_time = None
@@ -12,6 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 import logging
+from contextlib import contextmanager
 from enum import IntEnum
 from functools import wraps
 from typing import Optional
@@ -68,20 +69,26 @@ class ValidationResult(BaseModel):
     errors: list[ValidationError]
 
 
+@contextmanager
+def log_level(level):
+    """Set the level of the root logger within the block"""
+    # Save the original logging level
+    original_level = logging.getLogger().level
+    # Set logging level to the specified level
+    logging.getLogger().setLevel(level)
+    try:
+        yield
+    finally:
+        # Reset logging level to original
+        logging.getLogger().setLevel(original_level)
+
+
 def log_level_decorator(level):
     def decorator(func):
         @wraps(func)
         def wrapper(*args, **kwargs):
-            # Save the original logging level
-            original_level = logging.getLogger().level
-            # Set logging level to the specified level
-            logging.getLogger().setLevel(level)
-            try:
-                # Execute the function
+            with log_level(level):
                 return func(*args, **kwargs)
-            finally:
-                # Reset logging level to original
-                logging.getLogger().setLevel(original_level)
 
         return wrapper
 
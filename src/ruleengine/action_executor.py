@@ -0,0 +1,196 @@
+# Copyright 2024 coScene
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import threading
+from collections import deque
+
+_log = logging.getLogger(__name__)
+
+# What submit does when the queue is full
+BLOCK = "block"
+DROP_NEW = "drop_new"
+DROP_OLDEST = "drop_oldest"
+RAISE = "raise"
+OVERFLOW_POLICIES = (BLOCK, DROP_NEW, DROP_OLDEST, RAISE)
+
+
+class ActionQueueFull(Exception):
+    pass
+
+
+class ActionExecutor:
+    """
+    Runs action impls on a pool of threads, so that slow impls (e.g. an
+    upload) don't hold up the evaluation of the rules.
+
+    Submitted calls wait in a bounded queue, and are run in submission order
+    as long as the number of running calls of their type stays within its
+    limit. Calls of the same type therefore start in order, and a type with a
+    limit of 1 runs its calls one at a time.
+    """
+
+    def __init__(self, max_workers=4, limits=None, max_queue=1000, overflow=BLOCK):
+        """
+        :param max_workers: Number of threads running the impls.
+        :param limits: Maximum number of concurrent calls per action type, e.g.
+            {"upload": 1}. Types not listed are only limited by max_workers.
+        :param max_queue: Maximum number of calls waiting to be run.
+        :param overflow: What to do when submitting to a full queue. BLOCK
+            waits for room, DROP_NEW discards the submitted call, DROP_OLDEST
+            discards the oldest waiting call and RAISE raises ActionQueueFull.
+        """
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"overflow must be one of {OVERFLOW_POLICIES}")
+        assert max_workers > 0, "max_workers must be positive"
+        assert max_queue > 0, "max_queue must be positive"
+
+        self.__limits = dict(limits or {})
+        self.__max_queue = max_queue
+        self.__overflow = overflow
+
+        self.__lock = threading.Condition()
+        self.__queue = deque()
+        self.__running = {}
+        self.__running_total = 0
+        self.__closed = False
+        self.__stats = {"submitted": 0, "completed": 0, "failed": 0, "dropped": 0}
+
+        self.__threads = [
+            threading.Thread(
+                target=self.__work, name=f"action-executor-{i}", daemon=True
+            )
+            for i in range(max_workers)
+        ]
+        for thread in self.__threads:
+            thread.start()
+
+    def submit(self, name, impl, kwargs):
+        """
+        Queue a call of impl(**kwargs), name being its action type. Returns
+        whether the call was queued, which is False when it was dropped.
+        """
+        with self.__lock:
+            if self.__closed:
+                raise RuntimeError("submit on a closed ActionExecutor")
+
+            if len(self.__queue) >= self.__max_queue:
+                if self.__overflow == BLOCK:
+                    self.__lock.wait_for(
+                        lambda: len(self.__queue) < self.__max_queue or self.__closed
+                    )
+                    if self.__closed:
+                        raise RuntimeError("submit on a closed ActionExecutor")
+                elif self.__overflow == DROP_NEW:
+                    self.__drop(name)
+                    return False
+                elif self.__overflow == DROP_OLDEST:
+                    self.__drop(self.__queue.popleft()[0])
+                else:
+                    raise ActionQueueFull(f"{self.__max_queue} actions are queued")
+
+            self.__queue.append((name, impl, kwargs))
+            self.__stats["submitted"] += 1
+            self.__lock.notify_all()
+            return True
+
+    def flush(self, timeout=None):
+        """
+        Wait until all the submitted calls are done. Returns False if the
+        timeout expired first.
+        """
+        with self.__lock:
+            return self.__lock.wait_for(
+                lambda: not self.__queue and not self.__running_total, timeout
+            )
+
+    def close(self, wait=True):
+        """
+        Stop accepting calls and stop the threads. Waits for the queued calls
+        to be run if wait, otherwise they are dropped.
+        """
+        if wait:
+            self.flush()
+        with self.__lock:
+            self.__closed = True
+            while self.__queue:
+                self.__drop(self.__queue.popleft()[0], "the executor is closed")
+            self.__lock.notify_all()
+        for thread in self.__threads:
+            thread.join()
+
+    @property
+    def stats(self):
+        """Counts of submitted, completed, failed and dropped calls"""
+        with self.__lock:
+            return dict(self.__stats)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __drop(self, name, reason="the action queue is full"):
+        self.__stats["dropped"] += 1
+        _log.warning(f"dropping a {name} action, {reason}")
+
+    def __next_task(self):
+        """The first queued call whose type is below its limit, if any"""
+        for i, task in enumerate(self.__queue):
+            name = task[0]
+            limit = self.__limits.get(name)
+            if limit is None or self.__running.get(name, 0) < limit:
+                del self.__queue[i]
+                return task
+        return None
+
+    def __work(self):
+        while True:
+            with self.__lock:
+                task = None
+                while task is None:
+                    if self.__closed and not self.__queue:
+                        return
+                    task = self.__next_task()
+                    if task is None:
+                        self.__lock.wait()
+                name, impl, kwargs = task
+                self.__running[name] = self.__running.get(name, 0) + 1
+                self.__running_total += 1
+                # Room was made in the queue
+                self.__lock.notify_all()
+
+            failed = False
+            try:
+                impl(**kwargs)
+            except Exception:
+                failed = True
+                _log.exception(f"{name} action failed")
+
+            with self.__lock:
+                self.__running[name] -= 1
+                self.__running_total -= 1
+                self.__stats["failed" if failed else "completed"] += 1
+                self.__lock.notify_all()
+
+
+__all__ = [
+    "ActionExecutor",
+    "ActionQueueFull",
+    "BLOCK",
+    "DROP_NEW",
+    "DROP_OLDEST",
+    "RAISE",
+]
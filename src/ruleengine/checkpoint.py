@@ -0,0 +1,155 @@
+# Copyright 2024 coScene
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+The binary format of `Engine.snapshot`.
+
+A snapshot is a header (magic and format version) followed by a pickle of
+(rule key, state) pairs, one for each rule with stateful conditions. Rule keys
+are a hash of the rule content, so the states can be restored into an engine
+built from the same config in another process, even if rules were added or
+removed around them in the meantime.
+
+Snapshots may only refer to the classes and functions in `_ALLOWED`, so that
+a tampered file can't run code when unpickled. Snapshots of states holding
+anything else, e.g. a namedtuple in a scope, fail when taken rather than when
+restored.
+"""
+
+import copyreg
+import hashlib
+import io
+import json
+import pickle
+import re
+import struct
+from types import BuiltinFunctionType, FunctionType
+
+from ruleengine.dsl.log_conditions import LogLevel
+from ruleengine.dsl.scope import Scope
+from ruleengine.readers import messages
+
+MAGIC = b"RSNP"
+VERSION = 1
+
+_HEADER = struct.Struct(">4sH")
+
+
+def rule_key(rule):
+    """A hash of the content of a rule, its project name and spec"""
+    return content_key(rule.project_name, rule.spec)
+
+
+def content_key(project_name, spec):
+    """The `rule_key` of a rule with the given project name and spec"""
+    text = json.dumps([project_name, spec], sort_keys=True, default=repr)
+    return hashlib.blake2b(text.encode(), digest_size=16).digest()
+
+
+def rule_keys(rules):
+    """
+    The keys of a list of rules. Identical rules get the same hash, they are
+    told apart by their order among themselves.
+    """
+    occurrences = {}
+    keys = []
+    for rule in rules:
+        digest = rule_key(rule)
+        occurrence = occurrences.get(digest, 0)
+        occurrences[digest] = occurrence + 1
+        keys.append((digest, occurrence))
+    return keys
+
+
+def dumps(states):
+    """Serialize a list of (rule key, state) pairs"""
+    buffer = io.BytesIO()
+    buffer.write(_HEADER.pack(MAGIC, VERSION))
+    _Pickler(buffer, pickle.HIGHEST_PROTOCOL).dump(states)
+    return buffer.getvalue()
+
+
+def loads(blob):
+    """Deserialize a snapshot into a dict from rule key to state"""
+    if len(blob) < _HEADER.size:
+        raise ValueError("not a rule engine snapshot")
+    magic, version = _HEADER.unpack_from(blob)
+    if magic != MAGIC:
+        raise ValueError("not a rule engine snapshot")
+    if version != VERSION:
+        raise ValueError(f"unsupported snapshot version {version}")
+    offset = _HEADER.size
+    payload = io.BytesIO(memoryview(blob)[offset:])
+    return dict(_Unpickler(payload).load())
+
+
+def _search(regex, string, pos, endpos):
+    return regex.search(string, pos, endpos)
+
+
+def _reduce_match(match):
+    # Match objects can't be pickled, searching again gives the same match
+    return _search, (match.re, match.string, match.pos, match.endpos)
+
+
+def _reduce_scope(scope):
+    # Store the flat items rather than the chain of scopes
+    return Scope, (dict(scope),)
+
+
+# The globals a snapshot can refer to: scopes, matches searched again and
+# their patterns, which copyreg reduces to re._compile, and the values scopes
+# commonly hold besides primitives, log levels and decoded messages
+_ALLOWED = {
+    ("ruleengine.dsl.scope", "Scope"): Scope,
+    (__name__, "_search"): _search,
+    ("re", "_compile"): getattr(re, "_compile"),
+    ("ruleengine.dsl.log_conditions", "LogLevel"): LogLevel,
+    ("ruleengine.readers.messages", "Time"): messages.Time,
+    ("ruleengine.readers.messages", "_message"): getattr(messages, "_message"),
+}
+
+
+class _Pickler(pickle.Pickler):
+    dispatch_table = {
+        **copyreg.dispatch_table,
+        re.Match: _reduce_match,
+        Scope: _reduce_scope,
+    }
+
+    def reducer_override(self, obj):
+        # Every global written goes through here first
+        if isinstance(obj, (type, FunctionType, BuiltinFunctionType)):
+            module, name = getattr(obj, "__module__", None), obj.__qualname__
+            if _ALLOWED.get((module, name)) is not obj:
+                raise ValueError(f"a snapshot can't refer to {module}.{name}")
+        return NotImplemented
+
+
+class _Unpickler(pickle.Unpickler):
+    def find_class(self, module, name):
+        try:
+            return _ALLOWED[(module, name)]
+        except KeyError:
+            raise ValueError(f"a snapshot can't refer to {module}.{name}") from None
+
+
+__all__ = [
+    "VERSION",
+    "content_key",
+    "dumps",
+    "loads",
+    "rule_key",
+    "rule_keys",
+]
@@ -0,0 +1,80 @@
+# Copyright 2024 coScene
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from ruleengine.dsl.analysis import dispatch_guards
+
+
+class DispatchIndex:
+    """
+    Maps the topic and msgtype of an item to the rules that could possibly be
+    triggered by it.
+
+    The guards of each rule are extracted statically from its conditions (see
+    `dispatch_guards`). A rule is reachable from an item if any of its guards
+    matches, and rules for which no guard can be proved end up in a catch-all
+    bucket that every item reaches. Rules are always returned in their original
+    order.
+
+    entries, if given, are returned in place of the rules, e.g. to carry
+    the conditions actually evaluated by the engine along with each rule.
+    """
+
+    def __init__(self, rules, entries=None):
+        self.rules = rules
+        self.entries = rules if entries is None else entries
+        self.__catch_all = []
+        self.__by_key = {}
+        for i, rule in enumerate(rules):
+            guards = rule_guards(rule)
+            if guards is None:
+                self.__catch_all.append(i)
+                continue
+            for guard in guards:
+                self.__by_key.setdefault(guard, []).append(i)
+
+        # (topic, msgtype) -> rules, filled lazily since the combinations are
+        # not known in advance
+        self.__cache = {}
+
+    def rules_for(self, item):
+        key = (item.topic, item.msgtype)
+        rules = self.__cache.get(key)
+        if rules is None:
+            rules = self.__cache[key] = self.__lookup(*key)
+        return rules
+
+    def __lookup(self, topic, msgtype):
+        indices = set(self.__catch_all)
+        indices.update(self.__by_key.get(("topic", topic), []))
+        indices.update(self.__by_key.get(("msgtype", msgtype), []))
+        return [self.entries[i] for i in sorted(indices)]
+
+    @property
+    def catch_all(self):
+        """Entries that are evaluated against every item"""
+        return [self.entries[i] for i in self.__catch_all]
+
+
+def rule_guards(rule):
+    """
+    Guards of a rule, which is the union of the guards of its conditions, or
+    None if any of them is unguarded.
+    """
+    result = frozenset()
+    for cond in rule.conditions:
+        guards = dispatch_guards(cond)
+        if guards is None:
+            return None
+        result |= guards
+    return result
@@ -0,0 +1,330 @@
+# Copyright 2024 coScene
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Static analysis of condition trees, based on the structural descriptions
+(`Condition._node`) recorded by the DSL building blocks.
+"""
+
+import operator as op
+
+from .condition import Condition
+from .state import StatefulCondition
+
+# Item fields that the engine can dispatch on
+DISPATCH_FIELDS = ("topic", "msgtype")
+
+
+def children(cond):
+    """Child conditions of a described condition, empty for opaque ones"""
+    node = getattr(cond, "_node", None)
+    if node is None:
+        return []
+    return [operand for operand in node.operands if isinstance(operand, Condition)]
+
+
+def is_stateless(cond):
+    """
+    Whether evaluating the condition is free of side effects, i.e. it is fully
+    described and contains no stateful (or opaque) conditions.
+    """
+    if getattr(cond, "_node", None) is None:
+        return False
+    return all(is_stateless(child) for child in children(cond))
+
+
+def structural_key(cond, memo=None):
+    """
+    A hashable key that is equal for structurally identical stateless
+    conditions, i.e. conditions that always evaluate to the same result. None
+    if the condition isn't stateless.
+
+    memo caches keys by condition id, pass the same dict when computing keys
+    of many (possibly overlapping) trees.
+    """
+    if memo is None:
+        memo = {}
+    if id(cond) in memo:
+        return memo[id(cond)][1]
+
+    node = getattr(cond, "_node", None)
+    key = None
+    if node is not None:
+        operand_keys = []
+        for operand in node.operands:
+            if isinstance(operand, Condition):
+                operand_key = structural_key(operand, memo)
+                if operand_key is None:
+                    break
+            else:
+                operand_key = _value_key(operand)
+            operand_keys.append(operand_key)
+        else:
+            key = (node.kind, *operand_keys)
+
+    # Keep the condition alive along with its key, so that its id isn't reused
+    memo[id(cond)] = (cond, key)
+    return key
+
+
+def _value_key(value):
+    # The type is part of the key since e.g. 1 == 1.0 == True
+    try:
+        hash(value)
+        return type(value), value
+    except TypeError:
+        if isinstance(value, (list, tuple)):
+            return type(value), tuple(_value_key(v) for v in value)
+        if isinstance(value, dict):
+            return type(value), tuple((k, _value_key(v)) for k, v in value.items())
+        return "id", id(value)
+
+
+def rewrite(cond, fn, memo=None):
+    """
+    Rewrite a condition tree bottom-up. Children are rewritten first, and a
+    node is rebuilt if any of its children changed. fn is then called on every
+    node and returns either the node itself or its replacement.
+
+    Opaque conditions are passed to fn as they are, since their children can't
+    be rebuilt. Shared subtrees stay shared as long as the same memo is used.
+    """
+    if memo is None:
+        memo = {}
+    if id(cond) in memo:
+        return memo[id(cond)][1]
+
+    result = cond
+    node = getattr(cond, "_node", None)
+    if node is not None and node.rebuild is not None:
+        operands = [
+            rewrite(operand, fn, memo) if isinstance(operand, Condition) else operand
+            for operand in node.operands
+        ]
+        if any(new is not old for new, old in zip(operands, node.operands)):
+            result = node.rebuild(*operands)
+    result = fn(result)
+
+    memo[id(cond)] = (cond, result)
+    return result
+
+
+def walk(cond, seen=None):
+    """Iterate over all the described nodes of a tree, each one only once"""
+    if seen is None:
+        seen = set()
+    if id(cond) in seen:
+        return
+    seen.add(id(cond))
+    yield cond
+    for child in children(cond):
+        yield from walk(child, seen)
+
+
+def dispatch_guards(cond):
+    """
+    Find the (field, value) pairs an item must match for the condition to
+    possibly be true, where field is one of DISPATCH_FIELDS.
+
+    The returned guards are a frozenset of (field, value), and the condition is
+    guaranteed to evaluate to a falsy value without any side effect for an item
+    that matches none of them. An empty set means the condition is never true.
+    None is returned if no such guarantee can be proved.
+    """
+    node = getattr(cond, "_node", None)
+    if node is None:
+        return None
+
+    if node.kind == "const":
+        return None if node.operands[0] else frozenset()
+
+    if node.kind == "binop":
+        left, right, operator, _, _ = node.operands
+        if operator is not op.eq:
+            return None
+        field, value = _field_name(left), _const_value(right)
+        if field is None or not isinstance(value, str):
+            return None
+        return frozenset([(field, value)])
+
+    if node.kind == "has":
+        parent, child = node.operands
+        field, values = _field_name(child), _const_value(parent)
+        if field is None or not isinstance(values, (list, tuple, set, frozenset)):
+            return None
+        if not all(isinstance(v, str) for v in values):
+            return None
+        return frozenset((field, v) for v in values)
+
+    if node.kind == "and":
+        # and_ stops at the first falsy condition, so any guard in the
+        # conjunction works, as long as the conditions evaluated before it
+        # have no side effects
+        for c in node.operands:
+            guards = dispatch_guards(c)
+            if guards is not None:
+                return guards
+            if not is_stateless(c):
+                return None
+        return None
+
+    if node.kind == "or":
+        # or_ evaluates all conditions before giving up, so every one of them
+        # has to be guarded
+        result = frozenset()
+        for c in node.operands:
+            guards = dispatch_guards(c)
+            if guards is None:
+                return None
+            result |= guards
+        return result
+
+    return None
+
+
+def msg_field_paths(cond, guards=None):
+    """
+    Find the fields of the message that evaluating the condition may read, by
+    the (topic, msgtype) an item must have for them to be read, None standing
+    for any topic or msgtype. Reads under an `and_` are narrowed down by the
+    dispatch guards of the conditions before them.
+
+    A path is a tuple of field names, () being the whole message, e.g. when it
+    is passed to a function. Array indices are not part of the paths, nor are
+    the names of methods called on fields. guards,
+    if given, are dispatch guards known to hold for the evaluated items.
+
+    Returns a dict from (topic, msgtype) to a set of paths, or None if the
+    condition has opaque parts, which may read anything.
+    """
+    contexts = frozenset([(None, None)])
+    if guards is not None:
+        contexts = _narrow(contexts, guards)
+    result = {}
+    try:
+        _collect_paths(cond, contexts, result, set())
+    except _Undetermined:
+        return None
+    return result
+
+
+class _Undetermined(Exception):
+    pass
+
+
+def _collect_paths(cond, contexts, result, seen):
+    if not contexts or (id(cond), contexts) in seen:
+        return
+    seen.add((id(cond), contexts))
+
+    path = _msg_path(cond)
+    if path is not None:
+        for context in contexts:
+            result.setdefault(context, set()).add(path)
+        return
+
+    node = getattr(cond, "_node", None)
+    if node is None:
+        operands = None
+        if isinstance(cond, StatefulCondition):
+            operands = cond._children()
+        if operands is None:
+            raise _Undetermined()
+        for operand in operands:
+            _collect_paths(operand, contexts, result, seen)
+        return
+
+    if node.kind == "call":
+        # A method call reads the field it is called on, the method name is no
+        # field of the message
+        path = _msg_path(node.operands[0])
+        if path is not None:
+            for context in contexts:
+                result.setdefault(context, set()).add(path[:-1])
+            return
+
+    if node.kind == "and":
+        # Conditions after a guarded one are only evaluated on the items
+        # matching its guards
+        for operand in node.operands:
+            _collect_paths(operand, contexts, result, seen)
+            guards = dispatch_guards(operand)
+            if guards is not None:
+                contexts = _narrow(contexts, guards)
+        return
+
+    for operand in children(cond):
+        _collect_paths(operand, contexts, result, seen)
+
+
+def _msg_path(cond):
+    """The path of a chain of field accesses on msg, None for anything else"""
+    path = []
+    node = getattr(cond, "_node", None)
+    while node is not None:
+        if node.kind == "field":
+            return tuple(reversed(path)) if node.operands[0] == "msg" else None
+        if node.kind == "memo":
+            node = getattr(node.operands[0], "_node", None)
+            continue
+        if node.kind not in ("attr", "item", "map_attr"):
+            return None
+        inner, name = node.operands
+        if isinstance(name, str):
+            path.append(name)
+        elif not isinstance(name, int) or isinstance(name, bool):
+            return None
+        node = getattr(inner, "_node", None)
+    return None
+
+
+def _narrow(contexts, guards):
+    """Restrict (topic, msgtype) contexts to those compatible with guards"""
+    result = set()
+    for topic, msgtype in contexts:
+        for field, value in guards:
+            if field == "topic" and topic in (None, value):
+                result.add((value, msgtype))
+            elif field == "msgtype" and msgtype in (None, value):
+                result.add((topic, value))
+    return frozenset(result)
+
+
+def _field_name(cond):
+    node = getattr(cond, "_node", None)
+    if (
+        node is not None
+        and node.kind == "field"
+        and node.operands[0] in DISPATCH_FIELDS
+    ):
+        return node.operands[0]
+    return None
+
+
+def _const_value(cond):
+    node = getattr(cond, "_node", None)
+    if node is not None and node.kind == "const":
+        return node.operands[0]
+    return None
+
+
+__all__ = [
+    "children",
+    "dispatch_guards",
+    "is_stateless",
+    "msg_field_paths",
+    "rewrite",
+    "structural_key",
+    "walk",
+]
@@ -49,11 +49,23 @@ noop = {"upload": noop_upload, "create_moment": noop_create_moment}
 
 
 class ForwardingAction(Action):
-    def __init__(self, thunk, args):
+    def __init__(self, thunk, args, name=None):
         self.__thunk = thunk
         self.__args = args
+        # The type of action, e.g. "upload"
+        self.name = name
 
-    def run(self, item, scope):
+    @property
+    def impl(self):
+        return self.__thunk
+
+    @property
+    def args(self):
+        """The arguments of the impl, as constants or conditions"""
+        return dict(self.__args)
+
+    def evaluate_args(self, item, scope):
+        """The arguments the impl is called with for the item and scope"""
         actual_args = {}
         for name, value in self.__args.items():
             if isinstance(value, Condition):
@@ -61,7 +73,10 @@ class ForwardingAction(Action):
                 actual_args[name] = new_value
             else:
                 actual_args[name] = value
-        self.__thunk(**actual_args)
+        return actual_args
+
+    def run(self, item, scope):
+        self.__thunk(**self.evaluate_args(item, scope))
 
 
 def upload_factory(impl):
@@ -85,7 +100,7 @@ def upload_factory(impl):
             "trigger_ts": ts,
         }
 
-        return ForwardingAction(impl, args)
+        return ForwardingAction(impl, args, "upload")
 
     return res
 
@@ -111,6 +126,6 @@ def create_moment_factory(impl):
             "assign_to": assign_to,
             "custom_fields": Condition.map(Condition.wrap(custom_fields), str),
         }
-        return ForwardingAction(impl, args)
+        return ForwardingAction(impl, args, "create_moment")
 
     return res
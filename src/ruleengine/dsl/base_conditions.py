@@ -14,13 +14,24 @@
 
 import re
 
-from .condition import Condition, ThunkCondition, get_attr_or_item
+from .condition import Condition, ThunkCondition, describe, get_attr_or_item
+from .lazy import resolve
+from .scope import extend
+
+
+def _item_msg(item, scope):
+    return resolve(item.msg), scope
+
 
 always = Condition.wrap(True)
-msg = ThunkCondition(lambda item, scope: (item.msg, scope))
-ts = ThunkCondition(lambda item, scope: (item.ts, scope))
-topic = ThunkCondition(lambda item, scope: (item.topic, scope))
-msgtype = ThunkCondition(lambda item, scope: (item.msgtype, scope))
+msg = describe(ThunkCondition(_item_msg), "field", ["msg"])
+ts = describe(ThunkCondition(lambda item, scope: (item.ts, scope)), "field", ["ts"])
+topic = describe(
+    ThunkCondition(lambda item, scope: (item.topic, scope)), "field", ["topic"]
+)
+msgtype = describe(
+    ThunkCondition(lambda item, scope: (item.msgtype, scope)), "field", ["msgtype"]
+)
 
 
 def get_start_time(item, scope):
@@ -30,7 +41,7 @@ def get_start_time(item, scope):
     return value, scope
 
 
-condition_start_time = ThunkCondition(get_start_time)
+condition_start_time = describe(ThunkCondition(get_start_time), "start_time")
 
 
 @Condition.wrap_args
@@ -45,7 +56,7 @@ def and_(*conditions):
                 break
         return value, scope
 
-    return ThunkCondition(new_thunk)
+    return describe(ThunkCondition(new_thunk), "and", conditions, and_)
 
 
 @Condition.wrap_args
@@ -60,12 +71,12 @@ def or_(*conditions):
                 break
         return value, scope
 
-    return ThunkCondition(new_thunk)
+    return describe(ThunkCondition(new_thunk), "or", conditions, or_)
 
 
 @Condition.wrap_args
 def not_(condition):
-    return Condition.map(condition, lambda x: not x)
+    return describe(Condition.map(condition, lambda x: not x), "not", [condition], not_)
 
 
 @Condition.wrap_args
@@ -74,7 +85,7 @@ def is_none(condition):
         value, scope = condition.evaluate_condition_at(item, scope)
         return value is None, scope
 
-    return ThunkCondition(new_thunk)
+    return describe(ThunkCondition(new_thunk), "is_none", [condition], is_none)
 
 
 @Condition.wrap_args
@@ -86,50 +97,84 @@ def concat(*pieces):
             str_pieces.append(str(value))
         return "".join(str_pieces), scope
 
-    return ThunkCondition(new_thunk)
+    return describe(ThunkCondition(new_thunk), "concat", pieces, concat)
 
 
 @Condition.wrap_args
 def get_value(key):
-    return Condition.flatmap(
-        key,
-        lambda k: ThunkCondition(
-            lambda item, scope: (scope[k], scope) if k in scope else (None, scope)
+    return describe(
+        Condition.flatmap(
+            key,
+            lambda k: ThunkCondition(
+                lambda item, scope: (scope[k], scope) if k in scope else (None, scope)
+            ),
         ),
+        "get_value",
+        [key],
+        get_value,
     )
 
 
 @Condition.wrap_args
 def set_value(key, value):
-    return Condition.apply(
-        lambda scope, actual_key, actual_value: (
-            True,
-            {**scope, actual_key: actual_value},
+    return describe(
+        Condition.apply(
+            lambda scope, actual_key, actual_value: (
+                True,
+                extend(scope, actual_key, actual_value),
+            ),
+            key,
+            value,
         ),
-        key,
-        value,
+        "set_value",
+        [key, value],
+        set_value,
     )
 
 
 @Condition.wrap_args
 def has(parent, child):
-    return Condition.apply(
-        lambda scope, p, c: (c in p, {**scope, "cos/contains": c if c in p else None}),
-        parent,
-        child,
+    return describe(
+        Condition.apply(
+            lambda scope, p, c: (
+                c in p,
+                extend(scope, "cos/contains", c if c in p else None),
+            ),
+            parent,
+            child,
+        ),
+        "has",
+        [parent, child],
+        has,
     )
 
 
 def regex(value, pattern):
-    return Condition.flatmap(
-        Condition.map(Condition.wrap(value), lambda v: re.search(pattern, v)),
-        lambda match_result: ThunkCondition(
-            lambda item, scope: (match_result, {**scope, "cos/regex": match_result})
+    value = Condition.wrap(value)
+    return describe(
+        Condition.flatmap(
+            Condition.map(value, lambda v: re.search(pattern, v)),
+            lambda match_result: ThunkCondition(
+                lambda item, scope: (
+                    match_result,
+                    extend(scope, "cos/regex", match_result),
+                )
+            ),
         ),
+        "regex",
+        [value, pattern],
+        regex,
     )
 
 
 def map_attr(value, attr):
+    value = Condition.wrap(value)
+    return describe(
+        Condition.map(value, _attr_mapper(attr)), "map_attr", [value, attr], map_attr
+    )
+
+
+def _attr_mapper(attr):
     def mapper(x):
         try:
             iter(x)
@@ -138,14 +183,17 @@ def map_attr(value, attr):
         result = [get_attr_or_item(attr)(v) for v in x]
         return result
 
-    return Condition.map(Condition.wrap(value), mapper)
+    return mapper
 
 
 def func_apply(func, *args):
-    return Condition.apply(
-        lambda scope, f, *a: (f(*a), scope),
-        Condition.wrap(func),
-        *[Condition.wrap(arg) for arg in args]
+    func = Condition.wrap(func)
+    args = [Condition.wrap(arg) for arg in args]
+    return describe(
+        Condition.apply(lambda scope, f, *a: (f(*a), scope), func, *args),
+        "func_apply",
+        [func, *args],
+        func_apply,
     )
 
 
@@ -0,0 +1,392 @@
+# Copyright 2024 coScene
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Compiles condition trees into flat Python functions.
+
+A condition built with the DSL is a deep chain of thunks, where every step is
+a Python call returning a (value, scope) tuple. The compiler walks the
+structural description of the tree (`Condition._node`) and generates a single
+function per tree instead, with the None propagation and the scope threading
+inlined as plain local variables.
+
+Stateful and opaque conditions (e.g. `SequenceMatchCondition`) are kept as
+objects and called from the generated code, in the same order as the
+interpreter would call them.
+"""
+
+import logging
+import operator as op
+import re
+from functools import lru_cache
+
+from .base_conditions import _attr_mapper
+from .condition import Condition, _identity
+from .lazy import LazyMessage
+from .scope import extend
+from .sharing import current_generation
+
+_log = logging.getLogger(__name__)
+
+_BINARY_OPERATORS = {
+    op.eq: "==",
+    op.ne: "!=",
+    op.gt: ">",
+    op.ge: ">=",
+    op.lt: "<",
+    op.le: "<=",
+    op.add: "+",
+    op.sub: "-",
+    op.mul: "*",
+    op.truediv: "/",
+}
+
+
+class CompiledCondition(Condition):
+    """
+    A condition evaluated by a generated function. It keeps the structural
+    description of its source, so static analysis still works on it.
+    """
+
+    def __init__(self, source, func, code):
+        super().__init__()
+        self._node = source._node
+        self._source = source
+        self._code = code
+        # Shadow the method to save a call per evaluation
+        self.evaluate_condition_at = func
+
+    def evaluate_condition_at(self, item, scope):
+        pass
+
+
+def compile_condition(cond):
+    """
+    Compile a condition into a CompiledCondition that behaves exactly like the
+    original one. Conditions that can't be compiled are returned as is.
+    """
+    if not isinstance(cond, Condition) or cond._node is None:
+        return cond
+    if isinstance(cond, CompiledCondition):
+        return cond
+
+    try:
+        source, namespace = _CodeGenerator().generate(cond)
+        code = _compile_source(source)
+    except (SyntaxError, RecursionError, MemoryError) as e:
+        # Most likely the tree is too deep for the Python parser
+        _log.debug(f"failed to compile condition, falling back to interpreter: {e}")
+        return cond
+
+    exec(code, namespace)
+    return CompiledCondition(cond, namespace["evaluate"], source)
+
+
+@lru_cache(maxsize=4096)
+def _compile_source(source):
+    # Trees from templated rules generate the same source, only the namespace
+    # differs
+    return compile(source, "<condition>", "exec")
+
+
+class _CodeGenerator:
+    def __init__(self):
+        self.__lines = []
+        self.__namespace = {"_extend": extend}
+        self.__bindings = {}
+        self.__counter = 0
+
+    def generate(self, cond):
+        self.__emit(0, "def evaluate(item, scope):")
+        result = self.__visit(cond, 1)
+        self.__emit(1, f"return {result}, scope")
+        return "\n".join(self.__lines) + "\n", self.__namespace
+
+    def __emit(self, indent, line):
+        self.__lines.append("    " * indent + line)
+
+    def __var(self):
+        self.__counter += 1
+        return f"v{self.__counter}"
+
+    def __bind(self, value, prefix="_k"):
+        """Make a value available to the generated code under a name"""
+        key = id(value)
+        if key not in self.__bindings:
+            name = f"{prefix}{len(self.__bindings)}"
+            self.__bindings[key] = name
+            self.__namespace[name] = value
+        return self.__bindings[key]
+
+    def __literal(self, value):
+        """Inline simple constants, bind everything else"""
+        if type(value) in (str, int):
+            return repr(value)
+        return self.__bind(value)
+
+    def __visit(self, cond, indent):
+        node = cond._node
+        visitor = getattr(self, f"_visit_{node.kind}", None) if node else None
+        if visitor is None:
+            return self._visit_opaque(cond, indent)
+        return visitor(indent, *node.operands)
+
+    def __visit_unary(self, indent, inner, expr):
+        """Emit `expr` on the value of inner, with None propagation"""
+        value = self.__visit(inner, indent)
+        result = self.__var()
+        self.__emit(indent, f"{result} = None if {value} is None else {expr(value)}")
+        return result
+
+    def __visit_guarded(self, indent, operands, body):
+        """
+        Evaluate operands in order, stopping with a None result at the first
+        None value, then call body with the names of the values
+        """
+        result = self.__var()
+        values = []
+        for operand in operands:
+            value = self.__visit(operand, indent)
+            values.append(value)
+            node = operand._node
+            if node and node.kind == "const" and node.operands[0] is not None:
+                continue
+            self.__emit(indent, f"if {value} is None:")
+            self.__emit(indent + 1, f"{result} = None")
+            self.__emit(indent, "else:")
+            indent += 1
+        body(indent, result, *values)
+        return result
+
+    def _visit_opaque(self, cond, indent):
+        result = self.__var()
+        name = self.__bind(cond, "_c")
+        self.__emit(
+            indent, f"{result}, scope = {name}.evaluate_condition_at(item, scope)"
+        )
+        return result
+
+    def _visit_const(self, indent, value):
+        return self.__bind(value)
+
+    def _visit_field(self, indent, name):
+        result = self.__var()
+        self.__emit(indent, f"{result} = item.{name}")
+        if name == "msg":
+            lazy = self.__bind(LazyMessage, "_t")
+            self.__emit(indent, f"if isinstance({result}, {lazy}):")
+            self.__emit(indent + 1, f"{result} = {result}.value")
+        return result
+
+    def _visit_start_time(self, indent):
+        result = self.__var()
+        self.__emit(
+            indent,
+            f'{result} = scope["start_time"] if "start_time" in scope else item.ts',
+        )
+        return result
+
+    def _visit_map(self, indent, inner, mapper):
+        mapper = self.__bind(mapper, "_f")
+        return self.__visit_unary(indent, inner, lambda v: f"{mapper}({v})")
+
+    def _visit_not(self, indent, inner):
+        return self.__visit_unary(indent, inner, lambda v: f"not {v}")
+
+    def _visit_call(self, indent, inner, args, kwargs):
+        args, kwargs = self.__bind(args), self.__bind(kwargs)
+        return self.__visit_unary(indent, inner, lambda v: f"{v}(*{args}, **{kwargs})")
+
+    def _visit_map_attr(self, indent, value, attr):
+        mapper = self.__bind(_attr_mapper(attr), "_f")
+        return self.__visit_unary(indent, value, lambda v: f"{mapper}({v})")
+
+    def _visit_attr(self, indent, inner, name):
+        # Inlined get_attr_or_item
+        value = self.__visit(inner, indent)
+        result = self.__var()
+        name = self.__literal(name)
+        self.__emit(indent, f"{result} = None")
+        self.__emit(indent, f"if {value} is not None:")
+        self.__emit(indent + 1, "try:")
+        self.__emit(indent + 2, f"if hasattr({value}, {name}):")
+        self.__emit(indent + 3, f"{result} = getattr({value}, {name})")
+        self.__emit(indent + 2, f'elif hasattr({value}, "__getitem__"):')
+        self.__emit(indent + 3, f"{result} = {value}[{name}]")
+        self.__emit(indent + 1, "except (KeyError, IndexError, TypeError):")
+        self.__emit(indent + 2, f"{result} = None")
+        return result
+
+    def _visit_item(self, indent, inner, key):
+        # Inlined get_item_or_attr
+        value = self.__visit(inner, indent)
+        result = self.__var()
+        key = self.__literal(key)
+        self.__emit(indent, f"{result} = None")
+        self.__emit(indent, f"if {value} is not None:")
+        self.__emit(indent + 1, "try:")
+        self.__emit(indent + 2, f'if hasattr({value}, "__getitem__"):')
+        self.__emit(indent + 3, f"{result} = {value}[{key}]")
+        self.__emit(indent + 2, f"elif hasattr({value}, {key}):")
+        self.__emit(indent + 3, f"{result} = getattr({value}, {key})")
+        self.__emit(indent + 1, "except (KeyError, IndexError, TypeError):")
+        self.__emit(indent + 2, f"{result} = None")
+        return result
+
+    def _visit_binop(self, indent, left, right, operator, coerce, swap):
+        def coerced(value):
+            if coerce is _identity:
+                return value
+            if coerce is float:
+                return f"float({value})"
+            return f"{self.__bind(coerce, '_f')}({value})"
+
+        def body(indent, result, x, y):
+            x, y = coerced(x), coerced(y)
+            if swap:
+                x, y = y, x
+            if operator in _BINARY_OPERATORS:
+                expr = f"{x} {_BINARY_OPERATORS[operator]} {y}"
+            else:
+                expr = f"{self.__bind(operator, '_f')}({x}, {y})"
+            self.__emit(indent, f"{result} = {expr}")
+
+        return self.__visit_guarded(indent, [left, right], body)
+
+    def _visit_and(self, indent, *conditions):
+        return self.__visit_short_circuit(indent, conditions, "")
+
+    def _visit_or(self, indent, *conditions):
+        return self.__visit_short_circuit(indent, conditions, "not ")
+
+    def __visit_short_circuit(self, indent, conditions, negate):
+        result = self.__var()
+        for i, cond in enumerate(conditions):
+            value = self.__visit(cond, indent)
+            self.__emit(indent, f"{result} = {value}")
+            if i < len(conditions) - 1:
+                self.__emit(indent, f"if {negate}{result}:")
+                indent += 1
+        return result
+
+    def _visit_is_none(self, indent, inner):
+        value = self.__visit(inner, indent)
+        result = self.__var()
+        self.__emit(indent, f"{result} = {value} is None")
+        return result
+
+    def _visit_concat(self, indent, *pieces):
+        values = [self.__visit(piece, indent) for piece in pieces]
+        result = self.__var()
+        joined = ", ".join(f"str({v})" for v in values)
+        self.__emit(indent, f'{result} = "".join(({joined},))')
+        return result
+
+    def _visit_get_value(self, indent, key):
+        def body(indent, result, k):
+            self.__emit(indent, f"{result} = scope[{k}] if {k} in scope else None")
+
+        return self.__visit_guarded(indent, [key], body)
+
+    def _visit_set_value(self, indent, key, value):
+        def body(indent, result, k, v):
+            self.__emit(indent, f"scope = _extend(scope, {k}, {v})")
+            self.__emit(indent, f"{result} = True")
+
+        return self.__visit_guarded(indent, [key, value], body)
+
+    def _visit_has(self, indent, parent, child):
+        def body(indent, result, p, c):
+            self.__emit(indent, f"{result} = {c} in {p}")
+            self.__emit(
+                indent,
+                f'scope = _extend(scope, "cos/contains", {c} if {result} else None)',
+            )
+
+        return self.__visit_guarded(indent, [parent, child], body)
+
+    def _visit_regex(self, indent, value, pattern):
+        try:
+            search = f"{self.__bind(re.compile(pattern), '_p')}.search"
+        except (re.error, TypeError):
+            # Let the error surface at evaluation time, as the interpreter does
+            search = f"{self.__bind(re.search, '_f')}"
+            search = f"(lambda v: {search}({self.__bind(pattern)}, v))"
+
+        def body(indent, result, v):
+            self.__emit(indent, f"{result} = {search}({v})")
+            self.__emit(indent, f"if {result} is not None:")
+            self.__emit(indent + 1, f'scope = _extend(scope, "cos/regex", {result})')
+
+        return self.__visit_guarded(indent, [value], body)
+
+    def _visit_shared_has(self, indent, parent, needle, scan):
+        needle, scan = self.__bind(needle), self.__bind(scan, "_s")
+
+        def body(indent, result, p):
+            self.__emit(indent, f"if type({p}) is str:")
+            self.__emit(indent + 1, f"{result} = {needle} in {scan}.matches({p})")
+            self.__emit(indent, "else:")
+            self.__emit(indent + 1, f"{result} = {needle} in {p}")
+            self.__emit(
+                indent,
+                f'scope = _extend(scope, "cos/contains", {needle} if {result} else None)',
+            )
+
+        return self.__visit_guarded(indent, [parent], body)
+
+    def _visit_shared_regex(self, indent, value, pattern, scan):
+        pattern, scan = self.__bind(pattern), self.__bind(scan, "_s")
+        search = self.__bind(re.search, "_f")
+
+        def body(indent, result, v):
+            self.__emit(indent, f"if type({v}) is str:")
+            self.__emit(indent + 1, f"{result} = {scan}.matches({v}).get({pattern})")
+            self.__emit(indent, "else:")
+            self.__emit(indent + 1, f"{result} = {search}({pattern}, {v})")
+            self.__emit(indent, f"if {result} is not None:")
+            self.__emit(indent + 1, f'scope = _extend(scope, "cos/regex", {result})')
+
+        return self.__visit_guarded(indent, [value], body)
+
+    def _visit_memo(self, indent, inner, cell):
+        cell = self.__bind(cell, "_m")
+        generation = self.__var()
+        result = self.__var()
+        self.__emit(
+            indent,
+            f"{generation} = {self.__bind(current_generation, '_g')}.value",
+        )
+        self.__emit(
+            indent,
+            f"if {generation} is not None and {cell}.generation == {generation}:",
+        )
+        self.__emit(indent + 1, f"{result} = {cell}.value")
+        self.__emit(indent, "else:")
+        value = self.__visit(inner, indent + 1)
+        self.__emit(indent + 1, f"{cell}.value = {result} = {value}")
+        self.__emit(indent + 1, f"{cell}.generation = {generation}")
+        return result
+
+    def _visit_func_apply(self, indent, func, *args):
+        def body(indent, result, f, *a):
+            self.__emit(indent, f"{result} = {f}({', '.join(a)})")
+
+        return self.__visit_guarded(indent, [func, *args], body)
+
+
+__all__ = [
+    "CompiledCondition",
+    "compile_condition",
+]
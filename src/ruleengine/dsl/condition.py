@@ -14,7 +14,40 @@
 
 import operator as op
 from abc import ABC, abstractmethod
+from dataclasses import dataclass
 from functools import wraps
+from typing import Callable, Optional
+
+from .lazy import resolve
+
+
+@dataclass(frozen=True, eq=False)
+class Node:
+    """
+    Structural description of how a condition was built.
+
+    Static analysis passes (e.g. the dispatch index of the engine) look at
+    these instead of the opaque thunks. `operands` holds the child conditions
+    and any constant arguments, `rebuild` recreates an equivalent condition
+    from (possibly rewritten) operands and is None for leaves.
+
+    Conditions without a node are opaque, and analysis passes must assume they
+    are stateful.
+    """
+
+    kind: str
+    operands: tuple = ()
+    rebuild: Optional[Callable] = None
+
+
+def describe(cond, kind, operands=(), rebuild=None):
+    """Attach a structural description to a condition and return it"""
+    cond._node = Node(kind, tuple(operands), rebuild)
+    return cond
+
+
+def _identity(x):
+    return x
 
 
 class Condition(ABC):
@@ -38,6 +71,12 @@ class Condition(ABC):
 
     """
 
+    # Note that attributes of conditions shadow message fields in the DSL, e.g.
+    # `msg.foo` is a field access only as long as Condition has no `foo`. Keep
+    # everything added here underscored, since ROS and protobuf field names
+    # cannot start with an underscore.
+    _node = None
+
     @abstractmethod
     def evaluate_condition_at(self, item, scope):
         pass
@@ -46,7 +85,9 @@ class Condition(ABC):
     def wrap(value):
         if isinstance(value, Condition):
             return value
-        return ThunkCondition(lambda item, scope: (value, scope))
+        return describe(
+            ThunkCondition(lambda item, scope: (value, scope)), "const", [value]
+        )
 
     @staticmethod
     def wrap_args(func):
@@ -73,7 +114,9 @@ class Condition(ABC):
 
     @staticmethod
     def map(self, mapper):
-        return MappedCondition(self, mapper)
+        return describe(
+            MappedCondition(self, mapper), "map", [self, mapper], Condition.map
+        )
 
     @staticmethod
     def apply(func, *args):
@@ -137,26 +180,46 @@ class Condition(ABC):
         return self.__wrap_binary_op(other, op.truediv, float, True)
 
     def __call__(self, *args, **kwargs):
-        return Condition.map(self, lambda f: f(*args, **kwargs))
+        return describe(
+            Condition.map(self, lambda f: f(*args, **kwargs)),
+            "call",
+            [self, args, kwargs],
+            lambda s, a, k: Condition.__call__(s, *a, **k),
+        )
 
     def __getattr__(self, name):
         """Priority: __getattr__ > __getitem__"""
-        return Condition.map(self, get_attr_or_item(name))
+        return describe(
+            Condition.map(self, get_attr_or_item(name)),
+            "attr",
+            [self, name],
+            Condition.__getattr__,
+        )
 
     def __getitem__(self, item):
         """Priority: __getitem__ > __getattr__"""
-        return Condition.map(self, get_item_or_attr(item))
+        return describe(
+            Condition.map(self, get_item_or_attr(item)),
+            "item",
+            [self, item],
+            Condition.__getitem__,
+        )
 
-    def __wrap_binary_op(self, other, op, coerce=lambda x: x, swap=False):
+    def __wrap_binary_op(self, other, op, coerce=_identity, swap=False):
         other = Condition.wrap(other)
-        return Condition.flatmap(
-            self,
-            lambda x: Condition.map(
-                other,
-                lambda y: (
-                    op(coerce(y), coerce(x)) if swap else op(coerce(x), coerce(y))
+        return describe(
+            Condition.flatmap(
+                self,
+                lambda x: Condition.map(
+                    other,
+                    lambda y: (
+                        op(coerce(y), coerce(x)) if swap else op(coerce(x), coerce(y))
+                    ),
                 ),
             ),
+            "binop",
+            [self, other, op, coerce, swap],
+            Condition.__wrap_binary_op,
         )
 
     def __bool__(self):
@@ -177,6 +240,7 @@ class Condition(ABC):
 
 def get_attr_or_item(name):
     def __get_attr_or_item(x):
+        x = resolve(x)
         try:
             if hasattr(x, name):
                 return getattr(x, name)
@@ -191,6 +255,7 @@ def get_attr_or_item(name):
 
 def get_item_or_attr(item):
     def __get_item_or_attr(x):
+        x = resolve(x)
         try:
             if hasattr(x, "__getitem__"):
                 return x[item]
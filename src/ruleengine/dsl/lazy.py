@@ -0,0 +1,107 @@
+# Copyright 2024 coScene
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+
+_UNDECODED = object()
+# Taken for first decodes only, which the read-ahead thread of the readers
+# and the action threads may race on
+_decode_lock = threading.Lock()
+
+
+class Decoder:
+    """
+    Base class of the decode functions that can be pickled, so that a
+    LazyMessage using one is sent to other processes undecoded.
+    """
+
+    __slots__ = ()
+
+    def __call__(self, data):
+        raise NotImplementedError
+
+
+class LazyMessage:
+    """
+    A message kept serialized until it is first read. It can be used as the
+    `msg` of a DiagnosisItem: the `msg` condition decodes it on first use and
+    every later use, by any rule, gets the same decoded message. Items rejected
+    on their topic or msgtype alone are never decoded.
+
+    Attribute and item accesses are forwarded to the decoded message, for
+    callbacks handed the item. It can be resolved from any thread, the message
+    is decoded once.
+    """
+
+    __slots__ = ("_decode", "_data", "_value")
+
+    def __init__(self, decode, data):
+        """
+        :param decode: A function from data to the decoded message.
+        :param data: The serialized message.
+        """
+        self._decode = decode
+        self._data = data
+        self._value = _UNDECODED
+
+    @property
+    def decoded(self):
+        return self._value is not _UNDECODED
+
+    @property
+    def value(self):
+        """The decoded message, decoding it on first access"""
+        value = self._value
+        if value is _UNDECODED:
+            with _decode_lock:
+                value = self._value
+                if value is _UNDECODED:
+                    value = self._value = self._decode(self._data)
+                    # The serialized form is not needed anymore
+                    self._decode = self._data = None
+        return value
+
+    def __getattr__(self, name):
+        return getattr(self.value, name)
+
+    def __getitem__(self, key):
+        return self.value[key]
+
+    def __reduce__(self):
+        decode, data = self._decode, self._data
+        if isinstance(decode, Decoder) and data is not None:
+            return LazyMessage, (decode, data)
+        # Other decode functions may not be picklable, the message is sent instead
+        return _decoded, (self.value,)
+
+    def __repr__(self):
+        if self.decoded:
+            return f"LazyMessage({self._value!r})"
+        return "LazyMessage(<undecoded>)"
+
+
+def _decoded(value):
+    return value
+
+
+def resolve(value):
+    """The decoded message if value is a LazyMessage, else value itself"""
+    return value.value if isinstance(value, LazyMessage) else value
+
+
+__all__ = [
+    "Decoder",
+    "LazyMessage",
+    "resolve",
+]
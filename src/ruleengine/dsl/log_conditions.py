@@ -32,13 +32,6 @@ log = or_(
     "",
 )
 
-log_level = or_(
-    and_(_is_ros, Condition.map(msg, lambda m: ros_log_level(m.level))),
-    and_(_is_foxglove, Condition.map(msg, lambda m: foxglove_log_level(m.level))),
-    # Default case
-    LogLevel.UNKNOWN,
-)
-
 
 def ros_log_level(num):
     if num == 1:
@@ -48,7 +41,7 @@ def ros_log_level(num):
     elif num == 4:
         return LogLevel.WARN
     elif num == 8:
-        return LogLevel.ERR
+        return LogLevel.ERROR
     elif num == 16:
         return LogLevel.FATAL
     else:
@@ -70,6 +63,14 @@ def foxglove_log_level(num):
         return LogLevel.UNKNOWN
 
 
+log_level = or_(
+    and_(_is_ros, Condition.map(msg.level, ros_log_level)),
+    and_(_is_foxglove, Condition.map(msg.level, foxglove_log_level)),
+    # Default case
+    LogLevel.UNKNOWN,
+)
+
+
 __all__ = [
     "log",
     "log_level",
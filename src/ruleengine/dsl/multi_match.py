@@ -0,0 +1,194 @@
+# Copyright 2024 coScene
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Multi-pattern substring matching for `has` conditions.
+
+The normalizer turns every `"literal" in msg` into `has(msg, "literal")`, and
+log rules tend to check hundreds of literals against the same string. Instead
+of scanning the string once per literal, all constant needles checked against
+the same subject are collected into one Aho-Corasick automaton, which finds
+all of them in a single pass over the string.
+"""
+
+from .analysis import rewrite, structural_key, walk
+from .condition import Condition, describe
+from .scope import extend
+
+
+class AhoCorasick:
+    """Finds all occurrences of a set of needles in one pass over a text"""
+
+    def __init__(self, needles):
+        # State 0 is the root of the trie, goto holds the trie edges of each
+        # state and out the needles ending at each state
+        goto = [{}]
+        out = [set()]
+        for needle in needles:
+            state = 0
+            for ch in needle:
+                next_state = goto[state].get(ch)
+                if next_state is None:
+                    goto.append({})
+                    out.append(set())
+                    next_state = goto[state][ch] = len(goto) - 1
+                state = next_state
+            out[state].add(needle)
+
+        # Breadth first, so that the fail link of the parent is always known
+        fail = [0] * len(goto)
+        queue = list(goto[0].values())
+        while queue:
+            next_queue = []
+            for state in queue:
+                for ch, child in goto[state].items():
+                    f = fail[state]
+                    while f and ch not in goto[f]:
+                        f = fail[f]
+                    fail[child] = goto[f].get(ch, 0)
+                    out[child] |= out[fail[child]]
+                    next_queue.append(child)
+            queue = next_queue
+
+        self.__goto = goto
+        self.__fail = fail
+        self.__out = [frozenset(o) for o in out]
+
+    def find(self, text):
+        """Set of the needles found in text"""
+        goto, fail, out = self.__goto, self.__fail, self.__out
+        # The empty needle, if any, is always found
+        found = set(out[0])
+        state = 0
+        for ch in text:
+            edges = goto[state]
+            while state and ch not in edges:
+                state = fail[state]
+                edges = goto[state]
+            state = edges.get(ch, 0)
+            if out[state]:
+                found |= out[state]
+        return found
+
+
+class SubstringScan:
+    """
+    An automaton shared by all the `has` conditions over the same subject.
+
+    The result of the last scan is kept, so that the subject string is only
+    scanned once per item no matter how many conditions read from it.
+    """
+
+    def __init__(self, needles):
+        self.needles = frozenset(needles)
+        self.__automaton = AhoCorasick(self.needles)
+        self.__last_text = None
+        self.__last_found = frozenset()
+
+    def matches(self, text):
+        if text is not self.__last_text and text != self.__last_text:
+            self.__last_found = self.__automaton.find(text)
+            self.__last_text = text
+        return self.__last_found
+
+
+class SharedHasCondition(Condition):
+    """
+    Equivalent to `has(parent, needle)` for a constant needle, reading the
+    answer from a shared scan when the parent evaluates to a string.
+    """
+
+    def __init__(self, parent, needle, scan):
+        super().__init__()
+        self.__parent = parent
+        self.__needle = needle
+        self.__scan = scan
+        describe(self, "shared_has", [parent, needle, scan], SharedHasCondition)
+
+    def evaluate_condition_at(self, item, scope):
+        p, scope = self.__parent.evaluate_condition_at(item, scope)
+        if p is None:
+            return None, scope
+
+        c = self.__needle
+        if type(p) is str:
+            found = c in self.__scan.matches(p)
+        else:
+            # Not a substring check, e.g. a membership check on a list
+            found = c in p
+        return found, extend(scope, "cos/contains", c if found else None)
+
+
+def share_substring_scans(condition_lists, min_needles=2):
+    """
+    Rewrite the `has` conditions with constant string needles, so that those
+    over the same subject share one SubstringScan. Subjects with fewer than
+    min_needles distinct needles are left alone.
+
+    Takes and returns a list of condition lists, one per rule.
+    """
+    key_memo = {}
+    needles_by_subject = {}
+    for conditions in condition_lists:
+        for cond in conditions:
+            for node in walk(cond):
+                subject_key, needle = _has_subject(node, key_memo)
+                if subject_key is not None:
+                    needles_by_subject.setdefault(subject_key, set()).add(needle)
+
+    scans = {
+        subject_key: SubstringScan(needles)
+        for subject_key, needles in needles_by_subject.items()
+        if len(needles) >= min_needles
+    }
+    if not scans:
+        return condition_lists
+
+    def replace(cond):
+        subject_key, needle = _has_subject(cond, key_memo)
+        if subject_key not in scans:
+            return cond
+        parent = cond._node.operands[0]
+        return SharedHasCondition(parent, needle, scans[subject_key])
+
+    rewrite_memo = {}
+    return [
+        [rewrite(cond, replace, rewrite_memo) for cond in conditions]
+        for conditions in condition_lists
+    ]
+
+
+def _has_subject(cond, key_memo):
+    node = getattr(cond, "_node", None)
+    if node is None or node.kind != "has":
+        return None, None
+    parent, child = node.operands
+    child_node = child._node
+    if child_node is None or child_node.kind != "const":
+        return None, None
+    needle = child_node.operands[0]
+    if type(needle) is not str:
+        return None, None
+    parent_node = parent._node
+    if parent_node is None or parent_node.kind == "const":
+        return None, None
+    return structural_key(parent, key_memo), needle
+
+
+__all__ = [
+    "AhoCorasick",
+    "SharedHasCondition",
+    "SubstringScan",
+    "share_substring_scans",
+]
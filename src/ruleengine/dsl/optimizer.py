@@ -0,0 +1,53 @@
+# Copyright 2024 coScene
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Rule set wide optimization passes, run by the engine when rules are loaded.
+
+Each pass takes the conditions of all rules (a list of condition lists, one per
+rule) and returns rewritten ones that evaluate to the same results. The rules
+themselves are left untouched, stateful conditions are shared between the
+original and the rewritten trees.
+"""
+
+from .compiler import CompiledCondition, compile_condition
+from .multi_match import share_substring_scans
+from .regex_set import share_regex_scans
+from .sharing import share_subexpressions
+
+PASSES = [
+    share_substring_scans,
+    share_regex_scans,
+    share_subexpressions,
+]
+
+
+def optimize_conditions(condition_lists):
+    result = condition_lists
+    for optimization_pass in PASSES:
+        result = optimization_pass(result)
+
+    # Rewritten trees are interpreted, compile them again if they were
+    # compiled in the first place
+    return [
+        [
+            (
+                compile_condition(new)
+                if isinstance(old, CompiledCondition) and new is not old
+                else new
+            )
+            for old, new in zip(old_conditions, new_conditions)
+        ]
+        for old_conditions, new_conditions in zip(condition_lists, result)
+    ]
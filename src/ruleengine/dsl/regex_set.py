@@ -0,0 +1,222 @@
+# Copyright 2024 coScene
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Matching many regular expressions against the same string.
+
+Python's `re` has no way to report which alternatives of a combined pattern
+match, and a plain alternation isn't faster than searching the patterns one by
+one. Instead, a literal string that any match must contain is extracted from
+each pattern, and all of these are found in a single Aho-Corasick pass over the
+text. Only the patterns whose literal was found are then actually searched.
+Patterns without a usable literal are always searched.
+"""
+
+import re
+
+from .analysis import rewrite, structural_key, walk
+from .condition import Condition, describe
+from .multi_match import AhoCorasick
+from .scope import extend
+
+try:
+    from re import _constants as sre_constants, _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_constants
+    import sre_parse
+
+# Shorter literals would match almost every text
+MIN_LITERAL_LENGTH = 2
+
+
+class RegexSet:
+    """A set of patterns, searched together against the same text"""
+
+    def __init__(self, patterns):
+        self.patterns = list(dict.fromkeys(patterns))
+        self.__compiled = {p: re.compile(p) for p in self.patterns}
+
+        self.__by_literal = {}
+        self.__always = []
+        for pattern in self.patterns:
+            literal = required_literal(pattern)
+            if literal is None:
+                self.__always.append(pattern)
+            else:
+                self.__by_literal.setdefault(literal, []).append(pattern)
+        self.__literals = AhoCorasick(self.__by_literal)
+
+    def search(self, text):
+        """
+        Search all patterns in text, and return a dict from each matched
+        pattern to its match object, which is the same as `re.search` returns.
+        """
+        compiled = self.__compiled
+        candidates = [
+            pattern
+            for literal in self.__literals.find(text)
+            for pattern in self.__by_literal[literal]
+        ]
+        candidates.extend(self.__always)
+
+        result = {}
+        for pattern in candidates:
+            match = compiled[pattern].search(text)
+            if match is not None:
+                result[pattern] = match
+        return result
+
+
+def required_literal(pattern):
+    """
+    Find a literal string that every match of the pattern contains, or None.
+    This is the longest run of literal characters in the top level sequence of
+    the pattern, i.e. outside of any repetition, alternation or lookaround.
+    """
+    if not isinstance(pattern, str):
+        return None
+    try:
+        parsed = sre_parse.parse(pattern)
+    except Exception:
+        return None
+    if parsed.state.flags & (re.IGNORECASE | re.VERBOSE):
+        return None
+
+    runs = [[]]
+
+    def visit(items):
+        for op, arg in items:
+            if op is sre_constants.LITERAL:
+                runs[-1].append(chr(arg))
+            elif op is sre_constants.SUBPATTERN and not arg[1] and not arg[2]:
+                # A group without flags, its content is part of the sequence
+                visit(arg[3])
+            else:
+                runs.append([])
+
+    visit(parsed.data)
+    literal = max(("".join(run) for run in runs), key=len)
+    return literal if len(literal) >= MIN_LITERAL_LENGTH else None
+
+
+class RegexScan:
+    """
+    A RegexSet shared by all the `regex` conditions over the same subject. The
+    result of the last search is kept, so that the subject string is only
+    searched once per item.
+    """
+
+    def __init__(self, patterns):
+        self.regex_set = RegexSet(patterns)
+        self.__last_text = None
+        self.__last_matches = {}
+
+    def matches(self, text):
+        if text is not self.__last_text and text != self.__last_text:
+            self.__last_matches = self.regex_set.search(text)
+            self.__last_text = text
+        return self.__last_matches
+
+
+class SharedRegexCondition(Condition):
+    """
+    Equivalent to `regex(value, pattern)` for a constant pattern, reading the
+    match from a shared scan when the value is a string.
+    """
+
+    def __init__(self, value, pattern, scan):
+        super().__init__()
+        self.__value = value
+        self.__pattern = pattern
+        self.__scan = scan
+        describe(self, "shared_regex", [value, pattern, scan], SharedRegexCondition)
+
+    def evaluate_condition_at(self, item, scope):
+        v, scope = self.__value.evaluate_condition_at(item, scope)
+        if v is None:
+            return None, scope
+
+        if type(v) is str:
+            match = self.__scan.matches(v).get(self.__pattern)
+        else:
+            # Let re raise the same errors as the regex condition
+            match = re.search(self.__pattern, v)
+        if match is None:
+            return None, scope
+        return match, extend(scope, "cos/regex", match)
+
+
+def share_regex_scans(condition_lists, min_patterns=2):
+    """
+    Rewrite the `regex` conditions with constant patterns, so that those over
+    the same subject share one RegexScan. Subjects with fewer than min_patterns
+    distinct patterns are left alone, and so are invalid patterns.
+
+    Takes and returns a list of condition lists, one per rule.
+    """
+    key_memo = {}
+    patterns_by_subject = {}
+    for conditions in condition_lists:
+        for cond in conditions:
+            for node in walk(cond):
+                subject_key, pattern = _regex_subject(node, key_memo)
+                if subject_key is not None:
+                    patterns_by_subject.setdefault(subject_key, set()).add(pattern)
+
+    scans = {
+        subject_key: RegexScan(sorted(patterns))
+        for subject_key, patterns in patterns_by_subject.items()
+        if len(patterns) >= min_patterns
+    }
+    if not scans:
+        return condition_lists
+
+    def replace(cond):
+        subject_key, pattern = _regex_subject(cond, key_memo)
+        if subject_key not in scans:
+            return cond
+        value = cond._node.operands[0]
+        return SharedRegexCondition(value, pattern, scans[subject_key])
+
+    rewrite_memo = {}
+    return [
+        [rewrite(cond, replace, rewrite_memo) for cond in conditions]
+        for conditions in condition_lists
+    ]
+
+
+def _regex_subject(cond, key_memo):
+    node = getattr(cond, "_node", None)
+    if node is None or node.kind != "regex":
+        return None, None
+    value, pattern = node.operands
+    if type(pattern) is not str:
+        return None, None
+    try:
+        re.compile(pattern)
+    except re.error:
+        return None, None
+    value_node = value._node
+    if value_node is None or value_node.kind == "const":
+        return None, None
+    return structural_key(value, key_memo), pattern
+
+
+__all__ = [
+    "RegexScan",
+    "RegexSet",
+    "SharedRegexCondition",
+    "required_literal",
+    "share_regex_scans",
+]
@@ -0,0 +1,112 @@
+# Copyright 2024 coScene
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from collections.abc import Mapping
+
+# Chains longer than this are flattened when a key is added, which keeps the
+# lookups short even when a scope is extended over and over
+MAX_DEPTH = 16
+
+
+class Scope(Mapping):
+    """
+    Immutable mapping holding the variables of an evaluation.
+
+    Adding a key with `set` is O(1): the new scope only records the key and
+    value, and shares all the other entries with the scope it was made from.
+    Otherwise it behaves like a read-only dict.
+    """
+
+    __slots__ = ("_parent", "_key", "_value", "_depth", "_items")
+
+    def __init__(self, items=()):
+        self._parent = None
+        self._key = None
+        self._value = None
+        self._depth = 0
+        self._items = dict(items)
+
+    def set(self, key, value):
+        """Return a new scope with key set to value"""
+        if self._depth >= MAX_DEPTH:
+            return Scope({**self._materialize(), key: value})
+
+        hash(key)  # Unhashable keys fail here, as they do with a dict
+        scope = object.__new__(Scope)
+        scope._parent = self
+        scope._key = key
+        scope._value = value
+        scope._depth = self._depth + 1
+        scope._items = None
+        return scope
+
+    def _materialize(self):
+        if self._items is None:
+            items = dict(self._parent._materialize())
+            items[self._key] = self._value
+            self._items = items
+        return self._items
+
+    def __getitem__(self, key):
+        scope = self
+        while scope._items is None:
+            if scope._key == key:
+                return scope._value
+            scope = scope._parent
+        return scope._items[key]
+
+    def __contains__(self, key):
+        scope = self
+        while scope._items is None:
+            if scope._key == key:
+                return True
+            scope = scope._parent
+        return key in scope._items
+
+    def get(self, key, default=None):
+        scope = self
+        while scope._items is None:
+            if scope._key == key:
+                return scope._value
+            scope = scope._parent
+        return scope._items.get(key, default)
+
+    def __iter__(self):
+        return iter(self._materialize())
+
+    def __len__(self):
+        return len(self._materialize())
+
+    def __bool__(self):
+        # Without materializing, a scope with an added key is never empty
+        return self._items is None or bool(self._items)
+
+    def __repr__(self):
+        return f"Scope({self._materialize()!r})"
+
+
+def extend(scope, key, value):
+    """
+    Return scope with key set to value, without modifying it. Plain dicts
+    are copied, as they always have been.
+    """
+    if type(scope) is Scope:
+        return scope.set(key, value)
+    return {**scope, key: value}
+
+
+__all__ = [
+    "Scope",
+    "extend",
+]
@@ -14,6 +14,8 @@
 
 from .base_conditions import and_
 from .condition import Condition
+from .scope import extend
+from .state import StatefulCondition, get_state, set_state, stateful_conditions
 
 
 def sustained(context_condition, variable_condition, duration):
@@ -59,7 +61,7 @@ def throttle(condition, duration):
     return ThrottleCondition(condition, duration)
 
 
-class RisingEdgeCondition(Condition):
+class RisingEdgeCondition(StatefulCondition):
     """
     A condition that detects when child condition changes from false to true.
 
@@ -77,6 +79,7 @@ class RisingEdgeCondition(Condition):
         self.__active = False
         self.__last_activation = None
         self.__max_gap = max_gap
+        self.__children = stateful_conditions(condition)
 
     def evaluate_condition_at(self, item, scope):
         value, new_scope = self.__condition.evaluate_condition_at(item, scope)
@@ -94,8 +97,18 @@ class RisingEdgeCondition(Condition):
         self.__last_activation = item.ts
         return True, new_scope
 
+    def _children(self):
+        return [self.__condition]
 
-class SustainedCondition(Condition):
+    def _get_state(self):
+        return self.__active, self.__last_activation, get_state(self.__children)
+
+    def _set_state(self, state):
+        self.__active, self.__last_activation, children = state
+        set_state(self.__children, children)
+
+
+class SustainedCondition(StatefulCondition):
     """
     This condition triggers when the child condition is true for the given
     duration.
@@ -109,6 +122,7 @@ class SustainedCondition(Condition):
         self.__condition = condition
         self.__duration = duration
         self.__start = None
+        self.__children = stateful_conditions(condition)
 
     def evaluate_condition_at(self, item, scope):
         value, new_scope = self.__condition.evaluate_condition_at(item, scope)
@@ -120,12 +134,22 @@ class SustainedCondition(Condition):
             self.__start = item.ts
 
         if item.ts - self.__start > self.__duration:
-            return True, {**new_scope, "start_time": self.__start}
+            return True, extend(new_scope, "start_time", self.__start)
 
         return False, new_scope
 
+    def _children(self):
+        return [self.__condition]
+
+    def _get_state(self):
+        return self.__start, get_state(self.__children)
+
+    def _set_state(self, state):
+        self.__start, children = state
+        set_state(self.__children, children)
 
-class SequenceMatchCondition(Condition):
+
+class SequenceMatchCondition(StatefulCondition):
     """
     This condition triggers when the child conditions are true in the given
     order, and within the given duration if set.
@@ -164,10 +188,9 @@ class SequenceMatchCondition(Condition):
             and self.__start_time is not None
             and item.ts - self.__start_time > self.__duration
         ):
-            ret = bool(self.__trigger_on_timeout), {
-                **self.__current_scope,
-                "start_time": self.__start_time,
-            }
+            ret = bool(self.__trigger_on_timeout), extend(
+                self.__current_scope, "start_time", self.__start_time
+            )
             self._reset()
             return ret
 
@@ -177,10 +200,9 @@ class SequenceMatchCondition(Condition):
         if matched:
             self.__current_index += 1
             if self.__current_index == len(self.__seq):
-                ret = not self.__trigger_on_timeout, {
-                    **new_scope,
-                    "start_time": self.__start_time,
-                }
+                ret = not self.__trigger_on_timeout, extend(
+                    new_scope, "start_time", self.__start_time
+                )
                 self._reset()
                 return ret
 
@@ -190,8 +212,30 @@ class SequenceMatchCondition(Condition):
 
         return False, scope
 
+    def _children(self):
+        return list(self.__seq)
+
+    def _get_state(self):
+        return (
+            self.__start_time,
+            self.__current_index,
+            self.__current_scope,
+            [get_state(stateful_conditions(c)) for c in self.__seq],
+        )
+
+    def _set_state(self, state):
+        start_time, current_index, current_scope, children = state
+        if not 0 <= current_index < len(self.__seq) or len(children) != len(self.__seq):
+            raise ValueError("the state doesn't match the sequence")
+        self._reset()
+        self.__start_time = start_time
+        self.__current_index = current_index
+        self.__current_scope = current_scope
+        for c, s in zip(self.__seq, children):
+            set_state(stateful_conditions(c), s)
+
 
-class RepeatedCondition(Condition):
+class RepeatedCondition(StatefulCondition):
     """
     This condition triggers when the child condition is true for the given
     number of times within the given duration.
@@ -203,6 +247,7 @@ class RepeatedCondition(Condition):
         self.__times = times
         self.__duration = duration
         self.__trigger_times = []
+        self.__children = stateful_conditions(condition)
 
     def evaluate_condition_at(self, item, scope):
         value, new_scope = self.__condition.evaluate_condition_at(item, scope)
@@ -216,12 +261,23 @@ class RepeatedCondition(Condition):
         ]
 
         if len(self.__trigger_times) >= self.__times:
-            return True, {**new_scope, "start_time": self.__trigger_times[0]}
+            return True, extend(new_scope, "start_time", self.__trigger_times[0])
 
         return False, scope
 
+    def _children(self):
+        return [self.__condition]
+
+    def _get_state(self):
+        return list(self.__trigger_times), get_state(self.__children)
+
+    def _set_state(self, state):
+        trigger_times, children = state
+        self.__trigger_times = list(trigger_times)
+        set_state(self.__children, children)
 
-class ThrottleCondition(Condition):
+
+class ThrottleCondition(StatefulCondition):
     """
     This condition triggers when the child condition is true, but only if the
     last trigger is more than the given duration ago.
@@ -232,6 +288,7 @@ class ThrottleCondition(Condition):
         self.__condition = condition
         self.__duration = duration
         self.__last_trigger = -duration
+        self.__children = stateful_conditions(condition)
 
     def evaluate_condition_at(self, item, scope):
         if item.ts - self.__last_trigger < self.__duration:
@@ -244,8 +301,18 @@ class ThrottleCondition(Condition):
 
         return False, scope
 
+    def _children(self):
+        return [self.__condition]
+
+    def _get_state(self):
+        return self.__last_trigger, get_state(self.__children)
 
-class AnyOrderCondition(Condition):
+    def _set_state(self, state):
+        self.__last_trigger, children = state
+        set_state(self.__children, children)
+
+
+class AnyOrderCondition(StatefulCondition):
     """
     This condition triggers when all the child conditions are true, but the
     order of the conditions does not matter.
@@ -255,7 +322,8 @@ class AnyOrderCondition(Condition):
     def __init__(self, condition_factories, reset_time=None):
         self.__factories = condition_factories
         self.__reset_time = reset_time
-        self.__unsatisfied = [factory() for factory in condition_factories]
+        self.__conditions = [factory() for factory in condition_factories]
+        self.__unsatisfied = list(self.__conditions)
         self.__curr_scope = None
         self.__start_time = None
 
@@ -288,9 +356,34 @@ class AnyOrderCondition(Condition):
         return False, self.__curr_scope
 
     def reset(self):
-        self.__unsatisfied = [factory() for factory in self.__factories]
+        self.__conditions = [factory() for factory in self.__factories]
+        self.__unsatisfied = list(self.__conditions)
         self.__start_time = None
 
+    def _children(self):
+        return list(self.__conditions)
+
+    def _get_state(self):
+        unsatisfied = {id(c) for c in self.__unsatisfied}
+        indices = [i for i, c in enumerate(self.__conditions) if id(c) in unsatisfied]
+        return (
+            indices,
+            [get_state(stateful_conditions(c)) for c in self.__unsatisfied],
+            self.__curr_scope,
+            self.__start_time,
+        )
+
+    def _set_state(self, state):
+        indices, children, curr_scope, start_time = state
+        if len(children) != len(indices):
+            raise ValueError("the state doesn't match the conditions")
+        self.reset()
+        self.__unsatisfied = [self.__conditions[i] for i in indices]
+        for c, s in zip(self.__unsatisfied, children):
+            set_state(stateful_conditions(c), s)
+        self.__curr_scope = curr_scope
+        self.__start_time = start_time
+
 
 __all__ = [
     "any_order",
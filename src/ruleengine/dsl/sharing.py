@@ -0,0 +1,199 @@
+# Copyright 2024 coScene
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Sharing of common subexpressions between rules.
+
+Rules tend to dereference the same paths, e.g. `msg.level`, `log` or
+`log_level`. Structurally identical stateless nodes are first merged into one
+node (hash-consing), and the merged nodes used in more than one place are then
+memoized, so that they are evaluated once per item no matter how many rules
+use them.
+
+Only pure nodes are memoized, i.e. nodes whose value depends on the item alone
+and which leave the scope untouched. `has`, `regex`, `get_value` and friends
+read or write the scope, so they are merged but evaluated every time.
+
+Memoized values are kept per item generation, which the engine starts for
+each item it evaluates, see `start_item`. Items may be mutated and fed again,
+so the identity of the item is not enough. Outside of a generation, e.g.
+conditions evaluated directly, nothing is memoized.
+"""
+
+import itertools
+import threading
+
+from .analysis import children, rewrite, structural_key, walk
+from .condition import Condition, describe
+
+# Kinds of nodes that neither read nor write the scope
+PURE_KINDS = frozenset(
+    [
+        "const",
+        "field",
+        "map",
+        "call",
+        "attr",
+        "item",
+        "binop",
+        "and",
+        "or",
+        "not",
+        "is_none",
+        "concat",
+        "map_attr",
+        "func_apply",
+        "memo",
+    ]
+)
+
+# Pure kinds that are cheaper to evaluate than to memoize
+_TRIVIAL_KINDS = frozenset(["const", "field", "memo"])
+
+
+class _Generation(threading.local):
+    # None outside of the evaluation of an item
+    value = None
+
+
+# Unique across the threads and engines
+_generations = itertools.count()
+current_generation = _Generation()
+
+
+def start_item():
+    """Start the evaluation of an item, the memoized values are stale from now"""
+    current_generation.value = next(_generations)
+
+
+def end_items():
+    """End the evaluation of the items, nothing is memoized until the next"""
+    current_generation.value = None
+
+
+class MemoCell:
+    """The last item generation a memoized node was evaluated at, and its value"""
+
+    __slots__ = ("generation", "value")
+
+    def __init__(self):
+        self.generation = None
+        self.value = None
+
+
+class MemoizedCondition(Condition):
+    """
+    Evaluates a pure condition once per item generation. The value is kept
+    until the condition is evaluated within another generation.
+    """
+
+    def __init__(self, inner, cell=None):
+        super().__init__()
+        self.__inner = inner
+        self.__cell = MemoCell() if cell is None else cell
+        describe(self, "memo", [inner, self.__cell], MemoizedCondition)
+
+    def evaluate_condition_at(self, item, scope):
+        cell = self.__cell
+        generation = current_generation.value
+        if generation is None or cell.generation != generation:
+            # Pure conditions return the scope unchanged
+            cell.value, _ = self.__inner.evaluate_condition_at(item, scope)
+            cell.generation = generation
+        return cell.value, scope
+
+
+def is_pure(cond, memo=None):
+    """Whether the value of a condition only depends on the item"""
+    if memo is None:
+        memo = {}
+    if id(cond) not in memo:
+        node = getattr(cond, "_node", None)
+        pure = (
+            node is not None
+            and node.kind in PURE_KINDS
+            and all(is_pure(child, memo) for child in children(cond))
+        )
+        memo[id(cond)] = (cond, pure)
+    return memo[id(cond)][1]
+
+
+def share_subexpressions(condition_lists):
+    """
+    Merge the structurally identical stateless nodes of all rules, and
+    memoize the pure ones that are used more than once.
+
+    Takes and returns a list of condition lists, one per rule.
+    """
+    key_memo = {}
+    canonical = {}
+
+    def merge(cond):
+        key = structural_key(cond, key_memo)
+        if key is None:
+            return cond
+        return canonical.setdefault(key, cond)
+
+    merge_memo = {}
+    merged = [
+        [rewrite(cond, merge, merge_memo) for cond in conditions]
+        for conditions in condition_lists
+    ]
+
+    # Count the uses of each node, the same node may appear several times in
+    # one parent, or be the condition of several rules
+    uses = {}
+    seen = set()
+    for conditions in merged:
+        for cond in conditions:
+            uses[id(cond)] = uses.get(id(cond), 0) + 1
+            for node in walk(cond, seen):
+                for child in children(node):
+                    uses[id(child)] = uses.get(id(child), 0) + 1
+
+    pure_memo = {}
+    memo = {}
+
+    def memoize(cond):
+        if id(cond) in memo:
+            return memo[id(cond)][1]
+        result = cond
+        node = getattr(cond, "_node", None)
+        if node is not None and node.rebuild is not None:
+            operands = [
+                memoize(operand) if isinstance(operand, Condition) else operand
+                for operand in node.operands
+            ]
+            if any(new is not old for new, old in zip(operands, node.operands)):
+                result = node.rebuild(*operands)
+            if (
+                uses.get(id(cond), 0) > 1
+                and node.kind not in _TRIVIAL_KINDS
+                and is_pure(cond, pure_memo)
+            ):
+                result = MemoizedCondition(result)
+        memo[id(cond)] = (cond, result)
+        return result
+
+    return [[memoize(cond) for cond in conditions] for conditions in merged]
+
+
+__all__ = [
+    "MemoizedCondition",
+    "PURE_KINDS",
+    "end_items",
+    "is_pure",
+    "share_subexpressions",
+    "start_item",
+]
@@ -0,0 +1,96 @@
+# Copyright 2024 coScene
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Saving and restoring the state of the stateful conditions in a tree.
+
+The structural nodes of a tree hold no state, so the state of a condition is
+the state of the stateful conditions found under it, in a fixed traversal
+order. Two trees built from the same rule text therefore have states that
+can be exchanged.
+"""
+
+from abc import abstractmethod
+
+from .condition import Condition
+
+
+class StatefulCondition(Condition):
+    """
+    A condition keeping state from one item to the next.
+
+    `_get_state` returns the state as plain values (numbers, lists, tuples,
+    scopes) along with the state of any stateful children, and `_set_state`
+    puts back what `_get_state` returned on an identically built condition.
+    """
+
+    @abstractmethod
+    def _get_state(self):
+        pass
+
+    @abstractmethod
+    def _set_state(self, state):
+        pass
+
+    def _children(self):
+        """The conditions it evaluates, for static analysis. None if unknown."""
+        return None
+
+
+def stateful_conditions(cond):
+    """
+    The outermost stateful conditions under cond, in traversal order. Their
+    own stateful children are handled by their `_get_state` and `_set_state`.
+    """
+    result = []
+    seen = set()
+
+    def visit(c):
+        if id(c) in seen:
+            return
+        seen.add(id(c))
+        if isinstance(c, StatefulCondition):
+            result.append(c)
+            return
+        node = c._node
+        if node is None:
+            return
+        for operand in node.operands:
+            if isinstance(operand, Condition):
+                visit(operand)
+
+    visit(cond)
+    return result
+
+
+def get_state(conditions):
+    """The state of a list of stateful conditions, see `stateful_conditions`"""
+    return [c._get_state() for c in conditions]
+
+
+def set_state(conditions, state):
+    if len(state) != len(conditions):
+        raise ValueError(
+            f"expected the state of {len(conditions)} conditions, got {len(state)}"
+        )
+    for c, s in zip(conditions, state):
+        c._set_state(s)
+
+
+__all__ = [
+    "StatefulCondition",
+    "get_state",
+    "set_state",
+    "stateful_conditions",
+]
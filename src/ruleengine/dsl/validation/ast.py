@@ -14,11 +14,17 @@
 
 import ast
 
+from ruleengine.dsl.compiler import compile_condition
 from .normalizer import normalize_expression_tree
 from .validation_result import ValidationErrorType, ValidationResult
 
 
-def validate_expression(expr_str, injected_values):
+def validate_expression(expr_str, injected_values, compiled=False):
+    """
+    Parse and evaluate a DSL expression. If compiled is set, the resulting
+    condition is compiled into a flat Python function (see `compile_condition`)
+    instead of being interpreted as a tree of thunks.
+    """
     try:
         parsed = ast.parse(expr_str, mode="eval")
     except SyntaxError:
@@ -33,5 +39,8 @@ def validate_expression(expr_str, injected_values):
                 )
 
     code = compile(normalize_expression_tree(parsed), "", mode="eval")
+    entity = eval(code, injected_values)
+    if compiled:
+        entity = compile_condition(entity)
 
-    return ValidationResult(True, entity=eval(code, injected_values))
+    return ValidationResult(True, entity=entity)
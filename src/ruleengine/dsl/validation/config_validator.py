@@ -13,7 +13,9 @@
 # limitations under the License.
 
 import copy
+from collections import deque
 
+from ruleengine.checkpoint import content_key, rule_key
 from ruleengine.dsl.validation.validation_result import ValidationErrorType
 from ruleengine.dsl.validation.validator import validate_action, validate_condition
 from ruleengine.engine import Rule
@@ -21,7 +23,7 @@ from ruleengine.engine import Rule
 ALLOWED_VERSIONS = ["v1"]
 
 
-def validate_config(config, action_impls, project_name=""):
+def validate_config(config, action_impls, project_name="", compiled=False):
     """
     Validate a rule specification. Use validate_config_wrapped instead if action_impls depends on the rule.
 
@@ -36,15 +38,29 @@ def validate_config(config, action_impls, project_name=""):
     :param config: The rule specification.
     :param action_impls: A dictionary of action implementations.
     :param project_name: The name of the project that the rule is associated with.
+    :param compiled: Whether to compile conditions into flat Python functions.
     """
-    # action_impls_wrapped = {k: lambda _: v for k, v in action_impls.items()}
-    action_impls_wrapped = {}
-    for k, v in action_impls.items():
-        action_impls_wrapped[k] = lambda _: v
-    return validate_config_wrapped(config, action_impls_wrapped, project_name)
+    # Bind v as a default, a plain closure would see the last impl only
+    action_impls_wrapped = {k: lambda _, v=v: v for k, v in action_impls.items()}
+    return validate_config_wrapped(config, action_impls_wrapped, project_name, compiled)
 
 
-def validate_config_wrapped(config, action_impls_wrapped, project_name=""):
+def revalidate_config(
+    config, previous_rules, action_impls, project_name="", compiled=False
+):
+    """
+    Validate a new version of a rule specification, reusing the unchanged rules
+    of a previous validation. See revalidate_config_wrapped.
+    """
+    action_impls_wrapped = {k: lambda _, v=v: v for k, v in action_impls.items()}
+    return revalidate_config_wrapped(
+        config, previous_rules, action_impls_wrapped, project_name, compiled
+    )
+
+
+def validate_config_wrapped(
+    config, action_impls_wrapped, project_name="", compiled=False
+):
     """
     Validate a rule specification where the action implementations depend on the rule.
     """
@@ -65,7 +81,9 @@ def validate_config_wrapped(config, action_impls_wrapped, project_name=""):
     rules = []
     for i, rule in enumerate(raw_rules):
         action_impls = {k: v(rule) for k, v in action_impls_wrapped.items()}
-        rule_errors, new_rules = _validate_rule(rule, i, action_impls, project_name)
+        rule_errors, new_rules = _validate_rule(
+            rule, i, action_impls, project_name, compiled
+        )
         errors += rule_errors
         rules += new_rules
 
@@ -73,7 +91,64 @@ def validate_config_wrapped(config, action_impls_wrapped, project_name=""):
     return {"success": success, "errors": errors}, rules
 
 
-def _validate_rule(rule, rule_index, action_impls, project_name):
+def revalidate_config_wrapped(
+    config, previous_rules, action_impls_wrapped, project_name="", compiled=False
+):
+    """
+    Same as validate_config_wrapped, but the rules of previous_rules whose
+    content (spec and project name) is unchanged are returned as they are,
+    along with the state of their conditions. Only the new or changed rules
+    are parsed.
+
+    previous_rules must come from a validation with the same action impls and
+    compiled flag.
+    """
+    raw_version = config.get("version", "")
+    raw_rules = config.get("rules", [])
+
+    if raw_version not in ALLOWED_VERSIONS:
+        return {
+            "success": False,
+            "errors": [{"unexpectedVersion": {"allowedVersions": ALLOWED_VERSIONS}}],
+        }, []
+
+    reusable = {}
+    for rule in previous_rules:
+        reusable.setdefault(rule_key(rule), deque()).append(rule)
+
+    def take(key):
+        candidates = reusable.get(key)
+        return candidates.popleft() if candidates else None
+
+    errors = []
+    rules = []
+    for i, rule in enumerate(raw_rules):
+        # The specs of the rules a templated rule expands to, see _validate_rule
+        templating_args = rule.get("each", [])
+        specs = [{**rule, "each": [arg]} for arg in templating_args] or [rule]
+        keys = [content_key(project_name, spec) for spec in specs]
+
+        reused = [take(key) for key in keys]
+        if all(r is not None for r in reused):
+            rules += reused
+            continue
+        for key, r in reversed(list(zip(keys, reused))):
+            if r is not None:
+                reusable[key].appendleft(r)
+
+        action_impls = {k: v(rule) for k, v in action_impls_wrapped.items()}
+        rule_errors, new_rules = _validate_rule(
+            rule, i, action_impls, project_name, compiled
+        )
+        errors += rule_errors
+        # Unchanged instances of a changed templated rule keep their state
+        rules += [take(key) or new_rule for key, new_rule in zip(keys, new_rules)]
+
+    success = not bool(errors)
+    return {"success": success, "errors": errors}, rules
+
+
+def _validate_rule(rule, rule_index, action_impls, project_name, compiled):
     errors = []
     raw_conditions = rule.get("when", [])
     raw_actions = rule.get("actions", [])
@@ -101,7 +176,7 @@ def _validate_rule(rule, rule_index, action_impls, project_name):
     def parse_rule():
         conditions = []
         for i, cond_str in enumerate(raw_conditions):
-            res = validate_condition(cond_str)
+            res = validate_condition(cond_str, compiled)
             if not res.success:
                 errors.append(
                     {
@@ -28,9 +28,13 @@ base_dsl_values = dict(
 )
 
 
-def validate_condition(cond_str):
+def validate_condition(cond_str, compiled=False):
     return _do_validate(
-        cond_str, base_dsl_values, Condition, ValidationErrorType.NOT_CONDITION
+        cond_str,
+        base_dsl_values,
+        Condition,
+        ValidationErrorType.NOT_CONDITION,
+        compiled,
     )
 
 
@@ -49,12 +53,14 @@ def validate_action(action_str, action_impls):
     )
 
 
-def _do_validate(expr_str, injected_values, expected_class, class_expectation_error):
+def _do_validate(
+    expr_str, injected_values, expected_class, class_expectation_error, compiled=False
+):
     if not expr_str.strip():
         return ValidationResult(False, ValidationErrorType.EMPTY)
 
     try:
-        res = validate_expression(expr_str, injected_values)
+        res = validate_expression(expr_str, injected_values, compiled)
         if not res.success:
             return res
     except UnknownFunctionKeywordArgException as e:
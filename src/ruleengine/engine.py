@@ -12,16 +12,28 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import copy
 import logging
 from dataclasses import dataclass, field
 from typing import Any
 
+from ruleengine import checkpoint
+from ruleengine.dispatch import DispatchIndex
+from ruleengine.dsl.analysis import is_stateless
+from ruleengine.dsl.base_actions import ForwardingAction
+from ruleengine.dsl.optimizer import optimize_conditions
+from ruleengine.dsl.scope import Scope
+from ruleengine.dsl.sharing import end_items, start_item
+from ruleengine.dsl.state import get_state, set_state, stateful_conditions
+from ruleengine.metrics import EngineMetrics, clock
+
 _log = logging.getLogger(__name__)
 
 
 @dataclass
 class DiagnosisItem:
     topic: str
+    # The message, or a LazyMessage decoded when a condition first reads it
     msg: Any
     ts: float
     msgtype: str
@@ -38,46 +50,364 @@ class Rule:
 
 
 class Engine:
-    def __init__(self, rules, should_trigger_action=None, trigger_cb=None):
-        self.__rules = rules
+    def __init__(
+        self,
+        rules,
+        should_trigger_action=None,
+        trigger_cb=None,
+        optimize=True,
+        action_executor=None,
+        instrument=False,
+    ):
+        """
+        :param rules: The rules to evaluate, see `validate_config`.
+        :param should_trigger_action: Called with (project_name, spec, hit) when a
+            rule is triggered, returns whether the actions should be run.
+        :param trigger_cb: Called with (project_name, spec, hit, action_triggered,
+            item) after a rule is triggered.
+        :param optimize: Whether to run the optimization passes of
+            `optimize_conditions` across the conditions of all the rules.
+        :param action_executor: An `ActionExecutor` to run the impls of the
+            actions on, instead of running them while consuming the items. Only
+            the evaluation of their arguments is done by the engine.
+        :param instrument: Whether to record the latency and hit statistics of
+            the rules, available as `metrics`. When disabled, the evaluation
+            path is the same as without instrumentation.
+        """
         self.__should_trigger_action = should_trigger_action
         self.__trigger_cb = trigger_cb
+        self.__action_executor = action_executor
+        self.__optimize = optimize
+
+        self.__metrics = EngineMetrics(rules) if instrument else None
+        self.__evaluate_rule = (
+            self.__evaluate_instrumented if instrument else self.__evaluate
+        )
+        self.__rules, self.__index, self.__stateful = self.__build(rules, [])
+
+    def __build(self, rules, previous_entries):
+        # The entries of rules already in the engine are reused with their
+        # optimized conditions, only the other rules are optimized (together)
+        previous = {id(entry.rule): entry for entry in previous_entries}
+        new_rules = [rule for rule in rules if id(rule) not in previous]
+
+        # The rules are left untouched, the engine evaluates its own rewritten
+        # copy of their conditions
+        conditions = [rule.conditions for rule in new_rules]
+        if self.__optimize:
+            conditions = optimize_conditions(conditions)
+        new_conditions = {id(r): c for r, c in zip(new_rules, conditions)}
+
+        # Conditions are analyzed once here, so that each item only goes
+        # through the rules guarded by its topic or msgtype. Each entry holds
+        # the position of its rule, for ordering the hits of a batch
+        entries = [
+            (
+                previous[id(rule)].moved(i)
+                if id(rule) in previous
+                else _Entry(i, rule, new_conditions[id(rule)])
+            )
+            for i, rule in enumerate(rules)
+        ]
+        index = DispatchIndex(rules, entries)
+
+        # The stateful conditions of the rules that have some, keyed by rule
+        # content for snapshots
+        stateful = [
+            (key, entry.position, entry.stateful)
+            for key, entry in zip(checkpoint.rule_keys(rules), entries)
+            if entry.stateful
+        ]
+
+        return list(rules), index, stateful
+
+    @property
+    def rules(self):
+        """The rules evaluated by the engine, in order"""
+        return list(self.__rules)
+
+    def set_rules(self, rules):
+        """
+        Switch to evaluating a new list of rules. The rules that were already
+        in the engine keep the state of their conditions (and statistics), as
+        they are the same objects. The switch takes effect at once for the
+        next item, items are never evaluated against a mix of both lists.
+
+        Only the new rules go through `optimize_conditions`, the others keep
+        their optimized conditions, so subexpressions are not shared between
+        the new rules and the others. Build a new engine (and `restore` a
+        snapshot into it) to optimize all the rules together again.
+        """
+        built = self.__build(rules, self.__index.entries)
+        if self.__metrics is not None:
+            self.__metrics.set_rules(rules)
+        self.__rules, self.__index, self.__stateful = built
+
+    def reload(self, config, action_impls, project_name="", compiled=False):
+        """
+        Switch to the rules of a new version of the config the engine was made
+        from, see `revalidate_config`. Only the rules that changed are parsed,
+        and the unchanged ones keep the state of their conditions.
+
+        Returns the validation result. The engine keeps its current rules if
+        the new config is invalid.
+        """
+        # Imported here, since the validator depends on this module
+        from ruleengine.dsl.validation.config_validator import revalidate_config
+
+        result, rules = revalidate_config(
+            config, self.__rules, action_impls, project_name, compiled
+        )
+        if result["success"]:
+            self.set_rules(rules)
+        return result
+
+    @property
+    def metrics(self):
+        """The EngineMetrics of an instrumented engine, None otherwise"""
+        return self.__metrics
+
+    def snapshot(self):
+        """
+        Save the state of the stateful conditions (e.g. `sustained`,
+        `repeated`) of all the rules into a binary blob, see `restore`.
+        """
+        return checkpoint.dumps(
+            [(key, get_state(conditions)) for key, _, conditions in self.__stateful]
+        )
+
+    def restore(self, blob):
+        """
+        Put back the condition states saved by `snapshot`, e.g. by a previous
+        run of the process, so that evaluation resumes where it was without
+        replaying the items. Rules are matched by content, the states of rules
+        that are not in this engine are ignored, and the rules of this engine
+        that are not in the snapshot keep their current state.
+
+        Returns the number of rules whose state was restored.
+        """
+        states = checkpoint.loads(blob)
+        restored = 0
+        for key, position, conditions in self.__stateful:
+            state = states.get(key)
+            if state is None:
+                continue
+            try:
+                set_state(conditions, state)
+            except (ValueError, TypeError, IndexError) as e:
+                raise ValueError(
+                    f"the snapshot state of rule {position} doesn't match its conditions"
+                ) from e
+            restored += 1
+        return restored
 
     def consume_next(self, item):
-        for rule in self.__rules:
-            triggered_condition_indices = []
-            triggered_scope = None
+        if self.__metrics is not None:
+            self.__metrics.topic(item.topic).items += 1
+
+        # Values memoized for the previous items are stale, even if the
+        # caller feeds the same (mutated) item again
+        start_item()
+        try:
+            for entry in self.__index.rules_for(item):
+                triggered = self.__evaluate_rule(entry, item)
+                if triggered is not None:
+                    self.__trigger(entry.rule, item, *triggered)
+        finally:
+            end_items()
+
+    def consume_batch(self, items):
+        """
+        Consume a sequence of items, with the same results as calling
+        `consume_next` on each of them in order.
+
+        Items are grouped by topic and msgtype, so that each group is only
+        dispatched once. Stateless rules are evaluated group by group, while
+        the rules with stateful conditions see the items in their original
+        order. Actions and callbacks are run once the whole batch has been
+        evaluated, still in item order then rule order.
 
-            for i, cond in enumerate(rule.conditions):
-                res, scope = cond.evaluate_condition_at(item, rule.initial_scope)
+        If a condition raises, the exception is propagated and no action or
+        callback of the batch is run.
+        """
+        items = list(items)
+        groups = {}
+        for i, item in enumerate(items):
+            groups.setdefault((item.topic, item.msgtype), []).append(i)
+
+        if self.__metrics is not None:
+            for item in items:
+                self.__metrics.topic(item.topic).items += 1
+
+        hits = []
+        try:
+            self.__evaluate_batch(items, groups, hits)
+        finally:
+            end_items()
+        hits.sort(key=lambda hit: hit[:2])
+        for i, _, entry, triggered in hits:
+            self.__trigger(entry.rule, items[i], *triggered)
+
+    def __evaluate_batch(self, items, groups, hits):
+        """Evaluate the rules at the items of a batch, see consume_batch"""
+        evaluate = self.__evaluate_rule
+        # Conditions are evaluated one by one when logged or instrumented
+        inline = not _log.isEnabledFor(logging.DEBUG) and self.__metrics is None
+        stateful_by_group = {}
+        for key, indices in groups.items():
+            entries = self.__index.rules_for(items[indices[0]])
+            stateful_by_group[key] = [e for e in entries if not e.stateless]
+
+            # The common case of stateless rules with a single condition is
+            # inlined
+            single = []
+            other = []
+            for entry in entries:
+                if not entry.stateless:
+                    continue
+                if len(entry.conditions) == 1 and inline:
+                    single.append(
+                        (
+                            entry,
+                            entry.conditions[0].evaluate_condition_at,
+                            entry.initial_scope,
+                        )
+                    )
+                else:
+                    other.append(entry)
+
+            for i in indices:
+                item = items[i]
+                start_item()
+                for entry, evaluate_condition_at, initial_scope in single:
+                    res, scope = evaluate_condition_at(item, initial_scope)
+                    if res:
+                        hits.append((i, entry.position, entry, ([0], scope)))
+                for entry in other:
+                    triggered = evaluate(entry, item)
+                    if triggered is not None:
+                        hits.append((i, entry.position, entry, triggered))
+
+        for i, item in enumerate(items):
+            start_item()
+            for entry in stateful_by_group[(item.topic, item.msgtype)]:
+                triggered = evaluate(entry, item)
+                if triggered is not None:
+                    hits.append((i, entry.position, entry, triggered))
+
+    @staticmethod
+    def __evaluate(entry, item):
+        """
+        Evaluate the conditions of a rule, and return the indices of the
+        triggered conditions along with the scope, or None if none triggered.
+        """
+        triggered_condition_indices = []
+        triggered_scope = None
+
+        for i, cond in enumerate(entry.conditions):
+            res, scope = cond.evaluate_condition_at(item, entry.initial_scope)
+            if _log.isEnabledFor(logging.DEBUG):
                 _log.debug(f"evaluate condition, result: {res}, scope: {scope}")
-                if res:
-                    triggered_condition_indices.append(i)
-                if not triggered_scope:
-                    triggered_scope = scope
+            if res:
+                triggered_condition_indices.append(i)
+            if not triggered_scope:
+                triggered_scope = scope
 
-            if not triggered_condition_indices:
-                continue
+        if not triggered_condition_indices:
+            return None
+        return triggered_condition_indices, triggered_scope
 
-            # For testing, rule.spec is not specified
-            hit = (
-                {}
-                if not rule.spec
-                else {
-                    **rule.spec,
-                    "when": [rule.spec["when"][i] for i in triggered_condition_indices],
-                }
-            )
+    def __evaluate_instrumented(self, entry, item):
+        """Same as __evaluate, recording the time spent and the results"""
+        rule_stats = self.__metrics.rules[entry.position]
+        triggered_condition_indices = []
+        triggered_scope = None
 
-            action_triggered = False
-            if not self.__should_trigger_action or self.__should_trigger_action(
-                rule.project_name, rule.spec, hit
-            ):
-                action_triggered = True
-                for action in rule.actions:
+        rule_start = clock()
+        for i, cond in enumerate(entry.conditions):
+            start = clock()
+            res, scope = cond.evaluate_condition_at(item, entry.initial_scope)
+            rule_stats.conditions[i].record(clock() - start, res)
+            if _log.isEnabledFor(logging.DEBUG):
+                _log.debug(f"evaluate condition, result: {res}, scope: {scope}")
+            if res:
+                triggered_condition_indices.append(i)
+            if not triggered_scope:
+                triggered_scope = scope
+        elapsed = clock() - rule_start
+        rule_stats.record(elapsed, triggered_condition_indices)
+        self.__metrics.topic(item.topic).seconds += elapsed
+
+        if not triggered_condition_indices:
+            return None
+        return triggered_condition_indices, triggered_scope
+
+    def __trigger(self, rule, item, triggered_condition_indices, triggered_scope):
+        # For testing, rule.spec is not specified
+        hit = (
+            {}
+            if not rule.spec
+            else {
+                **rule.spec,
+                "when": [rule.spec["when"][i] for i in triggered_condition_indices],
+            }
+        )
+
+        action_triggered = False
+        if not self.__should_trigger_action or self.__should_trigger_action(
+            rule.project_name, rule.spec, hit
+        ):
+            action_triggered = True
+            for action in rule.actions:
+                if self.__action_executor is not None and isinstance(
+                    action, ForwardingAction
+                ):
+                    self.__action_executor.submit(
+                        action.name,
+                        action.impl,
+                        action.evaluate_args(item, triggered_scope),
+                    )
+                else:
                     action.run(item, triggered_scope)
 
-            if self.__trigger_cb:
-                self.__trigger_cb(
-                    rule.project_name, rule.spec, hit, action_triggered, item
-                )
+        if self.__trigger_cb:
+            self.__trigger_cb(rule.project_name, rule.spec, hit, action_triggered, item)
+
+
+def _rule_stateful_conditions(conditions):
+    result = []
+    seen = set()
+    for cond in conditions:
+        for c in stateful_conditions(cond):
+            if id(c) not in seen:
+                seen.add(id(c))
+                result.append(c)
+    return result
+
+
+class _Entry:
+    """A rule as evaluated by the engine"""
+
+    __slots__ = (
+        "position",
+        "rule",
+        "conditions",
+        "initial_scope",
+        "stateless",
+        "stateful",
+    )
+
+    def __init__(self, position, rule, conditions):
+        self.position = position
+        self.rule = rule
+        self.conditions = conditions
+        self.initial_scope = Scope(rule.initial_scope)
+        # Stateless rules may see the items of a batch out of order
+        self.stateless = all(is_stateless(cond) for cond in conditions)
+        self.stateful = _rule_stateful_conditions(conditions)
+
+    def moved(self, position):
+        """A copy of the entry at another position"""
+        entry = copy.copy(self)
+        entry.position = position
+        return entry
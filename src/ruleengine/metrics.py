@@ -0,0 +1,206 @@
+# Copyright 2024 coScene
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+
+clock = time.perf_counter
+
+
+class TimingStats:
+    """Evaluation count, hit count, cumulative and max wall time"""
+
+    __slots__ = ("evaluations", "hits", "seconds", "max_seconds")
+
+    def __init__(self):
+        self.evaluations = 0
+        self.hits = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+
+    def record(self, seconds, hit):
+        self.evaluations += 1
+        if hit:
+            self.hits += 1
+        self.seconds += seconds
+        if seconds > self.max_seconds:
+            self.max_seconds = seconds
+
+    def to_dict(self):
+        return {
+            "evaluations": self.evaluations,
+            "hits": self.hits,
+            "seconds": self.seconds,
+            "max_seconds": self.max_seconds,
+        }
+
+
+class RuleStats(TimingStats):
+    """TimingStats of a rule, and of each of its `when` conditions"""
+
+    __slots__ = ("conditions",)
+
+    def __init__(self, condition_count):
+        super().__init__()
+        self.conditions = [TimingStats() for _ in range(condition_count)]
+
+    def to_dict(self):
+        return {
+            **super().to_dict(),
+            "when": [stats.to_dict() for stats in self.conditions],
+        }
+
+
+class TopicStats:
+    """Items consumed on a topic, and the time spent evaluating rules on them"""
+
+    __slots__ = ("items", "seconds")
+
+    def __init__(self):
+        self.items = 0
+        self.seconds = 0.0
+
+    def to_dict(self):
+        return {
+            "items": self.items,
+            "seconds": self.seconds,
+            "items_per_second": self.items / self.seconds if self.seconds else None,
+        }
+
+
+class EngineMetrics:
+    """
+    Latency and hit statistics of an instrumented Engine, per rule, per `when`
+    condition of each rule, and per topic.
+
+    Rules are identified by their position in the engine, along with their
+    project name.
+    """
+
+    def __init__(self, rules):
+        self.__rules = rules
+        self.reset()
+
+    def reset(self):
+        self.rules = [RuleStats(len(rule.conditions)) for rule in self.__rules]
+        self.topics = {}
+
+    def set_rules(self, rules):
+        """Follow a new list of rules, keeping the statistics of known rules"""
+        previous = {id(rule): stats for rule, stats in zip(self.__rules, self.rules)}
+        self.__rules = rules
+        self.rules = [
+            previous.get(id(rule)) or RuleStats(len(rule.conditions)) for rule in rules
+        ]
+
+    def topic(self, topic):
+        stats = self.topics.get(topic)
+        if stats is None:
+            stats = self.topics[topic] = TopicStats()
+        return stats
+
+    def snapshot(self):
+        """The statistics as plain dicts and lists"""
+        return {
+            "rules": [
+                {"rule": i, "project": rule.project_name, **stats.to_dict()}
+                for i, (rule, stats) in enumerate(zip(self.__rules, self.rules))
+            ],
+            "topics": {topic: stats.to_dict() for topic, stats in self.topics.items()},
+        }
+
+    def to_prometheus(self, prefix="ruleengine"):
+        """The statistics in the Prometheus text exposition format"""
+        lines = []
+
+        def family(name, kind, help_text, samples):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+            for labels, value in samples:
+                label_str = ",".join(
+                    f'{key}="{_escape_label(str(v))}"' for key, v in labels.items()
+                )
+                lines.append(f"{prefix}_{name}{{{label_str}}} {value!r}")
+
+        def rule_labels(i):
+            return {"rule": i, "project": self.__rules[i].project_name}
+
+        def rule_samples(attr):
+            return [
+                (rule_labels(i), getattr(stats, attr))
+                for i, stats in enumerate(self.rules)
+            ]
+
+        def condition_samples(attr):
+            return [
+                ({**rule_labels(i), "when": j}, getattr(cond_stats, attr))
+                for i, stats in enumerate(self.rules)
+                for j, cond_stats in enumerate(stats.conditions)
+            ]
+
+        def topic_samples(attr):
+            return [
+                ({"topic": topic}, getattr(stats, attr))
+                for topic, stats in self.topics.items()
+            ]
+
+        for level, samples in (
+            ("rule", rule_samples),
+            ("condition", condition_samples),
+        ):
+            family(
+                f"{level}_evaluations_total",
+                "counter",
+                f"Number of {level} evaluations",
+                samples("evaluations"),
+            )
+            family(
+                f"{level}_hits_total",
+                "counter",
+                f"Number of {level} evaluations with a truthy result",
+                samples("hits"),
+            )
+            family(
+                f"{level}_seconds_total",
+                "counter",
+                f"Wall time spent evaluating the {level}",
+                samples("seconds"),
+            )
+            family(
+                f"{level}_max_seconds",
+                "gauge",
+                f"Longest evaluation of the {level}",
+                samples("max_seconds"),
+            )
+        family(
+            "topic_items_total",
+            "counter",
+            "Number of items consumed",
+            topic_samples("items"),
+        )
+        family(
+            "topic_seconds_total",
+            "counter",
+            "Wall time spent evaluating rules on the items",
+            topic_samples("seconds"),
+        )
+        return "\n".join(lines) + "\n"
+
+
+def _escape_label(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+__all__ = [
+    "EngineMetrics",
+]
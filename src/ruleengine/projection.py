@@ -0,0 +1,115 @@
+# Copyright 2024 coScene
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from ruleengine.dispatch import rule_guards
+from ruleengine.dsl.analysis import msg_field_paths
+from ruleengine.dsl.base_actions import ForwardingAction
+from ruleengine.dsl.condition import Condition
+
+
+class FieldProjection:
+    """
+    The message fields that a set of validated rules reads, so that decoders
+    can skip the others.
+
+    `fields` maps topic -> msgtype -> paths, where None stands for any topic or
+    msgtype, and paths is a frozenset of tuples of field names (see
+    `msg_field_paths`), no path being a prefix of another. () means the whole
+    message.
+
+    `undetermined` lists the rules whose reads can't be found statically, e.g.
+    because of custom actions or opaque conditions. They may read any field of
+    any message.
+    """
+
+    def __init__(self, rules):
+        self.undetermined = []
+        fields = {}
+        for rule in rules:
+            paths = rule_field_paths(rule)
+            if paths is None:
+                self.undetermined.append(rule)
+                continue
+            for (topic, msgtype), rule_paths in paths.items():
+                fields.setdefault(topic, {}).setdefault(msgtype, set()).update(
+                    rule_paths
+                )
+        self.fields = {
+            topic: {msgtype: _minimal(paths) for msgtype, paths in by_type.items()}
+            for topic, by_type in fields.items()
+        }
+
+    def paths_for(self, topic, msgtype):
+        """
+        The paths of the fields read from messages of the given topic and
+        msgtype, or None if all of them may be read. An empty set means that
+        the messages are not read at all.
+        """
+        if self.undetermined:
+            return None
+        paths = set()
+        for t in (topic, None):
+            by_type = self.fields.get(t, {})
+            for m in (msgtype, None):
+                paths.update(by_type.get(m, ()))
+        if () in paths:
+            return None
+        return _minimal(paths)
+
+
+def rule_field_paths(rule):
+    """
+    The paths of the message fields read by the conditions and actions of a
+    rule, by (topic, msgtype), see `msg_field_paths`. None if unknown.
+    """
+    result = {}
+
+    def add(paths):
+        for context, context_paths in paths.items():
+            result.setdefault(context, set()).update(context_paths)
+
+    for cond in rule.conditions:
+        paths = msg_field_paths(cond)
+        if paths is None:
+            return None
+        add(paths)
+
+    # Actions only run on items that hit the conditions
+    guards = rule_guards(rule)
+    for action in rule.actions:
+        if not isinstance(action, ForwardingAction):
+            return None
+        for value in action.args.values():
+            if not isinstance(value, Condition):
+                continue
+            paths = msg_field_paths(value, guards)
+            if paths is None:
+                return None
+            add(paths)
+    return result
+
+
+def _minimal(paths):
+    """Drop the paths under another path of the set"""
+    result = set()
+    for path in sorted(paths, key=len):
+        if not any(path[: len(p)] == p for p in result):
+            result.add(path)
+    return frozenset(result)
+
+
+__all__ = [
+    "FieldProjection",
+    "rule_field_paths",
+]
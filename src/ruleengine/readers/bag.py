@@ -0,0 +1,268 @@
+# Copyright 2024 coScene
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Streaming reader of ROS1 bags (format 2.0).
+
+A bag is a sequence of records, the messages being grouped in (possibly
+compressed) chunks. The index at the end of the file lists the connections
+(topics) and, for each chunk, the connections it holds messages of, which is
+what allows skipping chunks without reading them.
+"""
+
+import struct
+
+from ruleengine.dsl.lazy import LazyMessage
+from ruleengine.engine import DiagnosisItem
+
+from .compression import decompress
+from .messages import ros1_decoder
+
+MAGIC = b"#ROSBAG V2.0\n"
+
+OP_MESSAGE_DATA = 0x02
+OP_BAG_HEADER = 0x03
+OP_INDEX_DATA = 0x04
+OP_CHUNK = 0x05
+OP_CHUNK_INFO = 0x06
+OP_CONNECTION = 0x07
+
+_U32 = struct.Struct("<I")
+_U64 = struct.Struct("<Q")
+_TIME = struct.Struct("<II")
+
+
+class Connection:
+    __slots__ = ("id", "topic", "msgtype", "definition", "_decoder")
+
+    def __init__(self, conn_id, topic, msgtype, definition):
+        self.id = conn_id
+        self.topic = topic
+        self.msgtype = msgtype
+        self.definition = definition
+        self._decoder = None
+
+    @property
+    def decoder(self):
+        if self._decoder is None:
+            self._decoder = ros1_decoder(self.msgtype, self.definition)
+        return self._decoder
+
+    def decode(self, data):
+        return self.decoder(data)
+
+    def lazy(self, data):
+        """The message, decoded when a condition first reads it"""
+        return LazyMessage(self.decoder, bytes(data))
+
+
+class ChunkInfo:
+    __slots__ = ("position", "start_time", "end_time", "connections")
+
+    def __init__(self, position, start_time, end_time, connections):
+        self.position = position
+        self.start_time = start_time
+        self.end_time = end_time
+        self.connections = connections
+
+
+class BagReader:
+    """
+    Reads the messages of a ROS1 bag as DiagnosisItems, one chunk at a time.
+    Messages are returned in file order, which is the recording order.
+    """
+
+    def __init__(self, path):
+        self.__file = open(path, "rb")
+        try:
+            if self.__file.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not a ROS1 bag (format 2.0)")
+            header, _ = self.__read_record()
+            if _op(header) != OP_BAG_HEADER:
+                raise ValueError(f"{path} has no bag header record")
+            self.__data_start = self.__file.tell()
+
+            self.__connections = {}
+            self.__chunk_infos = []
+            index_pos = _U64.unpack(header["index_pos"])[0]
+            if index_pos:
+                self.__read_index(index_pos)
+        except Exception:
+            self.__file.close()
+            raise
+
+    @property
+    def indexed(self):
+        """Whether the bag has an index, i.e. chunks can be skipped"""
+        return bool(self.__chunk_infos)
+
+    @property
+    def topics(self):
+        """A dict from topic to message type, empty for bags without index"""
+        return {conn.topic: conn.msgtype for conn in self.__connections.values()}
+
+    def chunks(self, topics=None):
+        """
+        Yield a list of DiagnosisItems for each chunk with messages on any of
+        the topics (all topics if None). In an indexed bag, the other chunks
+        are neither read nor decompressed.
+        """
+        topics = None if topics is None else set(topics)
+        if not self.__chunk_infos:
+            yield from self.__scan(topics)
+            return
+
+        wanted = {
+            conn.id
+            for conn in self.__connections.values()
+            if topics is None or conn.topic in topics
+        }
+        for info in sorted(self.__chunk_infos, key=lambda info: info.position):
+            if wanted.isdisjoint(info.connections):
+                continue
+            self.__file.seek(info.position)
+            header, data = self.__read_record()
+            items = self.__chunk_items(header, data, topics)
+            if items:
+                yield items
+
+    def close(self):
+        self.__file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __read_index(self, index_pos):
+        self.__file.seek(index_pos)
+        while True:
+            record = self.__read_record()
+            if record is None:
+                break
+            header, data = record
+            op = _op(header)
+            if op == OP_CONNECTION:
+                self.__add_connection(header, data)
+            elif op == OP_CHUNK_INFO:
+                count = _U32.unpack(header["count"])[0]
+                connections = {_U32.unpack_from(data, i * 8)[0] for i in range(count)}
+                self.__chunk_infos.append(
+                    ChunkInfo(
+                        _U64.unpack(header["chunk_pos"])[0],
+                        _time(header["start_time"]),
+                        _time(header["end_time"]),
+                        connections,
+                    )
+                )
+
+    def __scan(self, topics):
+        """Read the records of a bag without index, in order"""
+        self.__file.seek(self.__data_start)
+        while True:
+            record = self.__read_record()
+            if record is None:
+                return
+            header, data = record
+            op = _op(header)
+            if op == OP_CONNECTION:
+                self.__add_connection(header, data)
+            elif op == OP_CHUNK:
+                items = self.__chunk_items(header, data, topics)
+                if items:
+                    yield items
+
+    def __chunk_items(self, header, data, topics):
+        compression = header["compression"].decode()
+        size = _U32.unpack(header["size"])[0]
+        records = memoryview(decompress(compression, data, size))
+
+        items = []
+        connections = self.__connections
+        offset = 0
+        while offset < len(records):
+            header_len = _U32.unpack_from(records, offset)[0]
+            offset += 4
+            end = offset + header_len
+            header = _parse_header(records[offset:end])
+            offset = end
+            data_len = _U32.unpack_from(records, offset)[0]
+            offset += 4
+            end = offset + data_len
+            data = records[offset:end]
+            offset = end
+
+            op = _op(header)
+            if op == OP_CONNECTION:
+                self.__add_connection(header, data)
+            elif op == OP_MESSAGE_DATA:
+                conn = connections[_U32.unpack(header["conn"])[0]]
+                if topics is None or conn.topic in topics:
+                    ts = _time(header["time"])
+                    items.append(
+                        DiagnosisItem(conn.topic, conn.lazy(data), ts, conn.msgtype)
+                    )
+        return items
+
+    def __add_connection(self, header, data):
+        conn_id = _U32.unpack(header["conn"])[0]
+        if conn_id in self.__connections:
+            return
+        fields = _parse_header(data)
+        self.__connections[conn_id] = Connection(
+            conn_id,
+            header["topic"].decode(),
+            fields["type"].decode(),
+            fields.get("message_definition", b"").decode(),
+        )
+
+    def __read_record(self):
+        """The (header, data) of the next record, None at the end of the file"""
+        length = self.__file.read(4)
+        if len(length) < 4:
+            return None
+        header = _parse_header(self.__file.read(_U32.unpack(length)[0]))
+        data_len = _U32.unpack(self.__file.read(4))[0]
+        return header, self.__file.read(data_len)
+
+
+def _parse_header(data):
+    """The fields of a record header, as a dict from name to raw value"""
+    data = memoryview(data)
+    fields = {}
+    offset = 0
+    while offset < len(data):
+        length = _U32.unpack_from(data, offset)[0]
+        offset += 4
+        end = offset + length
+        field = bytes(data[offset:end])
+        offset = end
+        name, _, value = field.partition(b"=")
+        fields[name.decode()] = value
+    return fields
+
+
+def _op(header):
+    return header["op"][0]
+
+
+def _time(raw):
+    secs, nsecs = _TIME.unpack(raw)
+    return secs + nsecs * 1e-9
+
+
+__all__ = [
+    "BagReader",
+]
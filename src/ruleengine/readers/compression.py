@@ -0,0 +1,57 @@
+# Copyright 2024 coScene
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Decompression of bag and MCAP chunks. bz2 is in the standard library, lz4
+and zstd need the optional `lz4` and `zstandard` packages.
+"""
+
+import bz2
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def decompress(compression, data, size=None):
+    """
+    Decompress chunk data. compression is the name used by the file format,
+    size the uncompressed size if known.
+    """
+    if compression in ("", "none"):
+        return data
+    if compression == "bz2":
+        return bz2.decompress(data)
+    if compression == "lz4":
+        if lz4_frame is None:
+            raise ImportError("reading lz4 compressed chunks requires the lz4 package")
+        return lz4_frame.decompress(data)
+    if compression == "zstd":
+        if zstandard is None:
+            raise ImportError(
+                "reading zstd compressed chunks requires the zstandard package"
+            )
+        return zstandard.ZstdDecompressor().decompress(data, max_output_size=size or 0)
+    raise ValueError(f"unsupported chunk compression: {compression}")
+
+
+__all__ = [
+    "decompress",
+]
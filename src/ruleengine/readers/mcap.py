@@ -0,0 +1,372 @@
+# Copyright 2024 coScene
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Streaming reader of MCAP files.
+
+Messages are stored in (possibly compressed) chunks. When the file has a
+summary section, its chunk indexes tell which channels each chunk holds
+messages of, which allows skipping chunks without reading them. Files
+without summary, or with messages outside chunks, are read sequentially.
+"""
+
+import struct
+import zlib
+
+from ruleengine.dsl.lazy import LazyMessage
+from ruleengine.engine import DiagnosisItem
+
+from .compression import decompress
+from .messages import cdr_decoder, json_decoder, ros1_decoder
+
+MAGIC = b"\x89MCAP0\r\n"
+
+OP_HEADER = 0x01
+OP_FOOTER = 0x02
+OP_SCHEMA = 0x03
+OP_CHANNEL = 0x04
+OP_MESSAGE = 0x05
+OP_CHUNK = 0x06
+OP_CHUNK_INDEX = 0x08
+OP_DATA_END = 0x0F
+
+# Number of messages outside chunks returned at once
+BATCH_SIZE = 1000
+
+_OPCODE_LENGTH = struct.Struct("<BQ")
+_U16 = struct.Struct("<H")
+_U32 = struct.Struct("<I")
+_U64 = struct.Struct("<Q")
+_FOOTER = struct.Struct("<QQI")
+_MESSAGE = struct.Struct("<HIQQ")
+_CHUNK = struct.Struct("<QQQI")
+_FOOTER_RECORD_LENGTH = _OPCODE_LENGTH.size + _FOOTER.size
+
+
+class Schema:
+    __slots__ = ("id", "name", "encoding", "data")
+
+    def __init__(self, schema_id, name, encoding, data):
+        self.id = schema_id
+        self.name = name
+        self.encoding = encoding
+        self.data = data
+
+
+class Channel:
+    __slots__ = ("id", "topic", "message_encoding", "schema", "_decoder")
+
+    def __init__(self, channel_id, topic, message_encoding, schema):
+        self.id = channel_id
+        self.topic = topic
+        self.message_encoding = message_encoding
+        self.schema = schema
+        self._decoder = None
+
+    @property
+    def msgtype(self):
+        return self.schema.name if self.schema else ""
+
+    @property
+    def decoder(self):
+        if self._decoder is None:
+            self._decoder = _decoder(self)
+        return self._decoder
+
+    def decode(self, data):
+        return self.decoder(data)
+
+    def lazy(self, data):
+        """The message, decoded when a condition first reads it"""
+        return LazyMessage(self.decoder, bytes(data))
+
+
+def _decoder(channel):
+    encoding = channel.message_encoding
+    schema = channel.schema
+    if encoding == "json":
+        return json_decoder(channel.msgtype)
+    if schema is None:
+        error = f"channel {channel.topic} has no schema"
+    elif encoding == "ros1" and schema.encoding == "ros1msg":
+        return ros1_decoder(schema.name, bytes(schema.data).decode())
+    elif encoding == "cdr" and schema.encoding == "ros2msg":
+        return cdr_decoder(schema.name, bytes(schema.data).decode())
+    else:
+        error = f"unsupported encoding {encoding} ({schema.encoding}) of channel {channel.topic}"
+
+    # Only reported if a message of the channel is read
+    def unsupported(data):
+        raise ValueError(error)
+
+    return unsupported
+
+
+class ChunkIndex:
+    __slots__ = ("position", "length", "channels")
+
+    def __init__(self, position, length, channels):
+        self.position = position
+        self.length = length
+        # Empty when the writer did not write message indexes
+        self.channels = channels
+
+
+class McapReader:
+    """
+    Reads the messages of an MCAP file as DiagnosisItems, one chunk at a time.
+    Messages are returned in file order, their timestamp is the log time.
+    """
+
+    def __init__(self, path):
+        self.__file = open(path, "rb")
+        try:
+            if self.__file.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not an MCAP file")
+            self.__data_start = len(MAGIC)
+            self.__schemas = {}
+            self.__channels = {}
+            self.__chunk_indexes = None
+            self.__read_summary()
+        except Exception:
+            self.__file.close()
+            raise
+
+    @property
+    def indexed(self):
+        """Whether the file has chunk indexes, i.e. chunks can be skipped"""
+        return self.__chunk_indexes is not None
+
+    @property
+    def topics(self):
+        """A dict from topic to message type, empty for files without summary"""
+        return {channel.topic: channel.msgtype for channel in self.__channels.values()}
+
+    def chunks(self, topics=None):
+        """
+        Yield a list of DiagnosisItems for each chunk with messages on any of
+        the topics (all topics if None). With chunk indexes, the other chunks
+        are neither read nor decompressed.
+        """
+        topics = None if topics is None else set(topics)
+        if self.__chunk_indexes is None:
+            yield from self.__scan(self.__data_start, topics)
+            return
+
+        wanted = {
+            channel.id
+            for channel in self.__channels.values()
+            if topics is None or channel.topic in topics
+        }
+        for index in self.__chunk_indexes:
+            if index.channels and wanted.isdisjoint(index.channels):
+                continue
+            self.__file.seek(index.position)
+            opcode, length = _OPCODE_LENGTH.unpack(
+                self.__file.read(_OPCODE_LENGTH.size)
+            )
+            items = self.__chunk_items(memoryview(self.__file.read(length)), topics)
+            if items:
+                yield items
+
+    def close(self):
+        self.__file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __read_summary(self):
+        f = self.__file
+        f.seek(0, 2)
+        size = f.tell()
+        if size < len(MAGIC) * 2 + _FOOTER_RECORD_LENGTH:
+            return
+        f.seek(size - len(MAGIC) - _FOOTER_RECORD_LENGTH)
+        record = f.read(_FOOTER_RECORD_LENGTH + len(MAGIC))
+        if record[_FOOTER_RECORD_LENGTH:] != MAGIC or record[0] != OP_FOOTER:
+            # Truncated file, e.g. a recording that was not closed
+            return
+        summary_start = _FOOTER.unpack_from(record, _OPCODE_LENGTH.size)[0]
+        if not summary_start:
+            return
+
+        f.seek(summary_start)
+        summary = memoryview(f.read(size - summary_start))
+        chunk_indexes = []
+        for opcode, record in _records(summary):
+            if opcode == OP_SCHEMA:
+                self.__add_schema(record)
+            elif opcode == OP_CHANNEL:
+                self.__add_channel(record)
+            elif opcode == OP_CHUNK_INDEX:
+                chunk_indexes.append(_chunk_index(record))
+            elif opcode == OP_FOOTER:
+                break
+        if not chunk_indexes or not self.__channels:
+            return
+
+        # Messages may also lie between chunks, the sequential scan finds them
+        chunk_indexes.sort(key=lambda index: index.position)
+        position = self.__data_start
+        for index in chunk_indexes:
+            if not self.__only_metadata(position, index.position):
+                return
+            position = index.position + index.length
+        if self.__only_metadata(position, summary_start):
+            self.__chunk_indexes = chunk_indexes
+
+    def __only_metadata(self, start, end):
+        """Whether the records between start and end have no messages"""
+        f = self.__file
+        f.seek(start)
+        while start < end:
+            opcode, length = _OPCODE_LENGTH.unpack(f.read(_OPCODE_LENGTH.size))
+            if opcode == OP_DATA_END:
+                break
+            if opcode in (OP_MESSAGE, OP_CHUNK):
+                return False
+            start += _OPCODE_LENGTH.size + length
+            f.seek(start)
+        return True
+
+    def __scan(self, position, topics):
+        """Read the data section sequentially"""
+        f = self.__file
+        f.seek(position)
+        batch = []
+        while True:
+            prefix = f.read(_OPCODE_LENGTH.size)
+            if len(prefix) < _OPCODE_LENGTH.size:
+                break
+            opcode, length = _OPCODE_LENGTH.unpack(prefix)
+            if opcode in (OP_DATA_END, OP_FOOTER):
+                break
+            if opcode not in (OP_SCHEMA, OP_CHANNEL, OP_MESSAGE, OP_CHUNK):
+                f.seek(length, 1)
+                continue
+            record = memoryview(f.read(length))
+            if len(record) < length:
+                break
+            if opcode == OP_SCHEMA:
+                self.__add_schema(record)
+            elif opcode == OP_CHANNEL:
+                self.__add_channel(record)
+            elif opcode == OP_MESSAGE:
+                item = self.__message_item(record, topics)
+                if item is not None:
+                    batch.append(item)
+                    if len(batch) >= BATCH_SIZE:
+                        yield batch
+                        batch = []
+            else:
+                if batch:
+                    yield batch
+                    batch = []
+                items = self.__chunk_items(record, topics)
+                if items:
+                    yield items
+        if batch:
+            yield batch
+
+    def __chunk_items(self, record, topics):
+        _, _, uncompressed_size, crc = _CHUNK.unpack_from(record)
+        offset = _CHUNK.size
+        compression, offset = _string(record, offset)
+        (length,) = _U64.unpack_from(record, offset)
+        offset += 8
+        end = offset + length
+        data = decompress(compression, bytes(record[offset:end]), uncompressed_size)
+        if crc and zlib.crc32(data) != crc:
+            raise ValueError("MCAP chunk checksum mismatch")
+
+        items = []
+        for opcode, inner in _records(memoryview(data)):
+            if opcode == OP_MESSAGE:
+                item = self.__message_item(inner, topics)
+                if item is not None:
+                    items.append(item)
+            elif opcode == OP_SCHEMA:
+                self.__add_schema(inner)
+            elif opcode == OP_CHANNEL:
+                self.__add_channel(inner)
+        return items
+
+    def __message_item(self, record, topics):
+        channel_id, _, log_time, _ = _MESSAGE.unpack_from(record)
+        channel = self.__channels[channel_id]
+        if topics is not None and channel.topic not in topics:
+            return None
+        start = _MESSAGE.size
+        msg = channel.lazy(record[start:])
+        return DiagnosisItem(channel.topic, msg, log_time / 1e9, channel.msgtype)
+
+    def __add_schema(self, record):
+        (schema_id,) = _U16.unpack_from(record)
+        if schema_id in self.__schemas:
+            return
+        name, offset = _string(record, 2)
+        encoding, offset = _string(record, offset)
+        (length,) = _U32.unpack_from(record, offset)
+        offset += 4
+        end = offset + length
+        self.__schemas[schema_id] = Schema(
+            schema_id, name, encoding, bytes(record[offset:end])
+        )
+
+    def __add_channel(self, record):
+        channel_id, schema_id = struct.unpack_from("<HH", record)
+        if channel_id in self.__channels:
+            return
+        topic, offset = _string(record, 4)
+        message_encoding, offset = _string(record, offset)
+        self.__channels[channel_id] = Channel(
+            channel_id, topic, message_encoding, self.__schemas.get(schema_id)
+        )
+
+
+def _records(data):
+    """Iterate over the (opcode, record) of a buffer of records"""
+    offset = 0
+    while offset < len(data):
+        opcode, length = _OPCODE_LENGTH.unpack_from(data, offset)
+        offset += _OPCODE_LENGTH.size
+        end = offset + length
+        yield opcode, data[offset:end]
+        offset = end
+
+
+def _string(data, offset):
+    (length,) = _U32.unpack_from(data, offset)
+    offset += 4
+    end = offset + length
+    return bytes(data[offset:end]).decode(), end
+
+
+def _chunk_index(record):
+    (position, length) = struct.unpack_from("<QQ", record, 16)
+    offset = 32
+    (map_length,) = _U32.unpack_from(record, offset)
+    offset += 4
+    channels = {
+        _U16.unpack_from(record, offset + i * 10)[0] for i in range(map_length // 10)
+    }
+    return ChunkIndex(position, length, channels)
+
+
+__all__ = [
+    "McapReader",
+]
@@ -0,0 +1,428 @@
+# Copyright 2024 coScene
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Decoding of ROS messages from their text definitions, as stored in bags and
+MCAP schemas. ROS1 messages are decoded from the ROS1 serialization format,
+ROS2 messages from CDR.
+
+Decoded messages are instances of classes generated per message type, with
+one attribute per field, like the messages of rospy. Decoders and messages
+pickle as the definition they come from, and are generated again, once per
+process, on the other side.
+"""
+
+import functools
+import json
+import struct
+
+from ruleengine.dsl.lazy import Decoder
+
+# Lines of = separate the definitions of the dependencies of a type
+_SEPARATOR = "=" * 80
+
+# Primitive type -> struct format code
+_PRIMITIVES = {
+    "bool": "?",
+    "int8": "b",
+    "uint8": "B",
+    "int16": "h",
+    "uint16": "H",
+    "int32": "i",
+    "uint32": "I",
+    "int64": "q",
+    "uint64": "Q",
+    "float32": "f",
+    "float64": "d",
+}
+_ROS1_ALIASES = {"byte": "int8", "char": "uint8"}
+_ROS2_ALIASES = {"byte": "uint8", "char": "uint8"}
+_BYTE_TYPES = ("uint8", "int8")
+
+
+class Message:
+    """Base class of the decoded messages"""
+
+    __slots__ = ()
+    _type = ""
+    # The (encoding, type name, definition) the class was generated from
+    _origin = None
+
+    def __init__(self, *values):
+        for name, value in zip(self.__slots__, values):
+            setattr(self, name, value)
+
+    def __eq__(self, other):
+        return type(self) is type(other) and all(
+            getattr(self, name) == getattr(other, name) for name in self.__slots__
+        )
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{self._type}({fields})"
+
+    def __reduce__(self):
+        values = tuple(getattr(self, name) for name in self.__slots__)
+        if self._origin is None:
+            return type(self), values
+        return _message, (self._origin, self._type, values)
+
+
+def _message(origin, name, values):
+    return _decode_functions(*origin)[1](name)(*values)
+
+
+class Time(Message):
+    """ROS1 time and duration"""
+
+    __slots__ = ("secs", "nsecs")
+    _type = "time"
+
+    def to_sec(self):
+        return self.secs + self.nsecs * 1e-9
+
+
+class Field:
+    __slots__ = ("name", "type", "array_length", "is_array")
+
+    def __init__(self, name, type_name, is_array=False, array_length=None):
+        self.name = name
+        self.type = type_name
+        self.is_array = is_array
+        self.array_length = array_length
+
+
+def parse_definition(type_name, text, ros2=False):
+    """
+    Parse a message definition with its dependencies, e.g. the
+    message_definition of a bag connection or an MCAP schema. Returns a dict
+    from type name (without the `msg` part of ROS2 names) to field list.
+    """
+    sections = text.split("\n" + _SEPARATOR + "\n")
+    types = {}
+    for i, section in enumerate(sections):
+        name = type_name
+        lines = section.splitlines()
+        if i > 0:
+            header = next(line for line in lines if line.startswith("MSG:"))
+            name = header[4:].strip()
+            del lines[: lines.index(header) + 1]
+        name = _normalize(name)
+        types[name] = _parse_fields(lines, _package(name), ros2)
+    return types
+
+
+def _parse_fields(lines, package, ros2):
+    fields = []
+    for line in lines:
+        line = line.split("#", 1)[0].strip()
+        if not line:
+            continue
+        parts = line.split(None, 2)
+        if len(parts) < 2:
+            raise ValueError(f"invalid field definition: {line!r}")
+        field_type, name = parts[0], parts[1]
+        # Constants are `type NAME=value`, ROS2 defaults are `type name value`
+        if "=" in name or (len(parts) > 2 and parts[2].startswith("=")):
+            continue
+
+        is_array = False
+        array_length = None
+        if field_type.endswith("]"):
+            field_type, size = field_type[:-1].split("[")
+            is_array = True
+            if size and not size.startswith("<="):
+                array_length = int(size)
+        # Bounded strings, e.g. string<=10
+        field_type = field_type.split("<=")[0]
+
+        aliases = _ROS2_ALIASES if ros2 else _ROS1_ALIASES
+        field_type = aliases.get(field_type, field_type)
+        if field_type == "Header" and not ros2:
+            field_type = "std_msgs/Header"
+        elif field_type not in _PRIMITIVES and field_type not in (
+            "string",
+            "wstring",
+            "time",
+            "duration",
+        ):
+            if "/" not in field_type:
+                field_type = f"{package}/{field_type}"
+            field_type = _normalize(field_type)
+        fields.append(Field(name, field_type, is_array, array_length))
+    return fields
+
+
+def _normalize(name):
+    parts = name.split("/")
+    if len(parts) == 3 and parts[1] == "msg":
+        return f"{parts[0]}/{parts[2]}"
+    return name
+
+
+def _package(name):
+    return name.split("/")[0] if "/" in name else ""
+
+
+class _Builder:
+    """Generates the decode functions of a definition, for one wire format"""
+
+    def __init__(self, types, cdr, endian="<", origin=None, classes=None):
+        self.types = types
+        self.cdr = cdr
+        self.endian = endian
+        self.origin = origin
+        self.decoders = {}
+        self.classes = {} if classes is None else classes
+
+    def message_class(self, name):
+        cls = self.classes.get(name)
+        if cls is None:
+            fields = tuple(f.name for f in self.types[name])
+            short_name = name.rsplit("/", 1)[-1]
+            cls = type(
+                short_name,
+                (Message,),
+                {"__slots__": fields, "_type": name, "_origin": self.origin},
+            )
+            self.classes[name] = cls
+        return cls
+
+    def decoder(self, name):
+        """A function (buffer, offset) -> (message, offset)"""
+        decoder = self.decoders.get(name)
+        if decoder is not None:
+            return decoder
+        if name not in self.types:
+            raise ValueError(f"no definition of message type {name}")
+
+        cls = self.message_class(name)
+        steps = []
+
+        def decode(buf, offset):
+            values = []
+            for step in steps:
+                value, offset = step(buf, offset)
+                values.append(value)
+            return cls(*values), offset
+
+        # Registered before the fields, for recursive types
+        self.decoders[name] = decode
+        steps.extend(self.field_step(f) for f in self.types[name])
+        return decode
+
+    def align(self, offset, size):
+        if self.cdr and size > 1:
+            # CDR aligns on the size of primitives, relative to the payload
+            return offset + (-offset % min(size, 8))
+        return offset
+
+    def primitive_step(self, code):
+        unpack = struct.Struct(self.endian + code).unpack_from
+        size = struct.calcsize(code)
+        align = self.align
+
+        def step(buf, offset):
+            offset = align(offset, size)
+            return unpack(buf, offset)[0], offset + size
+
+        return step
+
+    def string_step(self):
+        unpack = struct.Struct(self.endian + "I").unpack_from
+        align = self.align
+        cdr = self.cdr
+
+        def step(buf, offset):
+            offset = align(offset, 4)
+            (length,) = unpack(buf, offset)
+            offset += 4
+            end = offset + length
+            # CDR strings include their terminating null
+            data = bytes(buf[offset:end])
+            if cdr and length:
+                data = data[:-1]
+            return data.decode("utf-8", "replace"), end
+
+        return step
+
+    def time_step(self, code):
+        unpack = struct.Struct(self.endian + code).unpack_from
+
+        def step(buf, offset):
+            return Time(*unpack(buf, offset)), offset + 8
+
+        return step
+
+    def element_step(self, type_name):
+        if type_name in _PRIMITIVES:
+            return self.primitive_step(_PRIMITIVES[type_name])
+        if type_name == "string":
+            return self.string_step()
+        if type_name == "wstring":
+            raise ValueError("wstring fields are not supported")
+        if type_name in ("time", "duration"):
+            return self.time_step("II" if type_name == "time" else "ii")
+
+        def step(buf, offset):
+            return self.decoder(type_name)(buf, offset)
+
+        return step
+
+    def field_step(self, field):
+        if not field.is_array:
+            return self.element_step(field.type)
+
+        count_unpack = struct.Struct(self.endian + "I").unpack_from
+        align = self.align
+        fixed = field.array_length
+
+        def read_count(buf, offset):
+            if fixed is not None:
+                return fixed, offset
+            offset = align(offset, 4)
+            return count_unpack(buf, offset)[0], offset + 4
+
+        if field.type in _BYTE_TYPES:
+            signed = field.type == "int8"
+
+            def step(buf, offset):
+                count, offset = read_count(buf, offset)
+                end = offset + count
+                data = bytes(buf[offset:end])
+                return (list(struct.unpack(f"{count}b", data)) if signed else data), end
+
+            return step
+
+        if field.type in _PRIMITIVES:
+            code = _PRIMITIVES[field.type]
+            size = struct.calcsize(code)
+            endian = self.endian
+
+            def step(buf, offset):
+                count, offset = read_count(buf, offset)
+                if count:
+                    offset = align(offset, size)
+                values = struct.unpack_from(f"{endian}{count}{code}", buf, offset)
+                return list(values), offset + count * size
+
+            return step
+
+        element = self.element_step(field.type)
+
+        def step(buf, offset):
+            count, offset = read_count(buf, offset)
+            values = []
+            for _ in range(count):
+                value, offset = element(buf, offset)
+                values.append(value)
+            return values, offset
+
+        return step
+
+
+class MessageDecoder(Decoder):
+    """
+    A function decoding the messages of one type, given the encoding, the
+    type name and the full text definition of the messages. It pickles as
+    these, so that messages can be sent undecoded to other processes.
+    """
+
+    __slots__ = ("origin", "_decode")
+
+    def __init__(self, encoding, type_name, definition):
+        self.origin = (encoding, type_name, definition)
+        self._decode = None
+
+    def __call__(self, data):
+        decode = self._decode
+        if decode is None:
+            decode = self._decode = _decode_functions(*self.origin)[0]
+        return decode(data)
+
+    def __reduce__(self):
+        return MessageDecoder, self.origin
+
+
+@functools.lru_cache(maxsize=256)
+def _decode_functions(encoding, type_name, definition):
+    """The decode function and message class lookup of a definition"""
+    origin = (encoding, type_name, definition)
+    name = _normalize(type_name)
+    if encoding == "ros1":
+        types = parse_definition(type_name, definition)
+        builder = _Builder(types, cdr=False, origin=origin)
+        decode = builder.decoder(name)
+
+        def decode_message(data):
+            return decode(memoryview(data), 0)[0]
+
+        return decode_message, builder.message_class
+
+    if encoding == "cdr":
+        types = parse_definition(type_name, definition, ros2=True)
+        classes = {}
+        builders = [
+            _Builder(types, cdr=True, endian=endian, origin=origin, classes=classes)
+            for endian in (">", "<")
+        ]
+        # The second byte of the encapsulation header is 0 for big endian
+        decoders = [builder.decoder(name) for builder in builders]
+
+        def decode_message(data):
+            view = memoryview(data)
+            decode = decoders[view[1] & 1]
+            return decode(view[4:], 0)[0]
+
+        return decode_message, builders[0].message_class
+
+    if encoding == "json":
+        return _json_message, None
+    raise ValueError(f"unsupported message encoding {encoding}")
+
+
+def _json_message(data):
+    return json.loads(bytes(data))
+
+
+def ros1_decoder(type_name, definition):
+    """
+    A function decoding the ROS1 serialization of a message, given the type
+    name and full text definition of the message.
+    """
+    return MessageDecoder("ros1", type_name, definition)
+
+
+def cdr_decoder(type_name, definition):
+    """
+    A function decoding the CDR serialization of a ROS2 message, given the
+    type name and full ros2msg definition of the message.
+    """
+    return MessageDecoder("cdr", type_name, definition)
+
+
+def json_decoder(type_name=""):
+    """A function decoding JSON messages"""
+    return MessageDecoder("json", type_name, "")
+
+
+__all__ = [
+    "Message",
+    "MessageDecoder",
+    "Time",
+    "cdr_decoder",
+    "json_decoder",
+    "parse_definition",
+    "ros1_decoder",
+]
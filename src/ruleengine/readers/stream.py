@@ -0,0 +1,118 @@
+# Copyright 2024 coScene
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Feeding the engine from recordings: open the reader matching a file and
+read its chunks ahead in a background thread, so that reading and
+decompressing overlap with the evaluation of the rules. Messages are decoded
+lazily, only when a rule reads them (see `LazyMessage`).
+
+    engine = Engine(rules)
+    for item in read_items("recording.mcap", topics=["/rosout"]):
+        engine.consume_next(item)
+
+At most `read_ahead` chunks are held in memory besides the one being
+consumed, so memory stays bounded whatever the size of the file.
+"""
+
+import os
+import queue
+import threading
+from contextlib import closing
+
+from .bag import BagReader
+from .mcap import McapReader
+
+_READERS = {".bag": BagReader, ".mcap": McapReader}
+_DONE = object()
+
+
+def open_reader(path):
+    """The reader of a .bag or .mcap file"""
+    extension = os.path.splitext(path)[1].lower()
+    reader = _READERS.get(extension)
+    if reader is None:
+        raise ValueError(f"unsupported recording format: {path}")
+    return reader(path)
+
+
+def read_ahead(chunks, size=4):
+    """
+    Iterate over chunks, producing them in a background thread at most size
+    chunks ahead. Exceptions of the producer are raised to the consumer.
+    Closing the returned generator early stops the producer.
+    """
+    if size <= 0:
+        yield from chunks
+        return
+
+    buffer = queue.Queue(maxsize=size)
+    stop = threading.Event()
+
+    def put(value):
+        # Gives up when the consumer stopped, instead of blocking forever
+        while not stop.is_set():
+            try:
+                buffer.put(value, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for chunk in chunks:
+                if not put((chunk, None)):
+                    return
+            put((_DONE, None))
+        except BaseException as e:
+            put((_DONE, e))
+        finally:
+            close = getattr(chunks, "close", None)
+            if close is not None:
+                close()
+
+    thread = threading.Thread(target=produce, name="ruleengine-read-ahead", daemon=True)
+    thread.start()
+    try:
+        while True:
+            chunk, error = buffer.get()
+            if chunk is _DONE:
+                if error is not None:
+                    raise error
+                return
+            yield chunk
+    finally:
+        stop.set()
+        thread.join()
+
+
+def read_items(path, topics=None, read_ahead_chunks=4):
+    """
+    Iterate over the DiagnosisItems of a .bag or .mcap file, only those on
+    the given topics if not None. Chunks without messages on these topics
+    are skipped when the file is indexed.
+    """
+    with open_reader(path) as reader:
+        # Closed before the reader, so that the producer is done with the file
+        with closing(read_ahead(reader.chunks(topics), read_ahead_chunks)) as chunks:
+            for chunk in chunks:
+                yield from chunk
+
+
+__all__ = [
+    "open_reader",
+    "read_ahead",
+    "read_items",
+]
@@ -0,0 +1,246 @@
+# Copyright 2024 coScene
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import heapq
+import multiprocessing
+import pickle
+import traceback
+
+from ruleengine.dsl.validation.config_validator import (
+    validate_config,
+    validate_config_wrapped,
+)
+from ruleengine.engine import Engine
+
+
+class ShardedEngine:
+    """
+    An engine spreading the rules of a config across worker processes.
+
+    Rule i is evaluated by worker i % workers only, so the state of its
+    stateful conditions lives in a single process. Every item is sent to all
+    workers, which evaluate their rules and the arguments of the actions of
+    the triggered ones. The hits are merged back in item order then rule
+    order, and the callbacks and action impls are run in this process, so the
+    results are the same as with an `Engine` over all the rules.
+
+    Since conditions can't be pickled, each worker validates the config on
+    its own, which requires the config to be plain data.
+    """
+
+    def __init__(
+        self,
+        config,
+        action_impls,
+        workers=None,
+        should_trigger_action=None,
+        trigger_cb=None,
+        project_name="",
+        compiled=False,
+        mp_context=None,
+        action_executor=None,
+    ):
+        """
+        :param config: The rule specification, see `validate_config`.
+        :param action_impls: A dictionary of action implementations, run in
+            this process.
+        :param workers: Number of worker processes, defaults to the CPU count.
+        :param should_trigger_action: See `Engine`.
+        :param trigger_cb: See `Engine`.
+        :param project_name: The name of the project the rules belong to.
+        :param compiled: Whether to compile the conditions, see `validate_config`.
+        :param mp_context: The multiprocessing context to start workers with.
+        :param action_executor: See `Engine`.
+        """
+        result, rules = validate_config(config, action_impls, project_name, compiled)
+        if not result["success"]:
+            raise ValueError(f"invalid config: {result['errors']}")
+
+        self.__rules = rules
+        self.__action_impls = action_impls
+        self.__should_trigger_action = should_trigger_action
+        self.__trigger_cb = trigger_cb
+        self.__action_executor = action_executor
+
+        workers = workers or multiprocessing.cpu_count()
+        context = mp_context or multiprocessing.get_context()
+        self.__connections = []
+        self.__processes = []
+        for shard in range(workers):
+            parent_conn, child_conn = context.Pipe()
+            process = context.Process(
+                target=_worker_main,
+                args=(
+                    child_conn,
+                    config,
+                    list(action_impls),
+                    project_name,
+                    compiled,
+                    shard,
+                    workers,
+                ),
+                daemon=True,
+            )
+            process.start()
+            child_conn.close()
+            self.__connections.append(parent_conn)
+            self.__processes.append(process)
+
+        # Wait for the workers to be ready, so that setup errors surface here
+        self.__receive_all()
+
+    def consume_next(self, item):
+        self.consume_batch([item])
+
+    def consume_batch(self, items):
+        """
+        Consume a sequence of items, with the same results as calling
+        `Engine.consume_next` on each of them in order. Batches of a few
+        thousand items amortize the cost of sending them to the workers.
+        """
+        items = list(items)
+        if not items:
+            return
+
+        # Indices are sent along, since pickling merges repeated items
+        payload = pickle.dumps(
+            ("consume", list(enumerate(items))), pickle.HIGHEST_PROTOCOL
+        )
+        for conn in self.__connections:
+            conn.send_bytes(payload)
+
+        shard_hits = self.__receive_all()
+        for item_index, position, hit, calls in heapq.merge(*shard_hits):
+            self.__trigger(self.__rules[position], items[item_index], hit, calls)
+
+    def __receive_all(self):
+        replies = []
+        for conn in self.__connections:
+            try:
+                status, value = pickle.loads(conn.recv_bytes())
+            except EOFError:
+                status, value = "error", "worker exited"
+            if status == "error":
+                self.close()
+                raise RuntimeError(f"rule engine worker failed:\n{value}")
+            replies.append(value)
+        return replies
+
+    def __trigger(self, rule, item, hit, calls):
+        action_triggered = False
+        if not self.__should_trigger_action or self.__should_trigger_action(
+            rule.project_name, rule.spec, hit
+        ):
+            action_triggered = True
+            for name, kwargs in calls:
+                impl = self.__action_impls[name]
+                if self.__action_executor is not None:
+                    self.__action_executor.submit(name, impl, kwargs)
+                else:
+                    impl(**kwargs)
+
+        if self.__trigger_cb:
+            self.__trigger_cb(rule.project_name, rule.spec, hit, action_triggered, item)
+
+    def close(self):
+        """Stop the workers"""
+        for conn in self.__connections:
+            try:
+                conn.send_bytes(pickle.dumps(("close",)))
+            except (BrokenPipeError, OSError):
+                pass
+        for process in self.__processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        for conn in self.__connections:
+            conn.close()
+        self.__connections = []
+        self.__processes = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class _IndexedItem:
+    """An item of a batch, along with its index in the batch"""
+
+    __slots__ = ("index", "item", "topic", "msg", "ts", "msgtype")
+
+    def __init__(self, index, item):
+        self.index = index
+        self.item = item
+        self.topic = item.topic
+        self.msg = item.msg
+        self.ts = item.ts
+        self.msgtype = item.msgtype
+
+    def __getattr__(self, name):
+        return getattr(self.item, name)
+
+
+def _worker_main(conn, config, action_names, project_name, compiled, shard, shards):
+    # Actions are run by the parent, the impls here only record their
+    # evaluated arguments
+    calls = []
+
+    def recorder(name):
+        return lambda **kwargs: calls.append((name, kwargs))
+
+    hits = []
+
+    def trigger_cb(project_name, spec, hit, action_triggered, item):
+        position = position_by_spec[id(spec)]
+        hits.append((item.index, position, hit, list(calls)))
+        calls.clear()
+
+    try:
+        impls = {name: (lambda _, name=name: recorder(name)) for name in action_names}
+        _, rules = validate_config_wrapped(config, impls, project_name, compiled)
+
+        positions = list(range(shard, len(rules), shards))
+        position_by_spec = {id(rules[p].spec): p for p in positions}
+        engine = Engine([rules[p] for p in positions], trigger_cb=trigger_cb)
+    except Exception:
+        conn.send_bytes(pickle.dumps(("error", traceback.format_exc())))
+        conn.close()
+        return
+    conn.send_bytes(pickle.dumps(("ok", None)))
+
+    while True:
+        message = pickle.loads(conn.recv_bytes())
+        if message[0] == "close":
+            break
+
+        items = [_IndexedItem(index, item) for index, item in message[1]]
+        try:
+            engine.consume_batch(items)
+            reply = ("ok", hits)
+        except Exception:
+            reply = ("error", traceback.format_exc())
+        try:
+            conn.send_bytes(pickle.dumps(reply, pickle.HIGHEST_PROTOCOL))
+        except Exception:
+            conn.send_bytes(pickle.dumps(("error", traceback.format_exc())))
+        hits = []
+        calls.clear()
+    conn.close()
+
+
+__all__ = [
+    "ShardedEngine",
+]
@@ -0,0 +1,328 @@
+# Copyright 2024 coScene
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Minimal writers of ROS1 bags and MCAP files, and serializers of a few message
+types, to build the recordings the reader tests run on.
+"""
+
+import bz2
+import json
+import struct
+import zlib
+from collections import namedtuple
+
+Record = namedtuple("Record", "topic msgtype definition data ts encoding")
+
+LOG_DEFINITION = """\
+byte DEBUG=1 #debug level
+byte INFO=2
+byte WARN=4
+byte ERROR=8
+byte FATAL=16
+Header header
+byte level
+string name # name of the node
+string msg # message
+string file # file the message came from
+string function # function the message came from
+uint32 line # line the message came from
+string[] topics # topic names that the node publishes
+
+================================================================================
+MSG: std_msgs/Header
+uint32 seq
+time stamp
+string frame_id
+"""
+
+TWIST_DEFINITION = """\
+Vector3  linear
+Vector3  angular
+
+================================================================================
+MSG: geometry_msgs/Vector3
+float64 x
+float64 y
+float64 z
+"""
+
+ROS2_LOG_DEFINITION = """\
+byte DEBUG=10
+byte INFO=20
+byte WARN=30
+byte ERROR=40
+byte FATAL=50
+builtin_interfaces/Time stamp
+uint8 level
+string name
+string msg
+string file
+string function
+uint32 line
+
+================================================================================
+MSG: builtin_interfaces/Time
+int32 sec
+uint32 nanosec
+"""
+
+
+def _ros1_string(value):
+    data = value.encode()
+    return struct.pack("<I", len(data)) + data
+
+
+def ros1_log(ts, level, text, name="/node", topics=()):
+    secs, nsecs = int(ts), round(ts % 1 * 1e9)
+    data = struct.pack("<III", 0, secs, nsecs) + _ros1_string("")
+    data += struct.pack("<b", level)
+    for value in (name, text, "node.py", "main"):
+        data += _ros1_string(value)
+    data += struct.pack("<II", 42, len(topics))
+    for topic in topics:
+        data += _ros1_string(topic)
+    return Record("/rosout", "rosgraph_msgs/Log", LOG_DEFINITION, data, ts, "ros1")
+
+
+def ros1_twist(ts, x, z=0.0, topic="/cmd_vel"):
+    data = struct.pack("<6d", x, 0, 0, 0, 0, z)
+    return Record(topic, "geometry_msgs/Twist", TWIST_DEFINITION, data, ts, "ros1")
+
+
+def cdr_log(ts, level, text, name="node"):
+    """A little endian CDR rcl_interfaces/msg/Log"""
+    data = bytearray(struct.pack("<iIB", int(ts), round(ts % 1 * 1e9), level))
+    for value in (name, text, "node.py", "main"):
+        data += b"\0" * (-len(data) % 4)
+        encoded = value.encode() + b"\0"
+        data += struct.pack("<I", len(encoded)) + encoded
+    data += b"\0" * (-len(data) % 4) + struct.pack("<I", 7)
+    return Record(
+        "/rosout2",
+        "rcl_interfaces/msg/Log",
+        ROS2_LOG_DEFINITION,
+        b"\0\x01\0\0" + bytes(data),
+        ts,
+        "cdr",
+    )
+
+
+def json_message(ts, value, topic="/json"):
+    data = json.dumps(value).encode()
+    return Record(topic, "Status", "", data, ts, "json")
+
+
+def _batches(records, chunk_size):
+    for i in range(0, len(records), chunk_size):
+        end = i + chunk_size
+        yield records[i:end]
+
+
+def _time(ts):
+    return struct.pack("<II", int(ts), round(ts % 1 * 1e9))
+
+
+# ROS1 bags
+
+
+def _bag_header(**fields):
+    data = b""
+    for name, value in fields.items():
+        field = name.encode() + b"=" + value
+        data += struct.pack("<I", len(field)) + field
+    return data
+
+
+def _bag_record(header, data=b""):
+    return struct.pack("<I", len(header)) + header + struct.pack("<I", len(data)) + data
+
+
+def _bag_connection(conn, record):
+    header = _bag_header(
+        op=b"\x07", conn=struct.pack("<I", conn), topic=record.topic.encode()
+    )
+    data = _bag_header(
+        topic=record.topic.encode(),
+        type=record.msgtype.encode(),
+        md5sum=b"*",
+        message_definition=record.definition.encode(),
+    )
+    return _bag_record(header, data)
+
+
+def write_bag(path, records, chunk_size=2, compression="none", indexed=True):
+    """Write a bag of format 2.0, with chunks of chunk_size messages"""
+    connections = {}
+    chunk_infos = []
+    body = b""
+    start = len(b"#ROSBAG V2.0\n") + 4096 + 8
+
+    for batch in _batches(records, chunk_size):
+        chunk = b""
+        counts = {}
+        for record in batch:
+            if record.topic not in connections:
+                connections[record.topic] = (len(connections), record)
+                chunk += _bag_connection(len(connections) - 1, record)
+            conn = connections[record.topic][0]
+            counts[conn] = counts.get(conn, 0) + 1
+            header = _bag_header(
+                op=b"\x02", conn=struct.pack("<I", conn), time=_time(record.ts)
+            )
+            chunk += _bag_record(header, record.data)
+        data = bz2.compress(chunk) if compression == "bz2" else chunk
+        header = _bag_header(
+            op=b"\x05",
+            compression=compression.encode(),
+            size=struct.pack("<I", len(chunk)),
+        )
+        chunk_infos.append((start + len(body), batch, counts))
+        body += _bag_record(header, data)
+        for conn, count in counts.items():
+            header = _bag_header(
+                op=b"\x04",
+                ver=struct.pack("<I", 1),
+                conn=struct.pack("<I", conn),
+                count=struct.pack("<I", count),
+            )
+            body += _bag_record(header, b"\0" * 12 * count)
+
+    index_pos = start + len(body) if indexed else 0
+    if indexed:
+        for conn, record in connections.values():
+            body += _bag_connection(conn, record)
+        for position, batch, counts in chunk_infos:
+            header = _bag_header(
+                op=b"\x06",
+                ver=struct.pack("<I", 1),
+                chunk_pos=struct.pack("<Q", position),
+                start_time=_time(batch[0].ts),
+                end_time=_time(batch[-1].ts),
+                count=struct.pack("<I", len(counts)),
+            )
+            data = b"".join(struct.pack("<II", *pair) for pair in counts.items())
+            body += _bag_record(header, data)
+
+    header = _bag_header(
+        op=b"\x03",
+        index_pos=struct.pack("<Q", index_pos),
+        conn_count=struct.pack("<I", len(connections)),
+        chunk_count=struct.pack("<I", len(chunk_infos)),
+    )
+    header_record = _bag_record(header, b" " * (4096 - len(header)))
+    assert len(header_record) == 4096 + 8
+    with open(path, "wb") as f:
+        f.write(b"#ROSBAG V2.0\n" + header_record + body)
+
+
+# MCAP
+
+_SCHEMA_ENCODINGS = {"ros1": "ros1msg", "cdr": "ros2msg", "json": "jsonschema"}
+
+
+def _mcap_string(value):
+    data = value.encode()
+    return struct.pack("<I", len(data)) + data
+
+
+def _mcap_record(opcode, data):
+    return struct.pack("<BQ", opcode, len(data)) + data
+
+
+class _Channels:
+    def __init__(self):
+        self.ids = {}
+        self.records = {}
+
+    def add(self, record):
+        """The id of the channel of a record, and its schema and channel records if new"""
+        if record.topic in self.ids:
+            return self.ids[record.topic], b""
+        channel_id = len(self.ids) + 1
+        self.ids[record.topic] = channel_id
+        schema = _mcap_record(
+            0x03,
+            struct.pack("<H", channel_id)
+            + _mcap_string(record.msgtype)
+            + _mcap_string(_SCHEMA_ENCODINGS[record.encoding])
+            + struct.pack("<I", len(record.definition))
+            + record.definition.encode(),
+        )
+        channel = _mcap_record(
+            0x04,
+            struct.pack("<HH", channel_id, channel_id)
+            + _mcap_string(record.topic)
+            + _mcap_string(record.encoding)
+            + struct.pack("<I", 0),
+        )
+        self.records[channel_id] = schema + channel
+        return channel_id, schema + channel
+
+
+def _mcap_message(channel_id, record):
+    ts = round(record.ts * 1e9)
+    return _mcap_record(0x05, struct.pack("<HIQQ", channel_id, 0, ts, ts) + record.data)
+
+
+def write_mcap(path, records, chunk_size=2, chunked=True, summary=True):
+    """Write an uncompressed MCAP file, with chunks of chunk_size messages"""
+    channels = _Channels()
+    out = b"\x89MCAP0\r\n" + _mcap_record(
+        0x01, _mcap_string("") + _mcap_string("tests")
+    )
+    chunk_indexes = []
+
+    if not chunked:
+        for record in records:
+            channel_id, definitions = channels.add(record)
+            out += definitions + _mcap_message(channel_id, record)
+
+    for batch in _batches(records, chunk_size) if chunked else ():
+        data = b""
+        ids = set()
+        for record in batch:
+            channel_id, definitions = channels.add(record)
+            ids.add(channel_id)
+            data += definitions + _mcap_message(channel_id, record)
+        start, end = round(batch[0].ts * 1e9), round(batch[-1].ts * 1e9)
+        chunk = _mcap_record(
+            0x06,
+            struct.pack("<QQQI", start, end, len(data), zlib.crc32(data))
+            + _mcap_string("")
+            + struct.pack("<Q", len(data))
+            + data,
+        )
+        offsets = b"".join(struct.pack("<HQ", i, 0) for i in sorted(ids))
+        chunk_indexes.append(
+            _mcap_record(
+                0x08,
+                struct.pack("<QQQQ", start, end, len(out), len(chunk))
+                + struct.pack("<I", len(offsets))
+                + offsets
+                + struct.pack("<Q", 0)
+                + _mcap_string("")
+                + struct.pack("<QQ", len(data), len(data)),
+            )
+        )
+        out += chunk
+
+    out += _mcap_record(0x0F, struct.pack("<I", 0))
+    summary_start = 0
+    if summary:
+        summary_start = len(out)
+        out += b"".join(channels.records.values()) + b"".join(chunk_indexes)
+    out += _mcap_record(0x02, struct.pack("<QQI", summary_start, 0, 0))
+    with open(path, "wb") as f:
+        f.write(out + b"\x89MCAP0\r\n")
@@ -0,0 +1,141 @@
+# Copyright 2024 coScene
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+import time
+import unittest
+
+from ruleengine.action_executor import (
+    DROP_NEW,
+    DROP_OLDEST,
+    RAISE,
+    ActionExecutor,
+    ActionQueueFull,
+)
+from ruleengine.dsl.validation.config_validator import validate_config
+from ruleengine.engine import DiagnosisItem, Engine
+
+
+class ActionExecutorTest(unittest.TestCase):
+    def test_runs_all_calls(self):
+        results = []
+
+        def record(value):
+            results.append(value)
+
+        with ActionExecutor(max_workers=3) as executor:
+            for i in range(20):
+                executor.submit("upload", record, {"value": i})
+            self.assertTrue(executor.flush(timeout=5))
+            self.assertEqual(sorted(results), list(range(20)))
+            self.assertEqual(executor.stats["completed"], 20)
+
+    def test_per_type_limit(self):
+        running = {"upload": 0, "create_moment": 0}
+        peak = {"upload": 0, "create_moment": 0}
+        lock = threading.Lock()
+
+        def impl(name):
+            with lock:
+                running[name] += 1
+                peak[name] = max(peak[name], running[name])
+            time.sleep(0.01)
+            with lock:
+                running[name] -= 1
+
+        with ActionExecutor(max_workers=4, limits={"upload": 1}) as executor:
+            for _ in range(8):
+                for name in running:
+                    executor.submit(name, impl, {"name": name})
+        self.assertEqual(peak["upload"], 1)
+        self.assertGreater(peak["create_moment"], 1)
+
+    def test_overflow(self):
+        for policy, expected in ((DROP_NEW, [0]), (DROP_OLDEST, [3])):
+            with self.subTest(policy=policy):
+                results = []
+
+                def record(value):
+                    results.append(value)
+
+                executor, gate = self.__blocked_executor(policy)
+                executor.submit("upload", record, {"value": 0})
+                for i in range(1, 4):
+                    queued = executor.submit("upload", record, {"value": i})
+                    self.assertEqual(queued, policy == DROP_OLDEST)
+                self.assertEqual(executor.stats["dropped"], 3)
+                gate.set()
+                executor.close()
+                self.assertEqual(results, expected)
+
+    def test_raise_when_full(self):
+        executor, gate = self.__blocked_executor(RAISE)
+        executor.submit("upload", print, {})
+        with self.assertRaises(ActionQueueFull):
+            executor.submit("upload", print, {})
+        gate.set()
+        executor.close()
+
+    def test_close(self):
+        executor = ActionExecutor(1)
+        executor.submit("upload", lambda secs: time.sleep(secs), {"secs": 0.01})
+        executor.close()
+        self.assertEqual(executor.stats["completed"], 1)
+        with self.assertRaises(RuntimeError):
+            executor.submit("upload", print, {})
+
+    def test_failures_are_counted(self):
+        with ActionExecutor(1) as executor:
+            with self.assertLogs("ruleengine.action_executor", "ERROR"):
+                executor.submit("upload", lambda: 1 / 0, {})
+                executor.flush()
+        self.assertEqual(executor.stats["failed"], 1)
+
+    def test_engine(self):
+        calls = []
+        gate = threading.Event()
+
+        def upload(trigger_ts, **kwargs):
+            gate.wait()
+            calls.append(trigger_ts)
+
+        config = {
+            "version": "v1",
+            "rules": [{"when": ['topic == "/a"'], "actions": ["upload()"]}],
+        }
+        _, rules = validate_config(config, {"upload": upload})
+        with ActionExecutor(2) as executor:
+            engine = Engine(rules, action_executor=executor)
+            for i in range(3):
+                engine.consume_next(DiagnosisItem("/a", {}, i, "M"))
+            # The engine didn't wait for the upload
+            self.assertEqual(calls, [])
+            gate.set()
+            executor.flush()
+        self.assertEqual(sorted(calls), [0, 1, 2])
+
+    @staticmethod
+    def __blocked_executor(overflow):
+        """An executor with a queue of 1, and its single worker blocked"""
+        started = threading.Event()
+        gate = threading.Event()
+
+        def block():
+            started.set()
+            gate.wait()
+
+        executor = ActionExecutor(1, max_queue=1, overflow=overflow)
+        executor.submit("upload", block, {})
+        started.wait()
+        return executor, gate
@@ -0,0 +1,107 @@
+# Copyright 2024 coScene
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import random
+import unittest
+from collections import namedtuple
+
+from ruleengine.dsl.validation.config_validator import validate_config_wrapped
+from ruleengine.engine import DiagnosisItem, Engine
+
+MockMessage = namedtuple("MockMessage", "value msg level")
+
+config = {
+    "version": "v1",
+    "rules": [
+        {"when": ['topic == "/a" and msg.value > 5'], "actions": ["upload()"]},
+        {
+            "when": ['msg.value > get_value("threshold")', '"error" in msg.msg'],
+            "actions": ['create_moment(get_value("name"))'],
+            "each": [
+                {"threshold": 3, "name": "low"},
+                {"threshold": 8, "name": "high"},
+            ],
+        },
+        {
+            "when": ['sustained(topic == "/b", msg.value > 2, 2)'],
+            "actions": ["upload()"],
+        },
+        {
+            "when": ['sequential(topic == "/a", topic == "/c", duration=5)'],
+            "actions": ['create_moment("seq")'],
+        },
+        {"when": ['repeated("warn" in msg.msg, 3, 10)'], "actions": ["upload()"]},
+    ],
+}
+
+
+def make_items(seed, count):
+    rng = random.Random(seed)
+    return [
+        DiagnosisItem(
+            rng.choice(["/a", "/b", "/c"]),
+            MockMessage(rng.randint(0, 10), rng.choice(["ok", "error", "warn"]), 2),
+            i,
+            "MockMessage",
+        )
+        for i in range(count)
+    ]
+
+
+class ConsumeBatchTest(unittest.TestCase):
+    def test_same_events_as_consume_next(self):
+        items = make_items(7, 500)
+        expected = self.__run(lambda engine: [engine.consume_next(i) for i in items])
+        self.assertTrue(expected)
+
+        for size in (1, 7, 100, 500):
+            with self.subTest(size=size):
+                chunks = [items[i:][:size] for i in range(0, len(items), size)]
+                events = self.__run(
+                    lambda engine: [engine.consume_batch(c) for c in chunks]
+                )
+                self.assertEqual(events, expected)
+
+    def test_iterator(self):
+        items = make_items(3, 50)
+        expected = self.__run(lambda engine: [engine.consume_next(i) for i in items])
+        self.assertEqual(
+            self.__run(lambda engine: engine.consume_batch(iter(items))), expected
+        )
+
+    @staticmethod
+    def __run(consume):
+        events = []
+        allowed = {"count": 0}
+
+        def upload(trigger_ts, **kwargs):
+            events.append(("upload", trigger_ts))
+
+        def create_moment(title, timestamp, start_time, **kwargs):
+            events.append(("create_moment", title, timestamp, start_time))
+
+        def should_trigger_action(project_name, spec, hit):
+            # Stateful, so that the order of the calls matters
+            allowed["count"] += 1
+            return allowed["count"] % 3 != 0
+
+        def trigger_cb(project_name, spec, hit, action_triggered, item):
+            events.append(("trigger", hit["when"], action_triggered, item.ts))
+
+        _, rules = validate_config_wrapped(
+            config,
+            {"upload": lambda _: upload, "create_moment": lambda _: create_moment},
+        )
+        consume(Engine(rules, should_trigger_action, trigger_cb))
+        return events
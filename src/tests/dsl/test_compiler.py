@@ -0,0 +1,153 @@
+# Copyright 2024 coScene
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import sys
+import unittest
+from collections import namedtuple
+
+from ruleengine.dsl.base_actions import noop
+from ruleengine.dsl.compiler import CompiledCondition, compile_condition
+from ruleengine.dsl.sequence_conditions import SustainedCondition
+from ruleengine.dsl.validation.config_validator import validate_config
+from ruleengine.dsl.validation.validator import validate_condition
+from ruleengine.engine import DiagnosisItem
+from tests.dsl.utils import str_to_condition
+
+MockMessage = namedtuple("MockMessage", "int_value str_value list_value")
+RosMockMessage = namedtuple("RosMockMessage", "msg level")
+
+sequence = [
+    DiagnosisItem("t1", MockMessage(1, "hello", [0, 1]), 0, "MockMessage"),
+    DiagnosisItem("t2", MockMessage(2, "heLlo", [0, 1, 2]), 1, "MockMessage"),
+    DiagnosisItem("t1", MockMessage(3, "world", []), 2, "MockMessage"),
+    DiagnosisItem("t2", {"int_value": 4, "str_value": "x"}, 3, "dict"),
+    DiagnosisItem("t2", MockMessage(None, "The value is 324", [3]), 4, "MockMessage"),
+    DiagnosisItem("t1", RosMockMessage("error 1 occurred", 4), 5, "rosgraph_msgs/Log"),
+    DiagnosisItem("t1", RosMockMessage("all good", 2), 6, "rosgraph_msgs/Log"),
+    DiagnosisItem("t3", MockMessage(5, "hello", [5]), 7, "MockMessage"),
+    DiagnosisItem("t3", MockMessage(5, "hello", [5]), 9, "MockMessage"),
+]
+
+expressions = [
+    "always",
+    'topic == "t1"',
+    '"t1" != topic',
+    "msg.int_value > 2",
+    "2 < msg.int_value <= 4",
+    "-msg.int_value + 10 > 7",
+    "msg.int_value * 2 / 4 - 1 >= 0",
+    'msg["int_value"] == 4',
+    "msg.list_value[1] == 1",
+    "msg.this.doesnt.exist",
+    "is_none(msg.this.doesnt.exist)",
+    'not msg.str_value == "hello"',
+    'msg.str_value.upper() == "HELLO"',
+    '"el" in msg.str_value and get_value("cos/contains") == "el"',
+    '"el" not in msg.str_value',
+    'topic == "t1" or msg.int_value == 2 or msg.int_value',
+    'set_value("k", msg.int_value) and get_value("k") > 1',
+    'regex(msg.str_value, r"e[lL]lo").group(0) == "eLlo"',
+    'regex(msg.str_value, r"The value is (\\d+)").group(1) > 111',
+    'concat(topic, "-", msg.int_value)',
+    'f"{topic}/{msg.int_value:03d}"',
+    "3 in map_attr(msg.list_value, 'real')",
+    '"error 1" in log and log_level == LogLevel.WARN',
+    "ts - condition_start_time",
+    'sustained(topic == "t3", msg.int_value == 5, 1)',
+    'always and sequential(topic == "t1", set_value("a", ts), duration=3)',
+    'topic == "t3" and repeated(msg.int_value == 5, 2, 5)',
+]
+
+
+class CompilerTest(unittest.TestCase):
+    def test_same_results_as_interpreter(self):
+        for expr_str in expressions:
+            with self.subTest(expr_str):
+                interpreted = str_to_condition(expr_str)
+                compiled = compile_condition(str_to_condition(expr_str))
+                self.assertIsInstance(compiled, CompiledCondition)
+                for item in sequence:
+                    self.assertEqual(
+                        self._evaluate(interpreted, item),
+                        self._evaluate(compiled, item),
+                        item,
+                    )
+
+    def test_errors_are_preserved(self):
+        interpreted = str_to_condition("msg.str_value > 1")
+        compiled = compile_condition(str_to_condition("msg.str_value > 1"))
+        for cond in (interpreted, compiled):
+            with self.assertRaises(ValueError):
+                cond.evaluate_condition_at(sequence[0], {})
+
+    def test_fewer_calls(self):
+        expr_str = (
+            'topic == "t1" and msg.int_value > 2 and "el" in msg.str_value'
+            ' or msgtype == "rosgraph_msgs/Log" and "error" in log'
+        )
+        interpreted = str_to_condition(expr_str)
+        compiled = compile_condition(str_to_condition(expr_str))
+        self.assertLess(self._count_calls(compiled) * 3, self._count_calls(interpreted))
+
+    def test_opt_in(self):
+        self.assertNotIsInstance(
+            validate_condition('topic == "t1"').entity, CompiledCondition
+        )
+        self.assertIsInstance(
+            validate_condition('topic == "t1"', compiled=True).entity,
+            CompiledCondition,
+        )
+
+        config = {
+            "version": "v1",
+            "rules": [{"when": ['topic == "t1"'], "actions": ["upload()"]}],
+        }
+        _, rules = validate_config(config, noop, compiled=True)
+        self.assertIsInstance(rules[0].conditions[0], CompiledCondition)
+
+    def test_opaque_conditions_are_kept(self):
+        cond = SustainedCondition(str_to_condition("always"), 1)
+        self.assertIs(compile_condition(cond), cond)
+
+    @staticmethod
+    def _evaluate(cond, item):
+        try:
+            value, scope = cond.evaluate_condition_at(item, {"start_time": 1})
+        except Exception as e:
+            return type(e)
+        # Match objects don't compare equal, compare their groups instead
+        return _normalize(value), {k: _normalize(v) for k, v in scope.items()}
+
+    @staticmethod
+    def _count_calls(cond):
+        count = 0
+
+        def profile(frame, event, arg):
+            nonlocal count
+            if event in ("call", "c_call"):
+                count += 1
+
+        sys.setprofile(profile)
+        try:
+            for item in sequence:
+                cond.evaluate_condition_at(item, {})
+        finally:
+            sys.setprofile(None)
+        return count
+
+
+def _normalize(value):
+    if hasattr(value, "groups") and hasattr(value, "span"):
+        return value.group(0), value.groups(), value.span()
+    return value
@@ -0,0 +1,153 @@
+# Copyright 2024 coScene
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+from collections import namedtuple
+
+from ruleengine.dispatch import DispatchIndex
+from ruleengine.dsl.action import Action
+from ruleengine.dsl.analysis import dispatch_guards
+from ruleengine.dsl.condition import Condition
+from ruleengine.engine import DiagnosisItem, Engine, Rule
+from tests.dsl.utils import str_to_condition
+
+MockMessage = namedtuple("MockMessage", "int_value str_value")
+
+
+class CountingCondition(Condition):
+    """An opaque condition that counts how many times it is evaluated"""
+
+    def __init__(self):
+        self.count = 0
+
+    def evaluate_condition_at(self, item, scope):
+        self.count += 1
+        return True, scope
+
+
+class CollectAction(Action):
+    def __init__(self):
+        self.collector = []
+
+    def run(self, item, scope):
+        self.collector.append(item)
+
+
+class DispatchGuardsTest(unittest.TestCase):
+    def test_simple_guards(self):
+        self.assertEqual(self._guards('topic == "/a"'), {("topic", "/a")})
+        self.assertEqual(self._guards('"/a" == topic'), {("topic", "/a")})
+        self.assertEqual(self._guards('msgtype == "M"'), {("msgtype", "M")})
+        self.assertEqual(
+            self._guards('topic in ["/a", "/b"]'), {("topic", "/a"), ("topic", "/b")}
+        )
+
+    def test_conjunction(self):
+        self.assertEqual(
+            self._guards('topic == "/a" and msg.int_value > 1'), {("topic", "/a")}
+        )
+        self.assertEqual(
+            self._guards('msg.int_value > 1 and msgtype == "M"'), {("msgtype", "M")}
+        )
+        self.assertEqual(
+            self._guards('sustained(topic == "/a", msg.int_value > 1, 2)'),
+            {("topic", "/a")},
+        )
+        self.assertEqual(
+            self._guards('repeated(topic == "/a", 2, 5)'), {("topic", "/a")}
+        )
+
+    def test_disjunction(self):
+        self.assertEqual(
+            self._guards('topic == "/a" or msgtype == "M"'),
+            {("topic", "/a"), ("msgtype", "M")},
+        )
+        self.assertIsNone(self._guards('topic == "/a" or msg.int_value > 1'))
+
+    def test_unguarded(self):
+        self.assertIsNone(self._guards("always"))
+        self.assertIsNone(self._guards('topic != "/a"'))
+        self.assertIsNone(self._guards('topic in "/a/b"'))
+        self.assertIsNone(self._guards('msg.str_value == "/a"'))
+        self.assertIsNone(self._guards('not topic == "/a"'))
+        # A stateful condition is evaluated before the guard, so it must see
+        # every item
+        self.assertIsNone(
+            self._guards('throttle(msg.int_value > 1, 1) and topic == "/a"')
+        )
+        self.assertIsNone(
+            self._guards('sequential(topic == "/a", topic == "/b", duration=1)')
+        )
+
+    def test_never_true(self):
+        self.assertEqual(self._guards('0 and topic == "/a"'), set())
+
+    @staticmethod
+    def _guards(expr_str):
+        return dispatch_guards(str_to_condition(expr_str))
+
+
+class DispatchIndexTest(unittest.TestCase):
+    def test_rules_for(self):
+        rules = [
+            Rule([str_to_condition('topic == "/a"')], [], {}),
+            Rule([str_to_condition("always")], [], {}),
+            Rule(
+                [
+                    str_to_condition('msgtype == "M"'),
+                    str_to_condition('topic == "/b"'),
+                ],
+                [],
+                {},
+            ),
+        ]
+        index = DispatchIndex(rules)
+        self.assertEqual(
+            index.rules_for(DiagnosisItem("/a", None, 0, "M")),
+            [rules[0], rules[1], rules[2]],
+        )
+        self.assertEqual(
+            index.rules_for(DiagnosisItem("/a", None, 0, "N")), [rules[0], rules[1]]
+        )
+        self.assertEqual(
+            index.rules_for(DiagnosisItem("/b", None, 0, "N")), [rules[1], rules[2]]
+        )
+        self.assertEqual(index.rules_for(DiagnosisItem("/c", None, 0, "N")), [rules[1]])
+        self.assertEqual(index.catch_all, [rules[1]])
+
+    def test_engine_skips_unreachable_rules(self):
+        guarded, unguarded = CountingCondition(), CountingCondition()
+        guarded_action, unguarded_action = CollectAction(), CollectAction()
+        engine = Engine(
+            [
+                Rule(
+                    [str_to_condition('topic == "/a" and c', {"c": guarded})],
+                    [guarded_action],
+                    {},
+                ),
+                Rule([unguarded], [unguarded_action], {}),
+            ]
+        )
+        items = [
+            DiagnosisItem("/a", MockMessage(1, "a"), 0, "M"),
+            DiagnosisItem("/b", MockMessage(2, "b"), 1, "M"),
+            DiagnosisItem("/a", MockMessage(3, "c"), 2, "M"),
+        ]
+        for item in items:
+            engine.consume_next(item)
+
+        self.assertEqual(guarded.count, 2)
+        self.assertEqual(unguarded.count, 3)
+        self.assertEqual(guarded_action.collector, [items[0], items[2]])
+        self.assertEqual(unguarded_action.collector, items)
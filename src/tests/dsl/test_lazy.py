@@ -0,0 +1,122 @@
+# Copyright 2024 coScene
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pickle
+import threading
+import time
+import unittest
+from collections import namedtuple
+
+from ruleengine.dsl.compiler import compile_condition
+from ruleengine.dsl.condition import get_attr_or_item, get_item_or_attr
+from ruleengine.dsl.lazy import LazyMessage
+from ruleengine.dsl.scope import Scope
+from ruleengine.engine import DiagnosisItem, Engine, Rule
+from tests.dsl.utils import str_to_condition
+
+MockMessage = namedtuple("MockMessage", "value msg")
+
+
+class CountingDecoder:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, data):
+        self.count += 1
+        value, text = data.split(b":")
+        return MockMessage(int(value), text.decode())
+
+
+def lazy_item(decoder, data, topic="/a"):
+    return DiagnosisItem(topic, LazyMessage(decoder, data), 0, "M")
+
+
+class LazyMessageTest(unittest.TestCase):
+    def test_decodes_once(self):
+        decoder = CountingDecoder()
+        lazy = LazyMessage(decoder, b"3:hello")
+        self.assertFalse(lazy.decoded)
+        self.assertEqual(repr(lazy), "LazyMessage(<undecoded>)")
+        self.assertEqual(lazy.value, MockMessage(3, "hello"))
+        self.assertEqual(lazy.msg, "hello")
+        self.assertEqual(lazy[0], 3)
+        self.assertTrue(lazy.decoded)
+        self.assertEqual(decoder.count, 1)
+
+    def test_decodes_once_across_threads(self):
+        class SlowDecoder(CountingDecoder):
+            def __call__(self, data):
+                time.sleep(0.01)
+                return super().__call__(data)
+
+        decoder = SlowDecoder()
+        lazy = LazyMessage(decoder, b"3:hello")
+        barrier = threading.Barrier(8)
+        values = []
+
+        def read():
+            barrier.wait()
+            values.append(lazy.value)
+
+        threads = [threading.Thread(target=read) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(values, [MockMessage(3, "hello")] * 8)
+        self.assertEqual(decoder.count, 1)
+
+    def test_field_access(self):
+        lazy = LazyMessage(CountingDecoder(), b"3:hello")
+        self.assertEqual(get_attr_or_item("value")(lazy), 3)
+        self.assertEqual(get_item_or_attr("msg")(LazyMessage(dict, [("msg", 1)])), 1)
+
+    def test_pickles_decoded(self):
+        lazy = LazyMessage(lambda data: {"value": int(data)}, b"3")
+        self.assertEqual(pickle.loads(pickle.dumps(lazy)), {"value": 3})
+
+    def test_conditions(self):
+        for compiled in (False, True):
+            with self.subTest(compiled=compiled):
+                cond = str_to_condition('msg.value > 2 and msg.msg == "hello"')
+                if compiled:
+                    cond = compile_condition(cond)
+                decoder = CountingDecoder()
+                item = lazy_item(decoder, b"3:hello")
+                self.assertTrue(cond.evaluate_condition_at(item, Scope())[0])
+                self.assertTrue(cond.evaluate_condition_at(item, Scope())[0])
+                self.assertEqual(decoder.count, 1)
+
+    def test_engine(self):
+        hits = []
+
+        def rule(when):
+            return Rule([str_to_condition(when)], [], {})
+
+        engine = Engine(
+            [
+                rule('topic == "/a" and msg.value > 2'),
+                rule('topic == "/a" and msg.msg == "hello"'),
+                rule('topic == "/b" and msg.value > 0'),
+            ],
+            trigger_cb=lambda *args: hits.append(args[-1].topic),
+        )
+        decoder = CountingDecoder()
+        engine.consume_next(lazy_item(decoder, b"3:hello"))
+        self.assertEqual(decoder.count, 1)
+        self.assertEqual(hits, ["/a", "/a"])
+
+        # No rule reads the message of other topics
+        engine.consume_next(lazy_item(decoder, b"3:hello", topic="/c"))
+        self.assertEqual(decoder.count, 1)
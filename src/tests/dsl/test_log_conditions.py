@@ -16,6 +16,7 @@ import unittest
 from collections import namedtuple
 
 from ruleengine.dsl.action import Action
+from ruleengine.dsl.log_conditions import LogLevel, ros_log_level
 from ruleengine.engine import DiagnosisItem, Engine, Rule
 from tests.dsl.utils import str_to_condition
 
@@ -73,6 +74,28 @@ class LogConditionTest(unittest.TestCase):
         result = self.__run_test("log_level == LogLevel.UNKNOWN")
         self.assertEqual(len(result), 5, result)
 
+    def test_ros_levels(self):
+        self.assertEqual(
+            [ros_log_level(num) for num in (1, 2, 4, 8, 16, 0)],
+            [
+                LogLevel.DEBUG,
+                LogLevel.INFO,
+                LogLevel.WARN,
+                LogLevel.ERROR,
+                LogLevel.FATAL,
+                LogLevel.UNKNOWN,
+            ],
+        )
+
+        action = CollectAction()
+        engine = Engine(
+            [Rule([str_to_condition("log_level == LogLevel.ERROR")], [action], {})]
+        )
+        error = DiagnosisItem("t1", RosMockMessage("failed", 8), 8, "rosgraph_msgs/Log")
+        for item in simple_sequence + [error]:
+            engine.consume_next(item)
+        self.assertEqual(action.collector, [error])
+
     @staticmethod
     def __run_test(expr_str):
         action = CollectAction()
@@ -0,0 +1,96 @@
+# Copyright 2024 coScene
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+from collections import namedtuple
+
+from ruleengine.dsl.base_actions import noop
+from ruleengine.dsl.validation.config_validator import validate_config
+from ruleengine.engine import DiagnosisItem, Engine
+
+MockMessage = namedtuple("MockMessage", "value")
+
+config = {
+    "version": "v1",
+    "rules": [
+        {"when": ['topic == "/a"', "msg.value > 1"], "actions": ["upload()"]},
+        {"when": ['topic == "/b" and msg.value > 2'], "actions": ["upload()"]},
+    ],
+}
+
+items = [
+    DiagnosisItem(topic, MockMessage(value), ts, "MockMessage")
+    for ts, (topic, value) in enumerate(
+        [("/a", 0), ("/a", 2), ("/b", 3), ("/b", 1), ("/c", 5)]
+    )
+]
+
+
+class EngineMetricsTest(unittest.TestCase):
+    def test_disabled(self):
+        _, rules = validate_config(config, noop)
+        self.assertIsNone(Engine(rules).metrics)
+
+    def test_snapshot(self):
+        for batch in (False, True):
+            with self.subTest(batch=batch):
+                snapshot = self.__run(batch).snapshot()
+
+                first, second = snapshot["rules"]
+                self.assertEqual(first["rule"], 0)
+                self.assertEqual((first["evaluations"], first["hits"]), (5, 4))
+                self.assertEqual(
+                    [(w["evaluations"], w["hits"]) for w in first["when"]],
+                    [(5, 2), (5, 3)],
+                )
+                # The second rule is only dispatched the items of its topic
+                self.assertEqual((second["evaluations"], second["hits"]), (2, 1))
+                self.assertGreater(first["seconds"], 0)
+                self.assertGreaterEqual(first["seconds"], first["max_seconds"])
+
+                self.assertEqual(
+                    {t: s["items"] for t, s in snapshot["topics"].items()},
+                    {"/a": 2, "/b": 2, "/c": 1},
+                )
+                self.assertGreater(snapshot["topics"]["/c"]["items_per_second"], 0)
+
+    def test_prometheus(self):
+        text = self.__run(False).to_prometheus()
+        lines = text.splitlines()
+        self.assertIn("# TYPE ruleengine_rule_hits_total counter", lines)
+        self.assertIn('ruleengine_rule_hits_total{rule="0",project=""} 4', lines)
+        self.assertIn(
+            'ruleengine_condition_hits_total{rule="0",project="",when="1"} 3', lines
+        )
+        self.assertIn('ruleengine_topic_items_total{topic="/c"} 1', lines)
+        for line in lines:
+            if not line.startswith("#"):
+                float(line.rsplit(" ", 1)[1])
+
+    def test_reset(self):
+        metrics = self.__run(False)
+        metrics.reset()
+        self.assertEqual(metrics.snapshot()["rules"][0]["evaluations"], 0)
+        self.assertEqual(metrics.snapshot()["topics"], {})
+
+    @staticmethod
+    def __run(batch):
+        _, rules = validate_config(config, noop)
+        engine = Engine(rules, instrument=True)
+        if batch:
+            engine.consume_batch(items)
+        else:
+            for item in items:
+                engine.consume_next(item)
+        return engine.metrics
@@ -0,0 +1,128 @@
+# Copyright 2024 coScene
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import random
+import unittest
+from collections import namedtuple
+
+from ruleengine.dsl.action import Action
+from ruleengine.dsl.analysis import walk
+from ruleengine.dsl.compiler import compile_condition
+from ruleengine.dsl.multi_match import (
+    AhoCorasick,
+    SharedHasCondition,
+    share_substring_scans,
+)
+from ruleengine.engine import DiagnosisItem, Engine, Rule
+from tests.dsl.utils import str_to_condition
+
+RosMockMessage = namedtuple("RosMockMessage", "msg level")
+
+log_sequence = [
+    DiagnosisItem("/rosout", RosMockMessage(text, 2), i, "rosgraph_msgs/Log")
+    for i, text in enumerate(
+        [
+            "error 1 occurred",
+            "error 21 occurred",
+            "nothing to see here",
+            "she sells sea shells",
+            "hers",
+        ]
+    )
+] + [DiagnosisItem("/list", RosMockMessage(["error 1", "he"], 2), 5, "MockMessage")]
+
+log_expressions = [
+    '"error 1" in msg.msg',
+    '"error 21" in msg.msg and get_value("cos/contains") == "error 21"',
+    '"he" in msg.msg or "she" in msg.msg',
+    '"hers" in msg.msg and not "his" in msg.msg',
+    '"" in msg.msg',
+    '"error 1" in log',
+    '"sea" in log and get_value("cos/contains")',
+]
+
+
+class CollectAction(Action):
+    def __init__(self):
+        self.collector = []
+
+    def run(self, item, scope):
+        self.collector.append((item.ts, scope.get("cos/contains")))
+
+
+class AhoCorasickTest(unittest.TestCase):
+    def test_find(self):
+        automaton = AhoCorasick(["he", "she", "his", "hers"])
+        self.assertEqual(automaton.find("ushers"), {"he", "she", "hers"})
+        self.assertEqual(automaton.find("hi"), set())
+        self.assertEqual(AhoCorasick(["", "a"]).find("b"), {""})
+
+    def test_same_as_naive(self):
+        rng = random.Random(42)
+
+        def word(n):
+            return "".join(rng.choice("abc ") for _ in range(n))
+
+        needles = [word(rng.randint(1, 5)) for _ in range(50)]
+        automaton = AhoCorasick(needles)
+        for _ in range(200):
+            text = word(rng.randint(0, 40))
+            self.assertEqual(
+                automaton.find(text), {n for n in needles if n in text}, text
+            )
+
+
+class ShareSubstringScansTest(unittest.TestCase):
+    def test_rewrite(self):
+        conditions = [[str_to_condition(expr)] for expr in log_expressions]
+        rewritten = share_substring_scans(conditions)
+
+        shared = [
+            node
+            for conditions in rewritten
+            for cond in conditions
+            for node in walk(cond)
+            if isinstance(node, SharedHasCondition)
+        ]
+        self.assertEqual(len(shared), 9)
+        # Only one scan per subject
+        scans = {node._node.operands[2] for node in shared}
+        self.assertEqual(len(scans), 2)
+
+    def test_single_needle_is_left_alone(self):
+        conditions = [[str_to_condition('"a" in msg.msg')]]
+        self.assertIs(share_substring_scans(conditions), conditions)
+
+    def test_engine_results(self):
+        for compiled in (False, True):
+            with self.subTest(compiled=compiled):
+                self.assertEqual(
+                    self.__run(optimize=False, compiled=compiled),
+                    self.__run(optimize=True, compiled=compiled),
+                )
+
+    @staticmethod
+    def __run(optimize, compiled):
+        actions = [CollectAction() for _ in log_expressions]
+        rules = []
+        for expr, action in zip(log_expressions, actions):
+            cond = str_to_condition(expr)
+            if compiled:
+                cond = compile_condition(cond)
+            rules.append(Rule([cond], [action], {}))
+
+        engine = Engine(rules, optimize=optimize)
+        for item in log_sequence:
+            engine.consume_next(item)
+        return [action.collector for action in actions]
@@ -0,0 +1,199 @@
+# Copyright 2024 coScene
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+from ruleengine.dsl.action import Action
+from ruleengine.dsl.analysis import msg_field_paths
+from ruleengine.dsl.base_actions import noop_create_moment, noop_upload
+from ruleengine.dsl.condition import Condition
+from ruleengine.dsl.validation.config_validator import validate_config_wrapped
+from ruleengine.engine import Rule
+from ruleengine.projection import FieldProjection
+from tests.dsl.utils import str_to_condition
+
+impls = {
+    "upload": lambda _: noop_upload,
+    "create_moment": lambda _: noop_create_moment,
+}
+
+
+def validated_rules(rule_specs):
+    result, rules = validate_config_wrapped(
+        {"version": "v1", "rules": rule_specs}, impls
+    )
+    assert result["success"], result
+    return rules
+
+
+class OpaqueCondition(Condition):
+    def evaluate_condition_at(self, item, scope):
+        return item.msg, scope
+
+
+class MsgFieldPathsTest(unittest.TestCase):
+    def _paths(self, expr):
+        return msg_field_paths(str_to_condition(expr))
+
+    def test_paths(self):
+        self.assertEqual(
+            self._paths("msg.a.b > 1 and msg.c[0].d == msg.e"),
+            {(None, None): {("a", "b"), ("c", "d"), ("e",)}},
+        )
+        self.assertEqual(self._paths('msg["a"] == 1'), {(None, None): {("a",)}})
+        self.assertEqual(self._paths("ts > 1"), {})
+
+    def test_whole_message(self):
+        self.assertEqual(
+            self._paths("func_apply(len, msg.a) > 1 and func_apply(str, msg)"),
+            {(None, None): {("a",), ()}},
+        )
+
+    def test_method_calls(self):
+        self.assertEqual(
+            self._paths('msg.msg.lower() == "x" and msg.header.stamp.to_sec() > 1'),
+            {(None, None): {("msg",), ("header", "stamp")}},
+        )
+        self.assertEqual(
+            self._paths('msg.msg.strip().lower() == "x"'), {(None, None): {("msg",)}}
+        )
+        self.assertEqual(self._paths('msg.get("a")'), {(None, None): {()}})
+
+    def test_narrowed_by_guards(self):
+        self.assertEqual(
+            self._paths('topic == "/a" and msg.x > 1 or msgtype == "T" and msg.y'),
+            {("/a", None): {("x",)}, (None, "T"): {("y",)}},
+        )
+        self.assertEqual(
+            self._paths('topic == "/a" and topic == "/b" and msg.x'),
+            {},
+        )
+        self.assertEqual(
+            self._paths('log_level == LogLevel.ERROR and "fail" in log'),
+            {
+                (None, "rosgraph_msgs/Log"): {("level",), ("msg",)},
+                (None, "foxglove_msgs/Log"): {("level",), ("message",)},
+                (None, "foxglove.Log"): {("level",), ("message",)},
+            },
+        )
+
+    def test_stateful(self):
+        self.assertEqual(
+            self._paths('sequential(msg.a == 1, topic == "/b" and msg.b, duration=2)'),
+            {(None, None): {("a",)}, ("/b", None): {("b",)}},
+        )
+        self.assertEqual(
+            self._paths("repeated(msg.a > 1, 3, 5)"), {(None, None): {("a",)}}
+        )
+
+    def test_opaque(self):
+        self.assertIsNone(msg_field_paths(OpaqueCondition()))
+        self.assertIsNone(msg_field_paths(Condition.map(OpaqueCondition(), str)))
+
+
+class FieldProjectionTest(unittest.TestCase):
+    def test_rules(self):
+        rules = validated_rules(
+            [
+                {
+                    "when": ['topic == "/odom" and msg.twist.linear.x > 1'],
+                    "actions": ['create_moment("fast", description=msg.pose)'],
+                },
+                {
+                    "when": ['topic == "/odom" and msg.twist.angular.z > 1'],
+                    "actions": ["upload()"],
+                },
+                {
+                    "when": ['msgtype == "Diag" and map_attr(msg.status, "level")'],
+                    "actions": ["upload(title=msg.name)"],
+                },
+            ]
+        )
+        projection = FieldProjection(rules)
+        self.assertEqual(projection.undetermined, [])
+        self.assertEqual(
+            projection.fields,
+            {
+                "/odom": {
+                    None: {
+                        ("twist", "linear", "x"),
+                        ("twist", "angular", "z"),
+                        ("pose",),
+                    }
+                },
+                None: {"Diag": {("status", "level"), ("name",)}},
+            },
+        )
+        self.assertEqual(
+            projection.paths_for("/odom", "Diag"),
+            {
+                ("twist", "linear", "x"),
+                ("twist", "angular", "z"),
+                ("pose",),
+                ("status", "level"),
+                ("name",),
+            },
+        )
+        self.assertEqual(projection.paths_for("/other", "Other"), set())
+
+    def test_prefixes_are_merged(self):
+        rules = validated_rules(
+            [
+                {"when": ["msg.a.b > 1"], "actions": ["upload()"]},
+                {"when": ["msg.a"], "actions": ["upload()"]},
+            ]
+        )
+        self.assertEqual(FieldProjection(rules).paths_for("/t", "T"), {("a",)})
+
+    def test_method_calls(self):
+        rules = validated_rules(
+            [
+                {
+                    "when": ['topic == "/rosout" and msg.msg.lower() == "fail"'],
+                    "actions": ["upload()"],
+                },
+                {"when": ['msg.name.endswith("x")'], "actions": ["upload()"]},
+            ]
+        )
+        self.assertEqual(
+            FieldProjection(rules).paths_for("/rosout", "T"), {("msg",), ("name",)}
+        )
+
+    def test_whole_message(self):
+        rules = validated_rules(
+            [
+                {
+                    "when": ['topic == "/t" and concat("message: ", msg)'],
+                    "actions": ["upload()"],
+                }
+            ]
+        )
+        projection = FieldProjection(rules)
+        self.assertIsNone(projection.paths_for("/t", "T"))
+        self.assertEqual(projection.paths_for("/u", "T"), set())
+
+    def test_undetermined(self):
+        class CustomAction(Action):
+            def run(self, item, scope):
+                pass
+
+        rules = [
+            Rule([OpaqueCondition()], [], {}),
+            Rule([str_to_condition("msg.a")], [CustomAction()], {}),
+            Rule([str_to_condition("msg.b")], [], {}),
+        ]
+        projection = FieldProjection(rules)
+        self.assertEqual(projection.undetermined, rules[:2])
+        self.assertEqual(projection.fields, {None: {None: {("b",)}}})
+        self.assertIsNone(projection.paths_for("/t", "T"))
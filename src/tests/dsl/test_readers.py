@@ -0,0 +1,254 @@
+# Copyright 2024 coScene
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import pickle
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from ruleengine.dsl.base_actions import noop_create_moment, noop_upload
+from ruleengine.dsl.validation.config_validator import validate_config_wrapped
+from ruleengine.engine import Engine
+from ruleengine.readers import bag, mcap
+from ruleengine.readers.bag import BagReader
+from ruleengine.readers.mcap import McapReader
+from ruleengine.readers.stream import read_ahead, read_items
+
+from .recordings import (
+    cdr_log,
+    json_message,
+    ros1_log,
+    ros1_twist,
+    write_bag,
+    write_mcap,
+)
+
+records = [
+    ros1_log(1.5, 2, "starting", topics=["/cmd_vel", "/odom"]),
+    ros1_log(2.0, 8, "motor 3 overheated"),
+    ros1_twist(2.25, 0.5),
+    ros1_twist(2.5, 1.5, z=0.25),
+    ros1_log(3.0, 4, "battery low"),
+    ros1_log(3.5, 16, "shutting down"),
+]
+
+
+class RecordingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+
+    def path(self, name):
+        return os.path.join(self.dir.name, name)
+
+    def count_decompress(self, module):
+        """Count the chunks decompressed by a reader module"""
+        calls = []
+        original = module.decompress
+
+        def decompress(*args):
+            calls.append(args[0])
+            return original(*args)
+
+        patcher = mock.patch.object(module, "decompress", decompress)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return calls
+
+
+class BagReaderTest(RecordingTestCase):
+    def test_decodes_messages(self):
+        path = self.path("test.bag")
+        write_bag(path, records)
+        items = list(read_items(path))
+
+        self.assertEqual([i.topic for i in items], [r.topic for r in records])
+        self.assertEqual([i.ts for i in items], [r.ts for r in records])
+        self.assertEqual(items[0].msgtype, "rosgraph_msgs/Log")
+        log = items[0].msg
+        self.assertEqual(log.msg, "starting")
+        self.assertEqual(log.level, 2)
+        self.assertEqual(log.line, 42)
+        self.assertEqual(log.topics, ["/cmd_vel", "/odom"])
+        self.assertEqual(log.header.stamp.to_sec(), 1.5)
+        twist = items[3].msg
+        self.assertEqual(items[3].msgtype, "geometry_msgs/Twist")
+        self.assertEqual((twist.linear.x, twist.angular.z), (1.5, 0.25))
+
+    def test_topics(self):
+        path = self.path("test.bag")
+        write_bag(path, records)
+        with BagReader(path) as reader:
+            self.assertTrue(reader.indexed)
+            self.assertEqual(
+                reader.topics,
+                {"/rosout": "rosgraph_msgs/Log", "/cmd_vel": "geometry_msgs/Twist"},
+            )
+
+    def test_skips_chunks_of_other_topics(self):
+        path = self.path("test.bag")
+        write_bag(path, records, compression="bz2")
+        calls = self.count_decompress(bag)
+
+        items = list(read_items(path, topics=["/cmd_vel"]))
+        self.assertEqual([i.msg.linear.x for i in items], [0.5, 1.5])
+        # The two other chunks only have /rosout messages
+        self.assertEqual(calls, ["bz2"])
+
+    def test_filters_topics_within_chunks(self):
+        path = self.path("test.bag")
+        write_bag(path, records, chunk_size=4)
+        items = list(read_items(path, topics=["/rosout"]))
+        self.assertEqual([i.ts for i in items], [1.5, 2.0, 3.0, 3.5])
+
+    def test_unindexed(self):
+        path = self.path("test.bag")
+        write_bag(path, records, compression="bz2", indexed=False)
+        with BagReader(path) as reader:
+            self.assertFalse(reader.indexed)
+            chunks = list(reader.chunks(["/cmd_vel"]))
+        self.assertEqual([[i.ts for i in chunk] for chunk in chunks], [[2.25, 2.5]])
+
+    def test_not_a_bag(self):
+        path = self.path("test.bag")
+        write_mcap(path, records)
+        with self.assertRaises(ValueError):
+            BagReader(path)
+
+
+class McapReaderTest(RecordingTestCase):
+    def test_decodes_messages(self):
+        path = self.path("test.mcap")
+        extra = [cdr_log(4.0, 40, "ros2 error"), json_message(4.5, {"ok": True})]
+        write_mcap(path, records + extra)
+        items = list(read_items(path))
+
+        self.assertEqual([i.ts for i in items], [r.ts for r in records + extra])
+        self.assertEqual(items[1].msg.msg, "motor 3 overheated")
+        self.assertEqual(items[3].msg.angular.z, 0.25)
+        ros2_log = items[6].msg
+        self.assertEqual(items[6].msgtype, "rcl_interfaces/msg/Log")
+        self.assertEqual((ros2_log.level, ros2_log.msg), (40, "ros2 error"))
+        self.assertEqual((ros2_log.stamp.sec, ros2_log.line), (4, 7))
+        self.assertEqual(items[7].msg.value, {"ok": True})
+
+    def test_skips_chunks_of_other_topics(self):
+        path = self.path("test.mcap")
+        write_mcap(path, records)
+        calls = self.count_decompress(mcap)
+        with McapReader(path) as reader:
+            self.assertTrue(reader.indexed)
+            chunks = list(reader.chunks(["/cmd_vel"]))
+        self.assertEqual([[i.ts for i in chunk] for chunk in chunks], [[2.25, 2.5]])
+        self.assertEqual(len(calls), 1)
+
+    def test_without_summary(self):
+        path = self.path("test.mcap")
+        write_mcap(path, records, summary=False)
+        with McapReader(path) as reader:
+            self.assertFalse(reader.indexed)
+            items = [i for chunk in reader.chunks(["/cmd_vel"]) for i in chunk]
+        self.assertEqual([i.ts for i in items], [2.25, 2.5])
+
+    def test_unchunked(self):
+        path = self.path("test.mcap")
+        write_mcap(path, records, chunked=False)
+        with McapReader(path) as reader:
+            self.assertFalse(reader.indexed)
+            chunks = list(reader.chunks())
+        self.assertEqual(len(chunks), 1)
+        self.assertEqual([i.ts for i in chunks[0]], [r.ts for r in records])
+
+    def test_unsupported_format(self):
+        with self.assertRaises(ValueError):
+            list(read_items(self.path("test.db3")))
+
+    def test_pickles_undecoded(self):
+        path = self.path("test.mcap")
+        extra = [cdr_log(4.0, 40, "ros2 error"), json_message(4.5, {"ok": True})]
+        write_mcap(path, records + extra)
+        items = list(read_items(path))
+        copies = pickle.loads(pickle.dumps(items))
+        self.assertFalse(any(item.msg.decoded for item in items + copies))
+        for item, copy in zip(items, copies):
+            self.assertEqual(copy.msg.value, item.msg.value)
+
+        # Decoded messages are sent as such
+        copies = pickle.loads(pickle.dumps(items))
+        for item, copy in zip(items, copies):
+            self.assertEqual(copy.msg, item.msg.value)
+
+
+class ReadAheadTest(unittest.TestCase):
+    def test_order(self):
+        self.assertEqual(list(read_ahead(iter(range(100)), 3)), list(range(100)))
+        self.assertEqual(list(read_ahead(iter(range(10)), 0)), list(range(10)))
+
+    def test_propagates_errors(self):
+        def chunks():
+            yield 1
+            raise KeyError("broken")
+
+        it = read_ahead(chunks(), 2)
+        self.assertEqual(next(it), 1)
+        with self.assertRaises(KeyError):
+            next(it)
+
+    def test_close_stops_producer(self):
+        produced = []
+        stopped = threading.Event()
+
+        def chunks():
+            try:
+                for i in range(1000):
+                    produced.append(i)
+                    yield i
+            finally:
+                stopped.set()
+
+        it = read_ahead(chunks(), 2)
+        self.assertEqual(next(it), 0)
+        it.close()
+        self.assertTrue(stopped.is_set())
+        # Bounded by the queue size
+        self.assertLess(len(produced), 10)
+
+
+class EngineTest(RecordingTestCase):
+    def test_consume_recording(self):
+        path = self.path("test.mcap")
+        write_mcap(path, records)
+        rules = [
+            {"when": ["log_level == LogLevel.ERROR"], "actions": ["upload()"]},
+            {
+                "when": ['topic == "/cmd_vel" and msg.linear.x > 1'],
+                "actions": ['create_moment("fast")'],
+            },
+        ]
+        result, rules = validate_config_wrapped(
+            {"version": "v1", "rules": rules},
+            {
+                "upload": lambda _: noop_upload,
+                "create_moment": lambda _: noop_create_moment,
+            },
+        )
+        self.assertTrue(result["success"], result)
+
+        hits = []
+        engine = Engine(rules, trigger_cb=lambda *args: hits.append(args[-1].ts))
+        for item in read_items(path):
+            engine.consume_next(item)
+        self.assertEqual(hits, [2.0, 2.5])
@@ -0,0 +1,159 @@
+# Copyright 2024 coScene
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import random
+import re
+import unittest
+from collections import namedtuple
+
+from ruleengine.dsl.action import Action
+from ruleengine.dsl.analysis import walk
+from ruleengine.dsl.compiler import compile_condition
+from ruleengine.dsl.regex_set import (
+    RegexSet,
+    SharedRegexCondition,
+    required_literal,
+    share_regex_scans,
+)
+from ruleengine.engine import DiagnosisItem, Engine, Rule
+from tests.dsl.utils import str_to_condition
+
+RosMockMessage = namedtuple("RosMockMessage", "msg level")
+
+log_sequence = [
+    DiagnosisItem("/rosout", RosMockMessage(text, 2), i, "rosgraph_msgs/Log")
+    for i, text in enumerate(
+        [
+            "motor 3 overheated at 93C",
+            "battery level 12%",
+            "nothing to see here",
+            "Motor 12 stalled",
+            "",
+        ]
+    )
+] + [DiagnosisItem("/rosout", RosMockMessage(b"motor 1 overheated", 2), 5, "Bytes")]
+
+log_expressions = [
+    r'regex(msg.msg, r"motor (\d+) overheated")',
+    r'regex(msg.msg, r"at (\d+)C").group(1) > 90',
+    r'regex(msg.msg, r"(?i)motor \d+ stalled")',
+    r'regex(msg.msg, r"battery level (\d+)%") and get_value("cos/regex").group(1)',
+    r'regex(msg.msg, r"\d")',
+    r'regex(msg.msg, r"^$")',
+    r'regex(log, r"motor (\d+)") or regex(log, r"level")',
+]
+
+
+class CollectAction(Action):
+    def __init__(self):
+        self.collector = []
+
+    def run(self, item, scope):
+        match = scope.get("cos/regex")
+        self.collector.append((item.ts, match and match.group(0)))
+
+
+class RequiredLiteralTest(unittest.TestCase):
+    def test_required_literal(self):
+        self.assertEqual(required_literal(r"motor (\d+) overheated"), " overheated")
+        self.assertEqual(required_literal(r"(abc)+ de"), " de")
+        self.assertEqual(required_literal(r"(?:foo)bar"), "foobar")
+        self.assertEqual(required_literal(r"ab|cd"), None)
+        self.assertEqual(required_literal(r"a\d"), None)
+        self.assertEqual(required_literal(r"(?i)abc"), None)
+        self.assertEqual(required_literal(r"[Aa]bc"), "bc")
+        self.assertEqual(required_literal(b"abc"), None)
+
+
+class RegexSetTest(unittest.TestCase):
+    def test_same_as_re_search(self):
+        rng = random.Random(42)
+
+        def word(n):
+            return "".join(rng.choice("abc 1") for _ in range(n))
+
+        pieces = [r"\d", r"a+", r"(b|c)", r"[ab]", r"(?:ab)?", r"\s", r"^", r"$"]
+        patterns = [
+            "".join(
+                rng.choice(pieces) if rng.random() < 0.3 else word(rng.randint(1, 3))
+                for _ in range(rng.randint(1, 4))
+            )
+            for _ in range(100)
+        ]
+        regex_set = RegexSet(patterns)
+        for _ in range(200):
+            text = word(rng.randint(0, 40))
+            expected = {}
+            for pattern in patterns:
+                match = re.search(pattern, text)
+                if match is not None:
+                    expected[pattern] = match.span(), match.groups()
+            found = {
+                pattern: (match.span(), match.groups())
+                for pattern, match in regex_set.search(text).items()
+            }
+            self.assertEqual(found, expected, text)
+
+
+class ShareRegexScansTest(unittest.TestCase):
+    def test_rewrite(self):
+        conditions = [[str_to_condition(expr)] for expr in log_expressions]
+        rewritten = share_regex_scans(conditions)
+
+        shared = [
+            node
+            for conditions in rewritten
+            for cond in conditions
+            for node in walk(cond)
+            if isinstance(node, SharedRegexCondition)
+        ]
+        self.assertEqual(len(shared), 8)
+        # Only one scan per subject
+        scans = {node._node.operands[2] for node in shared}
+        self.assertEqual(len(scans), 2)
+
+    def test_invalid_pattern_is_left_alone(self):
+        conditions = [
+            [str_to_condition('regex(msg.msg, "(")')],
+            [str_to_condition('regex(msg.msg, "a")')],
+        ]
+        self.assertIs(share_regex_scans(conditions), conditions)
+
+    def test_engine_results(self):
+        for compiled in (False, True):
+            with self.subTest(compiled=compiled):
+                self.assertEqual(
+                    self.__run(optimize=False, compiled=compiled),
+                    self.__run(optimize=True, compiled=compiled),
+                )
+
+    @staticmethod
+    def __run(optimize, compiled):
+        actions = [CollectAction() for _ in log_expressions]
+        rules = []
+        for expr, action in zip(log_expressions, actions):
+            cond = str_to_condition(expr)
+            if compiled:
+                cond = compile_condition(cond)
+            rules.append(Rule([cond], [action], {}))
+
+        engine = Engine(rules, optimize=optimize)
+        for item in log_sequence:
+            try:
+                engine.consume_next(item)
+            except TypeError:
+                # Searching a str pattern in bytes fails either way
+                for action in actions:
+                    action.collector.append((item.ts, TypeError))
+        return [action.collector for action in actions]
@@ -0,0 +1,142 @@
+# Copyright 2024 coScene
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+from collections import namedtuple
+from unittest import mock
+
+from ruleengine.dsl.base_actions import noop
+from ruleengine.dsl.validation import config_validator
+from ruleengine.dsl.validation.config_validator import validate_config
+from ruleengine.engine import DiagnosisItem, Engine
+
+MockMessage = namedtuple("MockMessage", "value")
+
+sustained_rule = {
+    "when": ['sustained(topic == "/a", msg.value > 2, 2)'],
+    "actions": ["upload()"],
+}
+templated_rule = {
+    "when": ['topic == "/b" and msg.value > get_value("threshold")'],
+    "actions": ["upload()"],
+    "each": [{"threshold": 3}, {"threshold": 6}],
+}
+config = {"version": "v1", "rules": [sustained_rule, templated_rule]}
+
+
+def make_items(topic, start, count, value=5):
+    return [
+        DiagnosisItem(topic, MockMessage(value), start + i, "MockMessage")
+        for i in range(count)
+    ]
+
+
+class ReloadTest(unittest.TestCase):
+    def setUp(self):
+        self.hits = []
+        _, rules = validate_config(config, noop)
+        self.engine = Engine(rules, trigger_cb=self.__trigger_cb)
+
+    def __trigger_cb(self, project_name, spec, hit, action_triggered, item):
+        self.hits.append((hit["when"][0], item.ts))
+
+    def __consume(self, items):
+        for item in items:
+            self.engine.consume_next(item)
+
+    def test_unchanged_config_is_not_parsed(self):
+        rules = self.engine.rules
+        with mock.patch.object(
+            config_validator,
+            "validate_condition",
+            wraps=config_validator.validate_condition,
+        ) as validate_condition:
+            result = self.engine.reload(config, noop)
+        self.assertTrue(result["success"])
+        self.assertEqual(validate_condition.call_count, 0)
+        self.assertEqual([id(r) for r in self.engine.rules], [id(r) for r in rules])
+
+    def test_state_carried_over(self):
+        # The sustained condition starts at ts 0 and fires after 2 seconds,
+        # across the reload
+        self.__consume(make_items("/a", 0, 2))
+        new_rule = {"when": ['topic == "/c"'], "actions": ["upload()"]}
+        with mock.patch.object(
+            config_validator,
+            "validate_condition",
+            wraps=config_validator.validate_condition,
+        ) as validate_condition:
+            result = self.engine.reload(
+                {**config, "rules": [new_rule] + config["rules"]}, noop
+            )
+        self.assertTrue(result["success"])
+        self.assertEqual(validate_condition.call_count, 1)
+
+        self.__consume(make_items("/a", 2, 2) + make_items("/c", 4, 1))
+        self.assertEqual(
+            self.hits, [(sustained_rule["when"][0], 3), ('topic == "/c"', 4)]
+        )
+
+    def test_changed_rule_is_replaced(self):
+        self.__consume(make_items("/a", 0, 2))
+        changed = {
+            **sustained_rule,
+            "when": ['sustained(topic == "/a", msg.value > 2, 1)'],
+        }
+        self.engine.reload({**config, "rules": [changed, templated_rule]}, noop)
+
+        # The changed rule starts over
+        self.__consume(make_items("/a", 2, 3))
+        self.assertEqual(self.hits, [(changed["when"][0], 4)])
+
+    def test_templated_rule(self):
+        rules = self.engine.rules
+        templated = {
+            **templated_rule,
+            "each": templated_rule["each"] + [{"threshold": 9}],
+        }
+        self.engine.reload({**config, "rules": [sustained_rule, templated]}, noop)
+
+        new_rules = self.engine.rules
+        self.assertEqual(len(new_rules), 4)
+        # The existing instances are kept, only the new one is created
+        self.assertEqual([id(r) for r in new_rules[:3]], [id(r) for r in rules])
+
+        self.__consume(make_items("/b", 0, 1, value=10))
+        self.assertEqual(len(self.hits), 3)
+
+    def test_removed_rule(self):
+        self.engine.reload({**config, "rules": [sustained_rule]}, noop)
+        self.__consume(make_items("/b", 0, 1, value=10))
+        self.assertEqual(self.hits, [])
+
+    def test_invalid_config(self):
+        rules = self.engine.rules
+        result = self.engine.reload(
+            {**config, "rules": [{"when": ["msg.("], "actions": ["upload()"]}]}, noop
+        )
+        self.assertFalse(result["success"])
+        self.assertEqual([id(r) for r in self.engine.rules], [id(r) for r in rules])
+
+    def test_snapshot_after_reload(self):
+        self.__consume(make_items("/a", 0, 2))
+        self.engine.reload({**config, "rules": [templated_rule, sustained_rule]}, noop)
+        blob = self.engine.snapshot()
+
+        _, rules = validate_config(config, noop)
+        restored = Engine(rules, trigger_cb=self.__trigger_cb)
+        self.assertEqual(restored.restore(blob), 1)
+        self.engine = restored
+        self.__consume(make_items("/a", 2, 2))
+        self.assertEqual(self.hits, [(sustained_rule["when"][0], 3)])
@@ -0,0 +1,87 @@
+# Copyright 2024 coScene
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+from collections import namedtuple
+
+from ruleengine.dsl.action import Action
+from ruleengine.dsl.scope import MAX_DEPTH, Scope, extend
+from ruleengine.engine import DiagnosisItem, Engine, Rule
+from tests.dsl.utils import str_to_condition
+
+RosMockMessage = namedtuple("RosMockMessage", "msg level")
+
+
+class CollectAction(Action):
+    def __init__(self):
+        self.scopes = []
+
+    def run(self, item, scope):
+        self.scopes.append(scope)
+
+
+class ScopeTest(unittest.TestCase):
+    def test_set(self):
+        base = Scope({"a": 1})
+        scope = base.set("b", 2).set("a", 3)
+
+        self.assertEqual(scope, {"a": 3, "b": 2})
+        self.assertEqual(base, {"a": 1})
+        self.assertEqual(scope["a"], 3)
+        self.assertEqual(scope.get("c"), None)
+        self.assertEqual(scope.get("c", 4), 4)
+        self.assertIn("b", scope)
+        self.assertNotIn("c", scope)
+        self.assertEqual(len(scope), 2)
+        self.assertEqual(sorted(scope), ["a", "b"])
+        self.assertEqual({**scope}, {"a": 3, "b": 2})
+        with self.assertRaises(KeyError):
+            scope["c"]
+
+    def test_truth(self):
+        self.assertFalse(Scope())
+        self.assertTrue(Scope({"a": 1}))
+        self.assertTrue(Scope().set("a", None))
+
+    def test_long_chains_are_flattened(self):
+        scope = Scope()
+        for i in range(MAX_DEPTH * 3):
+            scope = scope.set(i % 5, i)
+        self.assertEqual(scope, {i % 5: i for i in range(MAX_DEPTH * 3)})
+        self.assertLessEqual(scope._depth, MAX_DEPTH)
+
+    def test_unhashable_key(self):
+        with self.assertRaises(TypeError):
+            Scope().set([], 1)
+
+    def test_extend(self):
+        scope = {"a": 1}
+        self.assertEqual(extend(scope, "b", 2), {"a": 1, "b": 2})
+        self.assertIs(type(extend(scope, "b", 2)), dict)
+        self.assertIs(type(extend(Scope(scope), "b", 2)), Scope)
+        self.assertEqual(scope, {"a": 1})
+
+    def test_engine_scope(self):
+        action = CollectAction()
+        cond = str_to_condition(
+            '"error" in msg.msg and set_value("code", get_value("code") + 1)'
+        )
+        rule = Rule([cond], [action], {"code": 1})
+        engine = Engine([rule])
+        engine.consume_next(
+            DiagnosisItem("/rosout", RosMockMessage("error", 2), 0, "rosgraph_msgs/Log")
+        )
+
+        self.assertEqual(action.scopes, [{"code": 2.0, "cos/contains": "error"}])
+        self.assertEqual(rule.initial_scope, {"code": 1})
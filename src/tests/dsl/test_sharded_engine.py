@@ -0,0 +1,126 @@
+# Copyright 2024 coScene
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import tempfile
+import unittest
+
+from ruleengine.dsl.validation.config_validator import validate_config
+from ruleengine.engine import Engine
+from ruleengine.readers.stream import read_items
+from ruleengine.sharded_engine import ShardedEngine
+from tests.dsl.recordings import cdr_log, write_bag, write_mcap
+from tests.dsl.test_batch import config, make_items
+from tests.dsl.test_readers import records
+
+
+class ShardedEngineTest(unittest.TestCase):
+    def test_same_events_as_engine(self):
+        items = make_items(5, 300)
+
+        events, callbacks = self.__callbacks()
+        _, rules = validate_config(config, callbacks.pop("action_impls"))
+        engine = Engine(rules, **callbacks)
+        # Repeated items in a batch are evaluated at each of their positions
+        repeated = items[:100] + items[:100]
+        for item in items + items[:1] + repeated:
+            engine.consume_next(item)
+        self.assertTrue(events)
+
+        for workers in (1, 3):
+            with self.subTest(workers=workers):
+                sharded_events, callbacks = self.__callbacks()
+                action_impls = callbacks.pop("action_impls")
+                with ShardedEngine(config, action_impls, workers, **callbacks) as e:
+                    for i in range(0, len(items), 64):
+                        e.consume_batch(items[i:][:64])
+                    e.consume_next(items[0])
+                    e.consume_batch(repeated)
+                self.assertEqual(sharded_events, events)
+
+    def test_recordings(self):
+        recording_config = {
+            "version": "v1",
+            "rules": [
+                {"when": ["log_level == LogLevel.ERROR"], "actions": ["upload()"]},
+                {
+                    "when": ['topic == "/cmd_vel" and msg.linear.x > 1'],
+                    "actions": ["upload()"],
+                },
+            ],
+        }
+        with tempfile.TemporaryDirectory() as directory:
+            for name, write in (("test.bag", write_bag), ("test.mcap", write_mcap)):
+                path = os.path.join(directory, name)
+                extra = [cdr_log(4.0, 40, "ros2 error")] if name == "test.mcap" else []
+                write(path, records + extra)
+                with self.subTest(reader=name):
+                    events, callbacks = self.__callbacks()
+                    _, rules = validate_config(
+                        recording_config, callbacks.pop("action_impls")
+                    )
+                    engine = Engine(rules, **callbacks)
+                    for item in read_items(path):
+                        engine.consume_next(item)
+                    self.assertTrue(events)
+
+                    sharded_events, callbacks = self.__callbacks()
+                    action_impls = callbacks.pop("action_impls")
+                    items = list(read_items(path))
+                    with ShardedEngine(
+                        recording_config, action_impls, 2, **callbacks
+                    ) as sharded_engine:
+                        sharded_engine.consume_batch(items)
+                    self.assertEqual(sharded_events, events)
+                    # The messages are only decoded by the workers
+                    self.assertFalse(any(item.msg.decoded for item in items))
+
+    def test_invalid_config(self):
+        with self.assertRaises(ValueError):
+            ShardedEngine({"version": "v0"}, {}, 1)
+
+    def test_worker_error(self):
+        bad_config = {
+            "version": "v1",
+            "rules": [{"when": ["msg.value > 1"], "actions": ["upload()"]}],
+        }
+        items = make_items(1, 1)
+        items[0].msg = items[0].msg._replace(value="not a number")
+        with ShardedEngine(bad_config, {"upload": print}, 1) as engine:
+            with self.assertRaises(RuntimeError):
+                engine.consume_batch(items)
+
+    @staticmethod
+    def __callbacks():
+        events = []
+        allowed = {"count": 0}
+
+        def upload(trigger_ts, **kwargs):
+            events.append(("upload", trigger_ts))
+
+        def create_moment(title, timestamp, start_time, **kwargs):
+            events.append(("create_moment", title, timestamp, start_time))
+
+        def should_trigger_action(project_name, spec, hit):
+            allowed["count"] += 1
+            return allowed["count"] % 3 != 0
+
+        def trigger_cb(project_name, spec, hit, action_triggered, item):
+            events.append(("trigger", hit["when"], action_triggered, item.ts))
+
+        return events, {
+            "action_impls": {"upload": upload, "create_moment": create_moment},
+            "should_trigger_action": should_trigger_action,
+            "trigger_cb": trigger_cb,
+        }
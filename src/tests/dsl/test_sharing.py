@@ -0,0 +1,178 @@
+# Copyright 2024 coScene
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+from ruleengine.dsl.action import Action
+from ruleengine.dsl.analysis import walk
+from ruleengine.dsl.compiler import compile_condition
+from ruleengine.dsl.sharing import MemoizedCondition, is_pure, share_subexpressions
+from ruleengine.engine import DiagnosisItem, Engine, Rule
+from tests.dsl.utils import str_to_condition
+
+
+class CountingMessage:
+    """A log message counting how many times its fields are read"""
+
+    reads = 0
+
+    def __init__(self, msg, level):
+        self.__msg = msg
+        self.__level = level
+
+    @property
+    def msg(self):
+        CountingMessage.reads += 1
+        return self.__msg
+
+    @property
+    def level(self):
+        CountingMessage.reads += 1
+        return self.__level
+
+
+sequence = [
+    DiagnosisItem("/rosout", CountingMessage(text, level), i, "rosgraph_msgs/Log")
+    for i, (text, level) in enumerate(
+        [
+            ("error 1 occurred", 16),
+            ("all good", 2),
+            ("warning: battery at 15", 4),
+            ("error 2 occurred", 16),
+        ]
+    )
+] + [DiagnosisItem("/other", {"level": 4}, 4, "dict")]
+
+expressions = [
+    'log_level == LogLevel.WARN and "battery" in log',
+    'msg.level > 2 and "error" in msg.msg',
+    "msg.level > 2 and msg.level < 16",
+    'log_level == LogLevel.WARN and set_value("level", msg.level)',
+    'msg.level == 16 and get_value("cos/contains") is None',
+    '"error" in log and get_value("cos/contains") == "error"',
+    "msg.level > 2 and ts - condition_start_time >= 0",
+    'regex(log, r"(\\d+)") and get_value("cos/regex").group(1)',
+]
+
+
+class CollectAction(Action):
+    def __init__(self):
+        self.collector = []
+
+    def run(self, item, scope):
+        self.collector.append((item.ts, scope.get("cos/contains"), scope.get("level")))
+
+
+class ShareSubexpressionsTest(unittest.TestCase):
+    def test_identical_nodes_are_merged(self):
+        conditions = [
+            [str_to_condition("msg.level > 2")],
+            [str_to_condition("msg.level > 2 and topic == 'a'")],
+        ]
+        shared = share_subexpressions(conditions)
+        memoized = [
+            node for node in walk(shared[1][0]) if isinstance(node, MemoizedCondition)
+        ]
+        # The whole first condition is memoized, and reused by the second
+        self.assertIsInstance(shared[0][0], MemoizedCondition)
+        self.assertEqual(memoized, [shared[0][0]])
+
+    def test_scope_dependent_nodes_are_not_memoized(self):
+        self.assertTrue(is_pure(str_to_condition("msg.level > 2 and msg.msg")))
+        self.assertFalse(is_pure(str_to_condition('"a" in msg.msg')))
+        self.assertFalse(is_pure(str_to_condition('get_value("a")')))
+        self.assertFalse(is_pure(str_to_condition("ts - condition_start_time")))
+
+        conditions = [[str_to_condition('get_value("a") == 1')] for _ in range(2)]
+        shared = share_subexpressions(conditions)
+        self.assertIs(shared[0][0], shared[1][0])
+        self.assertNotIsInstance(shared[0][0], MemoizedCondition)
+
+    def test_fewer_reads(self):
+        CountingMessage.reads = 0
+        self.__run(optimize=False, compiled=False)
+        baseline = CountingMessage.reads
+
+        CountingMessage.reads = 0
+        self.__run(optimize=True, compiled=False)
+        # msg.msg and msg.level once per item, both read twice by hasattr and
+        # getattr, log_level sharing the read of msg.level
+        self.assertEqual(CountingMessage.reads, 4 * (len(sequence) - 1))
+        self.assertLess(CountingMessage.reads * 3, baseline)
+
+    def test_engine_results(self):
+        for compiled in (False, True):
+            with self.subTest(compiled=compiled):
+                self.assertEqual(
+                    self.__run(optimize=False, compiled=compiled),
+                    self.__run(optimize=True, compiled=compiled),
+                )
+
+    def test_mutated_item_fed_again(self):
+        def run(optimize, compiled, batch):
+            hits = []
+            rules = []
+            for expr in ["msg.level > 2", "msg.level > 2 and msg.level < 16"]:
+                cond = str_to_condition(expr)
+                if compiled:
+                    cond = compile_condition(cond)
+                rules.append(Rule([cond], [], {}))
+            engine = Engine(
+                rules,
+                trigger_cb=lambda *args: hits.append(args[-1].msg["level"]),
+                optimize=optimize,
+            )
+            item = DiagnosisItem("/rosout", {"level": 5}, 0, "dict")
+            for level in (5, 0, 20):
+                item.msg["level"] = level
+                if batch:
+                    engine.consume_batch([item])
+                else:
+                    engine.consume_next(item)
+            return hits
+
+        for compiled in (False, True):
+            for batch in (False, True):
+                with self.subTest(compiled=compiled, batch=batch):
+                    self.assertEqual(run(True, compiled, batch), [5, 5, 20])
+                    self.assertEqual(
+                        run(True, compiled, batch), run(False, compiled, batch)
+                    )
+
+    def test_not_memoized_outside_engine(self):
+        conditions = [
+            [str_to_condition("msg.level > 2")],
+            [str_to_condition("msg.level > 2")],
+        ]
+        shared = share_subexpressions(conditions)
+        self.assertIsInstance(shared[0][0], MemoizedCondition)
+        item = DiagnosisItem("/rosout", {"level": 5}, 0, "dict")
+        self.assertTrue(shared[0][0].evaluate_condition_at(item, {})[0])
+        item.msg["level"] = 0
+        self.assertFalse(shared[1][0].evaluate_condition_at(item, {})[0])
+
+    @staticmethod
+    def __run(optimize, compiled):
+        actions = [CollectAction() for _ in expressions]
+        rules = []
+        for expr, action in zip(expressions, actions):
+            cond = str_to_condition(expr)
+            if compiled:
+                cond = compile_condition(cond)
+            rules.append(Rule([cond], [action], {}))
+
+        engine = Engine(rules, optimize=optimize)
+        for item in sequence:
+            engine.consume_next(item)
+        return [action.collector for action in actions]
@@ -0,0 +1,192 @@
+# Copyright 2024 coScene
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import pickle
+import random
+import unittest
+from collections import namedtuple
+
+from ruleengine import checkpoint
+from ruleengine.dsl.base_actions import noop_create_moment, noop_upload
+from ruleengine.dsl.validation.config_validator import validate_config_wrapped
+from ruleengine.engine import DiagnosisItem, Engine
+from ruleengine.readers.messages import ros1_decoder
+from tests.dsl.recordings import LOG_DEFINITION, ros1_log
+
+MockMessage = namedtuple("MockMessage", "value msg")
+
+rules = [
+    {"when": ['sustained(topic == "/b", msg.value > 2, 2)'], "actions": ["upload()"]},
+    {
+        "when": [r'sequential(regex(msg.msg, r"w(ar)n"), topic == "/c", duration=5)'],
+        "actions": ['create_moment(get_value("cos/regex").group(1))'],
+    },
+    {
+        "when": ['timeout(topic == "/b", topic == "/a", duration=3)'],
+        "actions": ['create_moment("timeout")'],
+    },
+    {"when": ['repeated(msg.msg == "warn", 3, 10)'], "actions": ["upload()"]},
+    {"when": ["throttle(msg.value > 7, 3)"], "actions": ["upload()"]},
+    {"when": ['debounce(msg.msg == "error", 2)'], "actions": ["upload()"]},
+    {
+        "when": ['any_order(topic == "/a", msg.value > 8, reset_time=4)'],
+        "actions": ['create_moment("any")'],
+    },
+    {"when": ['topic == "/a" and msg.value > 5'], "actions": ["upload()"]},
+]
+
+items = [
+    DiagnosisItem(
+        rng.choice(["/a", "/b", "/c"]),
+        MockMessage(rng.randint(0, 10), rng.choice(["ok", "error", "warn"])),
+        i * 0.5,
+        "MockMessage",
+    )
+    for rng in [random.Random(5)]
+    for i in range(400)
+]
+
+
+class SnapshotTest(unittest.TestCase):
+    def test_resume(self):
+        expected, _ = self.__run(items)
+        self.assertTrue(expected)
+        for split in (1, 37, 150, 399):
+            with self.subTest(split=split):
+                before, engine = self.__run(items[:split])
+                blob = engine.snapshot()
+
+                after, restored = self.__run([])
+                self.assertEqual(restored.restore(blob), 7)
+                self.__consume(restored, items[split:])
+                self.assertEqual(before + after, expected)
+
+    def test_without_restore_differs(self):
+        expected, _ = self.__run(items)
+        before, _ = self.__run(items[:150])
+        after, _ = self.__run(items[150:])
+        self.assertNotEqual(before + after, expected)
+
+    def test_rules_matched_by_content(self):
+        expected, _ = self.__run(items)
+        before, engine = self.__run(items[:150])
+        blob = engine.snapshot()
+
+        # A new rule in front shifts the positions, the states still match
+        new_rule = {"when": ['repeated(topic == "/c", 2, 1)'], "actions": []}
+        after, restored = self.__run([], [new_rule] + rules)
+        self.assertEqual(restored.restore(blob), 7)
+        self.__consume(restored, items[150:])
+        after = [e for e in after if e[1] != tuple(new_rule["when"])]
+        self.assertEqual(before + after, expected)
+
+    def test_invalid_blob(self):
+        _, engine = self.__run([])
+        with self.assertRaises(ValueError):
+            engine.restore(b"garbage")
+        blob = bytearray(engine.snapshot())
+        blob[5] += 1
+        with self.assertRaises(ValueError):
+            engine.restore(bytes(blob))
+
+    def test_foreign_globals_rejected(self):
+        _, engine = self.__run([])
+        key = checkpoint.rule_keys(engine_rules(rules))[0]
+        header = engine.snapshot()[: len(checkpoint.MAGIC) + 2]
+
+        class Payload:
+            def __reduce__(self):
+                return os.system, ("true",)
+
+        for state in [Payload(), random.Random(), Exception("x")]:
+            with self.subTest(state=type(state).__name__):
+                blob = header + pickle.dumps([(key, [state])])
+                with self.assertRaises(ValueError):
+                    checkpoint.loads(blob)
+
+    def test_scope_values(self):
+        scope_rules = [
+            {
+                "when": [
+                    'sequential(set_value("lvl", log_level), topic == "/c", duration=5)'
+                ],
+                "actions": ['create_moment(get_value("lvl").name)'],
+            },
+            {
+                "when": [
+                    'sequential(set_value("log", msg), topic == "/c", duration=5)'
+                ],
+                "actions": ['create_moment(get_value("log").msg)'],
+            },
+        ]
+        decode = ros1_decoder("rosgraph_msgs/Log", LOG_DEFINITION)
+        log_items = [
+            DiagnosisItem(
+                topic, decode(ros1_log(i, 8, f"log {i}").data), i, "rosgraph_msgs/Log"
+            )
+            for i, topic in enumerate(["/a", "/a", "/c", "/a", "/c"])
+        ]
+        expected, _ = self.__run(log_items, scope_rules)
+        self.assertIn(("create_moment", "ERROR", 2, 0), expected)
+        self.assertIn(("create_moment", "log 0", 2, 0), expected)
+
+        before, engine = self.__run(log_items[:2], scope_rules)
+        blob = engine.snapshot()
+        after, restored = self.__run([], scope_rules)
+        self.assertEqual(restored.restore(blob), 2)
+        self.__consume(restored, log_items[2:])
+        self.assertEqual(before + after, expected)
+
+        # Values that couldn't be restored fail the snapshot itself
+        _, engine = self.__run(items[:2], scope_rules[1:])
+        with self.assertRaisesRegex(ValueError, "MockMessage"):
+            engine.snapshot()
+
+    def test_mismatched_state(self):
+        _, engine = self.__run([])
+        key = checkpoint.rule_keys(engine_rules(rules))[0]
+        with self.assertRaises(ValueError):
+            engine.restore(checkpoint.dumps([(key, [(1.0,)])]))
+
+    def __run(self, consumed, rule_specs=rules):
+        events = []
+
+        def create_moment(title, timestamp, start_time, **kwargs):
+            events.append(("create_moment", title, timestamp, start_time))
+
+        def trigger_cb(project_name, spec, hit, action_triggered, item):
+            events.append(("trigger", tuple(hit["when"]), item.ts))
+
+        impls = {
+            "upload": lambda _: noop_upload,
+            "create_moment": lambda _: create_moment,
+        }
+        engine = Engine(engine_rules(rule_specs, impls), trigger_cb=trigger_cb)
+        self.__consume(engine, consumed)
+        return events, engine
+
+    @staticmethod
+    def __consume(engine, consumed):
+        for item in consumed:
+            engine.consume_next(item)
+
+
+def engine_rules(rule_specs, impls=None):
+    impls = impls or {
+        "upload": lambda _: noop_upload,
+        "create_moment": lambda _: noop_create_moment,
+    }
+    _, result = validate_config_wrapped({"version": "v1", "rules": rule_specs}, impls)
+    return result
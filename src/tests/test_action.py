@@ -1,5 +1,7 @@
+import re
 import unittest
 from functools import partial
+from unittest import mock
 
 import celpy
 
@@ -169,3 +171,22 @@ class TestEvaluateEmbeddedExpression(unittest.TestCase):
         eee 1234567890.123456
         """
         self.assert_expression(expression, TestActivation, expected)
+
+    def test_edges(self):
+        self.assert_expression("{ msg.message.code }", TestActivation, "200")
+        self.assert_expression(
+            "{scope.code}{ msg.message.code }!", TestActivation, "200200!"
+        )
+        self.assert_expression(
+            "{ topic } at {ts}", TestActivation, "/TestTopic at 1234567890.123456"
+        )
+        self.assert_expression("a } b { c", TestActivation, "a } b { c")
+
+    def test_split_once(self):
+        evaluate = compile_embedded_expr("aaa { msg.message.code } bbb { topic }")
+        with mock.patch(
+            "rule_engine.action._EMBEDDED_EXPR_PATTERN"
+        ) as pattern, mock.patch.object(re, "sub") as sub:
+            self.assertEqual(evaluate(TestActivation), "aaa 200 bbb /TestTopic")
+        self.assertFalse(pattern.method_calls)
+        sub.assert_not_called()
@@ -0,0 +1,101 @@
+# Copyright 2024 coScene
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import unittest
+
+from celpy.adapter import json_to_cel
+from celpy.celtypes import MapType
+
+from rule_engine.adapter import LazyMapType, lazy_json_to_cel
+from rule_engine.utils import ENV
+
+DOCUMENT = {
+    "code": 1,
+    "level": 2.5,
+    "ok": True,
+    "name": "motor",
+    "none": None,
+    "nested": {"items": [1, 2, {"key": "value"}], "empty": {}},
+}
+
+EXPRESSIONS = [
+    "msg.code",
+    "msg.nested.items[2].key",
+    'msg["name"]',
+    "msg[1]",
+    "msg.missing",
+    "msg.none == null",
+    "has(msg.code)",
+    "has(msg.none)",
+    "has(msg.missing)",
+    "has(msg.nested.items)",
+    "has(msg.nested.empty.key)",
+    '"code" in msg',
+    '"missing" in msg',
+    '"key" in msg.nested.items[2]',
+    "size(msg)",
+    "size(msg.nested.empty)",
+    "msg.nested.items.size()",
+    'msg == {"code": 1}',
+    'msg != {"code": 1}',
+    'msg.nested.items[2] == {"key": "value"}',
+    '{"key": "value"} == msg.nested.items[2]',
+    "msg.nested.empty == {}",
+    'msg.all(k, k != "other")',
+    'msg.exists(k, k == "name")',
+    "msg.map(k, k)",
+    'msg.filter(k, k != "code")',
+    "msg.ok && msg.level > 2.0",
+    "string(msg.nested)",
+]
+
+
+class TestLazyMapType(unittest.TestCase):
+    @staticmethod
+    def evaluate(expression, msg):
+        try:
+            return repr(ENV.program(ENV.compile(expression)).evaluate({"msg": msg}))
+        except Exception as e:
+            return type(e).__name__
+
+    def test_same_results_as_json_to_cel(self):
+        for expression in EXPRESSIONS:
+            with self.subTest(expression=expression):
+                self.assertEqual(
+                    self.evaluate(expression, lazy_json_to_cel(DOCUMENT)),
+                    self.evaluate(expression, json_to_cel(DOCUMENT)),
+                )
+
+    def test_converts_on_access(self):
+        msg = lazy_json_to_cel(DOCUMENT)
+        self.assertIsInstance(msg, LazyMapType)
+        self.assertEqual(dict.__len__(msg), 0)
+        self.assertEqual(self.evaluate("msg.code == 1", msg), "BoolType(True)")
+        self.assertEqual(dict.__len__(msg), 1)
+        self.assertIsInstance(msg["nested"], LazyMapType)
+        self.assertIs(msg["nested"], msg["nested"])
+        self.assertEqual(len(msg), len(DOCUMENT))
+
+    def test_map_behavior(self):
+        msg = lazy_json_to_cel(DOCUMENT)
+        self.assertEqual(repr(msg), f"LazyMapType({DOCUMENT!r})")
+        self.assertEqual(dict.__len__(msg), 0)
+        self.assertEqual(msg, json_to_cel(DOCUMENT))
+        self.assertEqual(dict(msg), dict(json_to_cel(DOCUMENT)))
+        self.assertEqual(list(msg.keys()), list(DOCUMENT))
+        self.assertIsNone(msg.get("missing"))
+        self.assertIsInstance(msg, MapType)
+        with self.assertRaises(KeyError):
+            msg["missing"]
+        with self.assertRaises(TypeError):
+            msg[1.5]
@@ -0,0 +1,278 @@
+# Copyright 2024 coScene
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import unittest
+from collections import ChainMap
+
+import celpy
+from celpy.adapter import json_to_cel
+from celpy.celtypes import DoubleType, StringType
+
+from rule_engine.adapter import lazy_json_to_cel
+from rule_engine.compiler import ClosureRunner, compile_program, field_equalities
+from rule_engine.utils import ENV
+
+MESSAGES = [
+    {
+        "code": 3,
+        "level": 2.5,
+        "name": "motor_left",
+        "ok": True,
+        "none": None,
+        "tags": ["a", "b", 3],
+        "pose": {"x": 1.5, "y": -2, "frame": "map"},
+        "items": [{"id": 1}, {"id": 2}],
+    },
+    {"code": "3", "level": 0, "name": "", "ok": False, "pose": {}, "tags": []},
+    {},
+]
+SCOPES = [{"code": 3, "name": "motor_left", "limit": 2.0}, {"code": 0}]
+
+EXPRESSIONS = [
+    # Literals and arithmetic
+    "1 + 2 * 3 - 4 / 2",
+    "7 % 3 == 1",
+    "-msg.level",
+    "1 / 0",
+    "5 % 0",
+    "2.0 / 0.0 > 1.0",
+    "9223372036854775807 + 1",
+    "1u + 2u",
+    '"a" + "b"',
+    "b'abc' == b'abc'",
+    "[1, 2] + [3]",
+    "null == null",
+    "'\\x41\\u00e9' == 'Aé'",
+    # Field access and comparisons
+    "msg.code",
+    "msg.code > 2",
+    "msg.code == scope.code",
+    "msg.code >= scope.code && msg.level < scope.limit",
+    "msg.level > 2.0",
+    "msg.level > 2",
+    "msg.name == scope.name",
+    "msg.name != 'motor'",
+    "msg.pose.x * 2.0 > 2.5",
+    "msg.pose.frame == 'map'",
+    'msg["pose"]["y"] < 0',
+    "msg.tags[0]",
+    "msg.tags[5]",
+    "msg.items[1].id == 2",
+    "msg.missing",
+    "msg.missing.deeper",
+    "msg.none == null",
+    "msg.code.field",
+    "msg['code'][0]",
+    "topic == '/rosout' && ts > 1.0",
+    "scope.missing == 1",
+    # Logical operators and errors
+    "msg.ok || msg.missing",
+    "msg.missing || msg.ok",
+    "msg.missing && false",
+    "false && msg.missing",
+    "msg.missing || true",
+    "msg.missing && msg.ok",
+    "1 && true",
+    "true && 1",
+    "!msg.ok",
+    "!msg.code",
+    "msg.ok ? msg.name : 'none'",
+    "msg.code ? 1 : 2",
+    "msg.missing ? 1 : 2",
+    "(msg.code > 1) == true",
+    # in, has and sizes
+    "'a' in msg.tags",
+    "'c' in msg.tags",
+    "3 in msg.tags",
+    "'code' in msg",
+    "'x' in msg.pose",
+    "msg.code in [1, 2, 3]",
+    "has(msg.code)",
+    "has(msg.missing)",
+    "has(msg.pose.x)",
+    "has(msg.missing.x)",
+    "has(scope.code)",
+    "size(msg)",
+    "size(msg.tags) > 1",
+    "msg.name.size()",
+    "size(msg.missing)",
+    # String functions and conversions
+    "msg.name.startsWith('motor')",
+    "msg.name.endsWith('left')",
+    "msg.name.contains('or_l')",
+    "msg.name.matches('^mo.*t$')",
+    "msg.code.startsWith('3')",
+    "msg.missing.startsWith('3')",
+    "msg.name.startsWith(msg.missing)",
+    "int(msg.code) == 3",
+    "int(msg.name)",
+    "double(msg.code) > 2.5",
+    "string(msg.code) == '3'",
+    "string(msg.pose.x)",
+    "uint(msg.code)",
+    "int(msg.level)",
+    "bool('true')",
+    "dyn(msg.code) == 3",
+    "duration('1s') < duration('2s')",
+    "timestamp('2024-01-01T00:00:00Z').getFullYear()",
+    # Literals of lists and maps
+    "[msg.code, msg.name]",
+    "[msg.missing, 1]",
+    "{'a': msg.code}",
+    "{'a': 1, 'a': 2}",
+    "{msg.pose: 1}",
+    "[]",
+    "{}",
+    "{'a': 1}.a",
+]
+
+
+class TestCompiler(unittest.TestCase):
+    @staticmethod
+    def evaluate(program, activation):
+        try:
+            return repr(program.evaluate(activation))
+        except celpy.CELEvalError:
+            return "CELEvalError"
+        except Exception as e:
+            return type(e).__name__
+
+    @staticmethod
+    def activations():
+        for msg in MESSAGES:
+            for scope in SCOPES:
+                for convert in (json_to_cel, lazy_json_to_cel):
+                    yield ChainMap(
+                        {"scope": json_to_cel(scope)},
+                        {
+                            "msg": convert(msg),
+                            "topic": StringType("/rosout"),
+                            "ts": DoubleType(1.5),
+                        },
+                    )
+
+    def test_same_results_as_interpreter(self):
+        for expression in EXPRESSIONS:
+            ast = ENV.compile(expression)
+            compiled = compile_program(ENV, ast)
+            interpreted = ENV.program(ast)
+            with self.subTest(expression=expression):
+                self.assertIsInstance(compiled, ClosureRunner)
+                for activation in self.activations():
+                    self.assertEqual(
+                        self.evaluate(compiled, activation),
+                        self.evaluate(interpreted, activation),
+                        activation,
+                    )
+
+    def test_specialized_same_results(self):
+        for expression in EXPRESSIONS:
+            ast = ENV.compile(expression)
+            compiled = compile_program(ENV, ast)
+            interpreted = ENV.program(ast)
+            with self.subTest(expression=expression):
+                for activation in self.activations():
+                    specialized = compiled.specialize(activation.maps[0])
+                    # Without the scope binding, which is folded in
+                    self.assertEqual(
+                        self.evaluate(specialized, activation.parents),
+                        self.evaluate(interpreted, activation),
+                        activation,
+                    )
+
+    def test_specialize(self):
+        def specialize(expression, **scope):
+            program = compile_program(ENV, ENV.compile(expression))
+            return program.specialize({"scope": json_to_cel(scope)})
+
+        program = compile_program(ENV, ENV.compile("msg.code == 1"))
+        self.assertIs(program.specialize({"scope": json_to_cel({})}), program)
+        self.assertFalse(program.is_constant)
+        self.assertTrue(compile_program(ENV, ENV.compile("1 < 2")).is_constant)
+
+        for expression, scope, constant in [
+            ("msg.code == scope.code", {"code": 1}, False),
+            ("scope.code == 1", {"code": 1}, True),
+            ("scope.code == 1 && msg.code == 1", {"code": 1}, False),
+            ("scope.code == 1 && msg.code == 1", {"code": 2}, True),
+            ("msg.missing || scope.code > 0", {"code": 1}, True),
+            ("msg.missing || scope.code > 0", {"code": 0}, False),
+            ("scope.ok ? msg.code : 1", {"ok": False}, True),
+            ("has(scope.code) && msg.ok", {}, True),
+            ("scope.code == 1 && scope.ok", {"code": 1, "ok": False}, True),
+            ("scope.code == 1 && scope.ok", {"code": 1, "ok": 2}, True),
+            ("scope.missing", {}, True),
+            ("msg.code in [scope.code, 2]", {"code": 1}, False),
+        ]:
+            with self.subTest(expression=expression, scope=scope):
+                self.assertEqual(specialize(expression, **scope).is_constant, constant)
+
+        # Shared by the scopes with the same values of the fields read
+        program = compile_program(ENV, ENV.compile("msg.code == scope.code"))
+        first = program.specialize({"scope": json_to_cel({"code": 1, "name": "a"})})
+        self.assertIs(program.specialize({"scope": json_to_cel({"code": 1})}), first)
+        self.assertIsNot(program.specialize({"scope": json_to_cel({"code": 2})}), first)
+        self.assertIsNot(program.specialize({"scope": json_to_cel({})}), first)
+        program = compile_program(ENV, ENV.compile("size(scope) > scope.code"))
+        first = program.specialize({"scope": json_to_cel({"code": 1, "name": "a"})})
+        self.assertIsNot(program.specialize({"scope": json_to_cel({"code": 1})}), first)
+
+        # The always true conjunct still checks the other operand at runtime
+        program = specialize("scope.code == 1 && msg.code", code=1)
+        self.assertEqual(
+            self.evaluate(program, {"msg": json_to_cel({"code": 5})}), "IntType(5)"
+        )
+        program = specialize("scope.code == 1 && scope.ok", code=1, ok=2)
+        self.assertEqual(self.evaluate(program, {}), "IntType(2)")
+
+    def test_field_equalities(self):
+        for expression, equalities in [
+            ("msg.robot_id == scope.robot_id", [(("robot_id",), ("robot_id",))]),
+            ("scope['robot'].id == msg.a.b", [(("a", "b"), ("robot", "id"))]),
+            (
+                "(msg.a == scope.a) && (msg.c > 1 && scope.b == msg['b'])",
+                [(("a",), ("a",)), (("b",), ("b",))],
+            ),
+            ("(msg.a == scope.a && msg.c) || msg.d", []),
+            ("!(msg.a == scope.a)", []),
+            ("msg.a == scope.a == true", []),
+            ("msg.a != scope.a", []),
+            ("msg[1] == scope.a", []),
+            ("msg == scope", []),
+            ("msg.a == msg.b", []),
+            ("msg.a.exists(x, x == scope.a)", []),
+        ]:
+            with self.subTest(expression=expression):
+                self.assertEqual(
+                    field_equalities(expression, "msg", "scope"), tuple(equalities)
+                )
+
+    def test_unbound_declared_variable(self):
+        program = compile_program(ENV, ENV.compile("has(scope.code)"))
+        self.assertEqual(self.evaluate(program, {}), "BoolType(False)")
+
+    def test_falls_back_to_interpreter(self):
+        for expression in [
+            "msg.tags.all(t, t != 'c')",
+            "msg.tags.exists(t, t == 'a')",
+            "msg.items.map(i, i.id)",
+            "undeclared == 1",
+            "type(msg.code) == int",
+            "unknown_function(msg)",
+            "msg.unknown_method()",
+            ".msg.code",
+        ]:
+            with self.subTest(expression=expression):
+                program = compile_program(ENV, ENV.compile(expression))
+                self.assertNotIsInstance(program, ClosureRunner)
+                self.assertIsInstance(program, celpy.InterpretedRunner)
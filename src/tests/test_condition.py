@@ -152,3 +152,18 @@ class TestCondition(unittest.TestCase):
 
         _, err = Condition.compile_and_validate("""msg[0 """)
         self.assertIsNotNone(err)
+
+    def test_evaluate_quietly(self):
+        condition, _ = Condition.compile_and_validate(""" msg.message.code == 200 """)
+        self.assertTrue(condition.evaluate_quietly(TestActivation))
+
+        # Only exactly boolean true is true
+        condition, _ = Condition.compile_and_validate(""" msg.message.code """)
+        self.assertFalse(condition.evaluate_quietly(TestActivation))
+        self.assertEqual(condition.error_count, 0)
+
+    def test_error_count(self):
+        condition, _ = Condition.compile_and_validate(""" msg.missing.code == 200 """)
+        self.assertFalse(condition.evaluate(TestActivation))
+        self.assertFalse(condition.evaluate_quietly(TestActivation))
+        self.assertEqual(condition.error_count, 2)
@@ -11,8 +11,12 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import logging
 import unittest
 from functools import partial
+from unittest import mock
+
+import celpy
 
 from rule_engine.engine import Engine
 from rule_engine.rule import validate_rules_spec
@@ -194,3 +198,207 @@ class TestEngine(unittest.TestCase):
             result_buffer[0],
             {"int_arg": 1, "str_arg": "77"},
         )
+
+    def test_engine_topics(self):
+        def rule(code, topics):
+            return {
+                "conditions": [f"msg.code == {code}"],
+                "actions": [
+                    {
+                        "name": "serialize",
+                        "kwargs": {"str_arg": "{topic}", "int_arg": code},
+                    }
+                ],
+                "scopes": [],
+                "topics": topics,
+            }
+
+        spec = {"rules": [rule(1, ["a", "b"]), rule(2, ["b"]), rule(3, [])]}
+        result_buffer = [{}]
+        engine = self.build_serialize_engine_from_spec(spec, result_buffer)
+        self.assertIsNone(engine.required_topics)
+        self.assertEqual(engine.rule_indices_for_topic("a"), [0, 2])
+        self.assertEqual(engine.rule_indices_for_topic("b"), [0, 1, 2])
+        self.assertEqual(engine.rule_indices_for_topic("c"), [2])
+
+        engine.example_consume_next({"code": 2}, "a", 0.0)
+        self.assertDictEqual(result_buffer[0], {})
+        self.assertFalse(engine.evaluate_rule_condition(1))
+        engine.example_consume_next({"code": 2}, "b", 0.0)
+        self.assertDictEqual(result_buffer[0], {"str_arg": "b", "int_arg": 2})
+        engine.example_consume_next({"code": 3}, "c", 0.0)
+        self.assertDictEqual(result_buffer[0], {"str_arg": "c", "int_arg": 3})
+
+        spec = {"rules": [rule(1, ["a", "b"]), rule(2, ["b"])]}
+        engine = self.build_serialize_engine_from_spec(spec, result_buffer)
+        self.assertEqual(engine.required_topics, {"a", "b"})
+        engine.example_consume_next({"code": 1}, "c", 0.0)
+        self.assertEqual(engine.cur_rule_indices, [])
+        # The rules can still be run directly for the unsubscribed topic
+        self.assertEqual(engine.rule_activation(1)["topic"], "c")
+        engine.run_rule_actions(1)
+        self.assertDictEqual(result_buffer[0], {"str_arg": "c", "int_arg": 2})
+
+    def test_engine_scope_converted_once(self):
+        spec = {
+            "rules": [
+                {
+                    "conditions": ["msg.code == scope.code"],
+                    "actions": [
+                        {
+                            "name": "serialize",
+                            "kwargs": {"str_arg": "{scope.name}", "int_arg": 1},
+                        }
+                    ],
+                    "scopes": [{"code": i, "name": f"rule {i}"} for i in range(5)],
+                    "topics": [],
+                }
+            ]
+        }
+        result_buffer = [{}]
+        engine = self.build_serialize_engine_from_spec(spec, result_buffer)
+
+        json_to_cel = celpy.adapter.json_to_cel
+        with mock.patch.object(
+            celpy.adapter, "json_to_cel", side_effect=json_to_cel
+        ) as converted:
+            for code in range(3):
+                engine.example_consume_next({"code": code}, "test_topic", 0.0)
+        # Only the message fields read are converted
+        converted_values = [c.args[0] for c in converted.call_args_list]
+        self.assertIn(2, converted_values)
+        self.assertFalse(
+            any(isinstance(v, dict) and "name" in v for v in converted_values)
+        )
+        self.assertDictEqual(result_buffer[0], {"str_arg": "rule 2", "int_arg": 1})
+        self.assertIs(engine.rule_activation(2), engine.rule_activation(2))
+
+    def test_engine_fast_evaluation(self):
+        spec = {
+            "rules": [
+                {
+                    "conditions": ["msg.code > 20"],
+                    "actions": [
+                        {
+                            "name": "serialize",
+                            "kwargs": {"str_arg": "{msg.code}", "int_arg": 1},
+                        }
+                    ],
+                    "topics": [],
+                }
+            ]
+        }
+        result_buffer = [{}]
+        engine = self.build_serialize_engine_from_spec(spec, result_buffer)
+
+        root = logging.getLogger()
+        level = root.level
+        with mock.patch.object(root, "setLevel", wraps=root.setLevel) as set_level:
+            with engine.fast_evaluation():
+                self.assertEqual(root.level, logging.WARN)
+                for code in (10, 30, "x"):
+                    engine.example_consume_next({"code": code}, "test_topic", 0.0)
+                engine.example_consume_next({}, "test_topic", 0.0)
+        # Once in, once out
+        self.assertEqual(set_level.call_count, 2)
+        self.assertEqual(root.level, level)
+        self.assertDictEqual(result_buffer[0], {"str_arg": "30", "int_arg": 1})
+        self.assertDictEqual(engine.condition_errors, {"msg.code > 20": 2})
+
+    def test_engine_unsatisfiable_rules(self):
+        spec = {
+            "rules": [
+                {
+                    "conditions": ["scope.on && msg.code == scope.code"],
+                    "actions": [
+                        {
+                            "name": "serialize",
+                            "kwargs": {"str_arg": "{scope.name}", "int_arg": 1},
+                        }
+                    ],
+                    "scopes": [
+                        {"code": 1, "on": True, "name": "a"},
+                        {"code": 2, "on": False, "name": "b"},
+                        {"code": 2, "on": True, "name": "c"},
+                    ],
+                    "topics": [],
+                },
+                {
+                    "conditions": ["scope.missing == 1"],
+                    "actions": [
+                        {
+                            "name": "serialize",
+                            "kwargs": {"str_arg": "missing", "int_arg": 2},
+                        }
+                    ],
+                    "topics": [],
+                },
+            ]
+        }
+        result_buffer = [{}]
+        engine = self.build_serialize_engine_from_spec(spec, result_buffer)
+        self.assertEqual(engine.rule_indices_for_topic("test_topic"), [0, 2])
+        self.assertIsNone(engine.required_topics)
+
+        engine.example_consume_next({"code": 2}, "test_topic", 0.0)
+        self.assertDictEqual(result_buffer[0], {"str_arg": "c", "int_arg": 1})
+        self.assertFalse(engine.evaluate_rule_condition(1))
+        self.assertFalse(engine.evaluate_rule_condition(3))
+
+        # Unsatisfiable rules are not subscribed to their topics either
+        spec["rules"][0]["topics"] = ["a"]
+        spec["rules"][1]["topics"] = ["b"]
+        engine = self.build_serialize_engine_from_spec(spec, result_buffer)
+        self.assertEqual(engine.required_topics, {"a"})
+        self.assertEqual(engine.rule_indices_for_topic("a"), [0, 2])
+        self.assertEqual(engine.rule_indices_for_topic("b"), [])
+
+    def test_engine_join(self):
+        spec = {
+            "rules": [
+                {
+                    "conditions": ["msg.level > 2", "msg.robot.id == scope['id']"],
+                    "actions": [
+                        {
+                            "name": "serialize",
+                            "kwargs": {"str_arg": "{scope.id}", "int_arg": 0},
+                        }
+                    ],
+                    "scopes": [{"id": i} for i in range(4)] + [{"id": [1]}, {}],
+                    "topics": [],
+                },
+                {
+                    "conditions": ["msg.level > 4"],
+                    "actions": [
+                        {
+                            "name": "serialize",
+                            "kwargs": {"str_arg": "plain", "int_arg": 1},
+                        }
+                    ],
+                    "topics": [],
+                },
+            ]
+        }
+        result_buffer = [{}]
+        engine = self.build_serialize_engine_from_spec(spec, result_buffer)
+        # The scopes with a list or without the key are not joined
+        self.assertEqual(engine.rule_indices_for_topic("t"), list(range(7)))
+
+        for msg, indices in [
+            ({"level": 3, "robot": {"id": 2}}, [2, 4, 5, 6]),
+            ({"level": 3, "robot": {"id": 2.0}}, [2, 4, 5, 6]),
+            ({"level": 3, "robot": {"id": 7}}, [4, 5, 6]),
+            ({"level": 3, "robot": {"id": [1]}}, [4, 5, 6]),
+            ({"level": 3, "robot": 2}, [4, 5, 6]),
+            ({"level": 3}, [4, 5, 6]),
+        ]:
+            with self.subTest(msg=msg):
+                engine.load_message(msg, "t", 0.0)
+                self.assertEqual(engine.cur_rule_indices, indices)
+                # The rules left out do not match
+                for rule_idx in range(7):
+                    if rule_idx not in indices:
+                        self.assertFalse(engine.evaluate_rule_condition(rule_idx))
+
+        engine.example_consume_next({"level": 3, "robot": {"id": 1}}, "t", 0.0)
+        self.assertDictEqual(result_buffer[0], {"str_arg": "1", "int_arg": 0})
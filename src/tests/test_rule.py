@@ -13,6 +13,7 @@
 # limitations under the License.
 import unittest
 
+from rule_engine.compiler import cel_program
 from rule_engine.rule import validate_rules_spec
 from rule_engine.utils import ErrorSectionEnum
 
@@ -191,3 +192,70 @@ class TestRule(unittest.TestCase):
                 ],
             },
         )
+
+    def test_programs_shared(self):
+        rule_spec = {
+            "rules": [
+                {
+                    "conditions": [f"msg['code'] == {i % 2}", "msg['ok']"],
+                    "actions": [
+                        {
+                            "name": "serialize",
+                            "kwargs": {"str_arg": "{msg['item']}", "int_arg": i},
+                        }
+                    ],
+                }
+                for i in range(10)
+            ]
+        }
+        cel_program.cache_clear()
+        rules, result = validate_rules_spec(rule_spec, {"serialize": _serialize_impl})
+        self.assertTrue(result.success)
+
+        # 4 distinct expressions out of 30
+        info = cel_program.cache_info()
+        self.assertEqual((info.misses, info.hits), (4, 26))
+        self.assertIs(rules[0].conditions[0].program, rules[2].conditions[0].program)
+        self.assertIsNot(rules[0].conditions[0], rules[2].conditions[0])
+
+        # Errors are not cached
+        _, result = validate_rules_spec(
+            {
+                "rules": [
+                    {
+                        "conditions": ["msg["],
+                        "actions": rule_spec["rules"][0]["actions"],
+                    }
+                ]
+            },
+            {"serialize": _serialize_impl},
+        )
+        self.assertFalse(result.success)
+        self.assertEqual(cel_program.cache_info().currsize, 4)
+
+    def test_scopes_specialized(self):
+        rule_spec = {
+            "rules": [
+                {
+                    "conditions": ["msg.code == scope.code", "scope.on", "msg.ok"],
+                    "actions": [
+                        {
+                            "name": "serialize",
+                            "kwargs": {"str_arg": "{scope.code}", "int_arg": 1},
+                        }
+                    ],
+                    "scopes": [{"code": 1, "on": True}, {"code": 2, "on": False}],
+                }
+            ]
+        }
+        rules, result = validate_rules_spec(rule_spec, {"serialize": _serialize_impl})
+        self.assertTrue(result.success)
+
+        self.assertTrue(rules[0].satisfiable)
+        self.assertEqual(
+            [c.raw for c in rules[0].conditions], ["msg.code == scope.code", "msg.ok"]
+        )
+        self.assertIsNot(rules[0].conditions[0].program, rules[1].conditions[0].program)
+        # Not read from the scope
+        self.assertIs(rules[0].conditions[1], rules[1].conditions[-1])
+        self.assertFalse(rules[1].satisfiable)